@@ -1,5 +1,5 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, status
-from fastapi.responses import Response
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, Query, status
+from fastapi.responses import Response, FileResponse, StreamingResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
@@ -8,7 +8,7 @@ import os
 import logging
 from pathlib import Path
 from pydantic import BaseModel, Field, ConfigDict, EmailStr
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Tuple
 import uuid
 from datetime import datetime, timezone, timedelta
 import bcrypt
@@ -23,6 +23,22 @@ import aiohttp
 import json as json_lib
 import time
 import requests
+import asyncio
+import hashlib
+import heapq
+import math
+import re
+import shutil
+import contextlib
+import contextvars
+import secrets
+import signal
+import socket
+import csv
+import io
+import weakref
+from abc import ABC, abstractmethod
+from collections import OrderedDict, deque
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
@@ -39,6 +55,11 @@ JWT_EXPIRATION_HOURS = 24
 
 # Security
 security = HTTPBearer()
+optional_security = HTTPBearer(auto_error=False)
+
+# Maximum number of concurrent LLM provider calls from batch/background work
+LLM_MAX_CONCURRENCY = int(os.environ.get('LLM_MAX_CONCURRENCY', '4'))
+llm_semaphore = asyncio.Semaphore(LLM_MAX_CONCURRENCY)
 
 app = FastAPI()
 api_router = APIRouter(prefix="/api")
@@ -215,7 +236,11 @@ class UploadedFile(BaseModel):
     filename: str
     file_type: str
     file_size: int
-    content: str  # Base64 encoded or text content
+    content: Optional[str] = None  # Legacy inline content (base64 or text)
+    storage: str = "inline"  # "inline" (legacy) or "blob"
+    content_hash: Optional[str] = None  # sha256 of the bytes, key into the blob store
+    sniffed_type: Optional[str] = None  # Type detected from the leading bytes
+    is_text: bool = False
     analysis: Optional[str] = None
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
@@ -231,8 +256,12 @@ class AILearning(BaseModel):
     applied_count: int = 0
     success_rate: Optional[float] = None
     related_business_type: Optional[str] = None
+    status: str = "active"  # "active" or "archived" (decayed / over the per-user cap)
+    corroboration_count: int = 1  # Number of merged near-duplicate learnings
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
     last_applied: Optional[datetime] = None
+    last_corroborated: Optional[datetime] = None
+    decayed_at: Optional[datetime] = None
 
 # ============ AUTH HELPERS ============
 
@@ -251,9 +280,48 @@ def create_access_token(user_id: str) -> str:
     return jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALGORITHM)
 
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> str:
-    token = credentials.credentials
+    return decode_user_token(credentials.credentials)
+
+# EventSource cannot set headers, so event streams accept a short-lived single-use token
+# in the query string instead. The JWT itself never appears in a URL or an access log.
+STREAM_TOKEN_TTL_SECONDS = 60
+
+def hash_stream_token(token: str) -> str:
+    return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+async def issue_stream_token(user_id: str, execution_id: str) -> str:
+    """Mint a single-use token that opens the event stream of one execution"""
+    token = secrets.token_urlsafe(32)
+    await db.stream_tokens.insert_one({
+        "token_hash": hash_stream_token(token),
+        "user_id": user_id,
+        "execution_id": execution_id,
+        # A real date rather than an ISO string so the TTL index can expire it
+        "expires_at": datetime.now(timezone.utc) + timedelta(seconds=STREAM_TOKEN_TTL_SECONDS)
+    })
+    return token
+
+async def get_stream_user(
+    execution_id: str,
+    stream_token: Optional[str] = None,
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(optional_security)
+) -> str:
+    """Auth for EventSource streams: the bearer header, or a `stream_token` issued for this execution"""
+    if credentials:
+        return decode_user_token(credentials.credentials)
+    if not stream_token:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Not authenticated")
+    grant = await db.stream_tokens.find_one_and_delete({
+        "token_hash": hash_stream_token(stream_token),
+        "execution_id": execution_id,
+        "expires_at": {"$gt": datetime.now(timezone.utc)}
+    })
+    if not grant:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid or expired stream token")
+    return grant['user_id']
+
+def decode_user_token(token: str) -> str:
     try:
-        logging.info(f"[AUTH] Validating token: {token[:20]}...")
         payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
         user_id = payload.get('user_id')
         if not user_id:
@@ -491,11 +559,9 @@ async def chat_with_copilot(
     # Get user's business profile for context
     profile = await db.business_profiles.find_one({"user_id": user_id}, {"_id": 0})
     
-    # Get AI learnings for this user
-    learnings = list(await db.ai_learnings.find(
-        {"user_id": user_id},
-        {"_id": 0}
-    ).sort("confidence_score", -1).limit(10).to_list(10))
+    # Get the AI learnings relevant to this message
+    learnings_index = await get_learnings_index(user_id)
+    learnings = learnings_index.search(message, k=LEARNINGS_PER_MESSAGE) or learnings_index.top(LEARNINGS_PER_MESSAGE)
     
     # Check if this is a task-specific chat
     is_task_chat = task_id is not None
@@ -552,7 +618,7 @@ async def chat_with_copilot(
     learned_context = ""
     if learnings:
         learned_context = "\n\nAI LEARNED INSIGHTS (Apply these to personalize your response):\n"
-        for learning in learnings[:5]:
+        for learning in learnings:
             learned_context += f"- [{learning['category']}] {learning['insight'][:150]}...\n"
         learned_context += "\nUse these insights to tailor your advice to this specific user's preferences and situation."
     
@@ -1416,43 +1482,515 @@ async def generate_tasks_from_chat(user_id: str = Depends(get_current_user)):
         logging.error(f"Task generation from chat error: {str(e)}")
         return {"tasks": [], "message": "Failed to generate tasks from chat"}
 
+# ============ BLOB STORE ============
+
+# Uploaded files and other large payloads live on disk, content-addressed by sha256.
+# Mongo documents only keep the hash as a reference.
+BLOB_STORE_DIR = Path(os.environ.get('BLOB_STORE_DIR', str(ROOT_DIR / 'blob_store')))
+BLOB_CHUNK_SIZE = 1024 * 1024  # 1MB
+BLOB_SNIFF_BYTES = 8192
+MAX_UPLOAD_SIZE = 10 * 1024 * 1024  # 10MB
+
+# Leading-byte signatures used to detect the real type of an upload
+BLOB_MAGIC_SIGNATURES = [
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'GIF87a', 'image/gif'),
+    (b'GIF89a', 'image/gif'),
+    (b'%PDF-', 'application/pdf'),
+    (b'PK\x03\x04', 'application/zip'),
+    (b'ID3', 'audio/mpeg'),
+    (b'OggS', 'audio/ogg'),
+    (b'\x1aE\xdf\xa3', 'video/webm'),
+]
+
+def blob_path(content_hash: str) -> Path:
+    return BLOB_STORE_DIR / content_hash[:2] / content_hash
+
+# One lock per content hash, held while a new reference to a blob is recorded and while
+# an unreferenced blob is deleted, so a delete can never race a concurrent upload of the
+# same bytes. Entries disappear once no coroutine holds or waits on them.
+_blob_locks: "weakref.WeakValueDictionary[str, asyncio.Lock]" = weakref.WeakValueDictionary()
+
+def blob_lock(content_hash: str) -> asyncio.Lock:
+    lock = _blob_locks.get(content_hash)
+    if lock is None:
+        lock = _blob_locks[content_hash] = asyncio.Lock()
+    return lock
+
+def sniff_blob_metadata(head: bytes, declared_type: Optional[str], filename: Optional[str]) -> Dict[str, Any]:
+    """Detect the content type of a blob from its first bytes"""
+    sniffed_type = None
+    for signature, mime in BLOB_MAGIC_SIGNATURES:
+        if head.startswith(signature):
+            sniffed_type = mime
+            break
+    
+    if not sniffed_type and head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        sniffed_type = 'image/webp'
+    elif not sniffed_type and head[:4] == b'RIFF' and head[8:12] == b'WAVE':
+        sniffed_type = 'audio/wav'
+    elif not sniffed_type and head[4:8] == b'ftyp':
+        sniffed_type = 'video/mp4'
+    
+    # Office documents are zip containers - trust the extension for those
+    extension = (filename or '').rsplit('.', 1)[-1].lower() if filename and '.' in filename else ''
+    if sniffed_type == 'application/zip' and extension == 'xlsx':
+        sniffed_type = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+    
+    is_text = False
+    if not sniffed_type and b'\x00' not in head:
+        try:
+            head.decode('utf-8')
+            is_text = True
+        except UnicodeDecodeError as e:
+            # A multi-byte character may be cut off at the end of the sniffed window
+            is_text = e.start >= len(head) - 3
+        if is_text:
+            if extension == 'csv' or (declared_type and 'csv' in declared_type):
+                sniffed_type = 'text/csv'
+            elif extension in ('json', 'ndjson', 'jsonl') or (declared_type and 'json' in declared_type):
+                sniffed_type = 'application/json'
+            else:
+                sniffed_type = 'text/plain'
+    
+    return {
+        "sniffed_type": sniffed_type or declared_type or "application/octet-stream",
+        "is_text": is_text
+    }
+
+@contextlib.asynccontextmanager
+async def store_upload_in_blob_store(file: UploadFile, max_size: int = MAX_UPLOAD_SIZE):
+    """Stream an upload into the blob store in chunks, hashing as it goes.
+    
+    Aborts as soon as the running size passes max_size, so oversized uploads
+    are never fully read. Yields the content hash, size and the leading bytes
+    while holding the blob's lock, so the caller records its reference before
+    a concurrent delete of the same content can remove the bytes.
+    """
+    # Reject early when the client told us the size up front
+    declared_size = getattr(file, 'size', None)
+    if declared_size is not None and declared_size > max_size:
+        raise HTTPException(status_code=400, detail=f"File size exceeds {max_size // (1024 * 1024)}MB limit")
+    
+    tmp_dir = BLOB_STORE_DIR / 'tmp'
+    tmp_dir.mkdir(parents=True, exist_ok=True)
+    tmp_path = tmp_dir / f"{uuid.uuid4()}.part"
+    
+    hasher = hashlib.sha256()
+    file_size = 0
+    head = b""
+    
+    try:
+        with open(tmp_path, 'wb') as out:
+            while True:
+                chunk = await file.read(BLOB_CHUNK_SIZE)
+                if not chunk:
+                    break
+                
+                file_size += len(chunk)
+                if file_size > max_size:
+                    raise HTTPException(status_code=400, detail=f"File size exceeds {max_size // (1024 * 1024)}MB limit")
+                
+                hasher.update(chunk)
+                if len(head) < BLOB_SNIFF_BYTES:
+                    head += chunk[:BLOB_SNIFF_BYTES - len(head)]
+                await asyncio.to_thread(out.write, chunk)
+        
+        content_hash = hasher.hexdigest()
+        async with blob_lock(content_hash):
+            final_path = blob_path(content_hash)
+            if not final_path.exists():
+                final_path.parent.mkdir(parents=True, exist_ok=True)
+                os.replace(tmp_path, final_path)
+            yield {"content_hash": content_hash, "file_size": file_size, "head": head}
+    finally:
+        if tmp_path.exists():
+            tmp_path.unlink()
+
+async def read_blob(content_hash: str, limit: Optional[int] = None) -> bytes:
+    """Read a blob (or its first `limit` bytes) from the store"""
+    def _read():
+        with open(blob_path(content_hash), 'rb') as f:
+            return f.read(limit) if limit is not None else f.read()
+    return await asyncio.to_thread(_read)
+
+async def write_blob(data: bytes) -> str:
+    """Store raw bytes in the blob store and return their content hash"""
+    content_hash = hashlib.sha256(data).hexdigest()
+    final_path = blob_path(content_hash)
+    if final_path.exists():
+        return content_hash
+
+    def _write():
+        tmp_dir = BLOB_STORE_DIR / 'tmp'
+        tmp_dir.mkdir(parents=True, exist_ok=True)
+        tmp_path = tmp_dir / f"{uuid.uuid4()}.part"
+        with open(tmp_path, 'wb') as out:
+            out.write(data)
+        final_path.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(tmp_path, final_path)
+    await asyncio.to_thread(_write)
+    return content_hash
+
+async def read_uploaded_file_text(file_doc: Dict[str, Any], limit: Optional[int] = None) -> str:
+    """Return the text content of an uploaded file, whether stored inline or in the blob store"""
+    if file_doc.get('content_hash') and file_doc.get('storage') == 'blob':
+        # Read a few extra bytes so a multi-byte character at the boundary is not lost
+        data = await read_blob(file_doc['content_hash'], limit * 4 if limit else None)
+        text = data.decode('utf-8', errors='replace')
+    else:
+        text = file_doc.get('content') or ''
+    return text[:limit] if limit else text
+
+async def release_blob_if_unreferenced(content_hash: Optional[str]):
+    """Delete a blob from disk once no document references it anymore"""
+    if not content_hash:
+        return
+    async with blob_lock(content_hash):
+        if await db.uploaded_files.count_documents({"content_hash": content_hash}, limit=1):
+            return
+        if await db.workflow_executions.count_documents({"blob_refs": content_hash}, limit=1):
+            return
+        if await db.workflow_artifacts.count_documents({"hash": content_hash}, limit=1):
+            return
+        path = blob_path(content_hash)
+        if path.exists():
+            path.unlink()
+            logging.info(f"[BLOB_STORE] Removed unreferenced blob {content_hash}")
+
+# ============ DATA PROFILING ============
+
+# Tabular uploads are profiled locally (pandas, in a process pool) over the whole file,
+# and only the compact profile is sent to the LLM instead of a raw text prefix.
+PROFILE_CHUNK_ROWS = 50000
+PROFILE_TOP_VALUES = 5
+PROFILE_MAX_TRACKED_VALUES = 10000  # Per column cap on distinct values counted for top values
+PROFILE_MAX_SERIES_COLUMNS = 5
+PROFILE_POOL_WORKERS = int(os.environ.get('PROFILE_POOL_WORKERS', max(1, (os.cpu_count() or 2) // 2)))
+
+_profile_pool = None
+
+def get_profile_pool():
+    global _profile_pool
+    if _profile_pool is None:
+        from concurrent.futures import ProcessPoolExecutor
+        _profile_pool = ProcessPoolExecutor(max_workers=PROFILE_POOL_WORKERS)
+    return _profile_pool
+
+def tabular_format(file_doc: Dict[str, Any]) -> Optional[str]:
+    """Return 'csv', 'json' or 'xlsx' when the upload can be profiled as a table"""
+    filename = (file_doc.get('filename') or '').lower()
+    types = f"{file_doc.get('sniffed_type') or ''} {file_doc.get('file_type') or ''}".lower()
+    if filename.endswith('.xlsx') or 'spreadsheetml' in types:
+        return 'xlsx'
+    if filename.endswith('.csv') or 'csv' in types:
+        return 'csv'
+    if filename.endswith(('.json', '.ndjson', '.jsonl')) or 'json' in types:
+        return 'json'
+    return None
+
+def _iter_tabular_chunks(path: str, fmt: str, chunk_rows: int):
+    """Yield DataFrame chunks of a tabular file without loading CSV/NDJSON files whole"""
+    import pandas as pd
+    
+    if fmt == 'csv':
+        yield from pd.read_csv(path, chunksize=chunk_rows, low_memory=False,
+                               on_bad_lines='skip', encoding_errors='replace')
+    elif fmt == 'xlsx':
+        # openpyxl has no chunked reader - the upload size cap keeps this bounded
+        frame = pd.read_excel(path, sheet_name=0)
+        for start in range(0, len(frame), chunk_rows):
+            yield frame.iloc[start:start + chunk_rows]
+    else:
+        with open(path, 'rb') as f:
+            first = f.read(1024).lstrip()[:1]
+        if first not in (b'[', b'{'):
+            yield from pd.read_json(path, lines=True, chunksize=chunk_rows)
+            return
+        with open(path, 'r', encoding='utf-8', errors='replace') as f:
+            try:
+                data = json_lib.load(f)
+            except ValueError:
+                # Line-delimited JSON that starts with an object
+                f.seek(0)
+                yield from pd.read_json(f, lines=True, chunksize=chunk_rows)
+                return
+        if isinstance(data, dict):
+            # Use the largest list of records inside the document, if any
+            lists = [v for v in data.values() if isinstance(v, list)]
+            data = max(lists, key=len) if lists else [data]
+        for start in range(0, len(data), chunk_rows):
+            yield pd.json_normalize(data[start:start + chunk_rows])
+
+def _round_stat(value: Any) -> Any:
+    if value is None:
+        return None
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return value
+    if value != value or value in (float('inf'), float('-inf')):
+        return None
+    return float(f"{value:.6g}")
+
+def profile_tabular_file(path: str, fmt: str, chunk_rows: int = PROFILE_CHUNK_ROWS) -> Dict[str, Any]:
+    """Compute schema, per-column stats, time-series aggregates and anomalies over a whole file.
+    
+    Runs in a worker process. CSV and NDJSON are streamed in chunks; statistics are
+    accumulated incrementally and outliers are counted in a second pass.
+    """
+    import pandas as pd
+    import numpy as np
+    from collections import Counter
+    
+    column_kinds: Dict[str, str] = {}
+    stats: Dict[str, Dict[str, Any]] = {}
+    top_values: Dict[str, Counter] = {}
+    series: Dict[str, Dict[str, Any]] = {}  # day -> {"rows": n, column: sum}
+    time_column = None
+    total_rows = 0
+    
+    def classify(column: 'pd.Series') -> str:
+        non_null = column.dropna()
+        if pd.api.types.is_bool_dtype(column):
+            return 'categorical'
+        if pd.api.types.is_numeric_dtype(column):
+            return 'numeric'
+        if pd.api.types.is_datetime64_any_dtype(column):
+            return 'datetime'
+        if non_null.empty:
+            return 'categorical'
+        sample = non_null.astype(str).head(500)
+        if pd.to_numeric(sample, errors='coerce').notna().mean() >= 0.95:
+            return 'numeric'
+        parsed = pd.to_datetime(sample, errors='coerce', format='mixed')
+        if parsed.notna().mean() >= 0.9 and sample.str.len().median() >= 6:
+            return 'datetime'
+        return 'categorical'
+    
+    def coerce(frame: 'pd.DataFrame') -> 'pd.DataFrame':
+        frame = frame.copy()
+        for name, kind in column_kinds.items():
+            if name not in frame:
+                continue
+            if kind == 'numeric':
+                frame[name] = pd.to_numeric(frame[name], errors='coerce')
+            elif kind == 'datetime':
+                frame[name] = pd.to_datetime(frame[name], errors='coerce', format='mixed', utc=True)
+        return frame
+    
+    for chunk in _iter_tabular_chunks(path, fmt, chunk_rows):
+        chunk.columns = [str(c) for c in chunk.columns]
+        for name in chunk.columns:
+            if name not in column_kinds:
+                column_kinds[name] = classify(chunk[name])
+                stats[name] = {"count": 0, "nulls": 0, "sum": 0.0, "sumsq": 0.0, "min": None, "max": None}
+                top_values[name] = Counter()
+        if time_column is None:
+            time_column = next((n for n, k in column_kinds.items() if k == 'datetime'), None)
+        
+        frame = coerce(chunk)
+        total_rows += len(frame)
+        
+        for name, kind in column_kinds.items():
+            if name not in frame:
+                stats[name]["nulls"] += len(frame)
+                continue
+            column = frame[name]
+            non_null = column.dropna()
+            column_stats = stats[name]
+            column_stats["count"] += len(non_null)
+            column_stats["nulls"] += len(column) - len(non_null)
+            if non_null.empty:
+                continue
+            
+            if kind == 'numeric':
+                values = non_null.to_numpy(dtype='float64')
+                column_stats["sum"] += float(values.sum())
+                column_stats["sumsq"] += float(np.square(values).sum())
+                low, high = float(values.min()), float(values.max())
+            elif kind == 'datetime':
+                low, high = non_null.min(), non_null.max()
+            else:
+                counts = top_values[name]
+                for value, count in non_null.astype(str).value_counts().items():
+                    if value in counts or len(counts) < PROFILE_MAX_TRACKED_VALUES:
+                        counts[value] += int(count)
+                continue
+            column_stats["min"] = low if column_stats["min"] is None else min(column_stats["min"], low)
+            column_stats["max"] = high if column_stats["max"] is None else max(column_stats["max"], high)
+        
+        if time_column and time_column in frame:
+            numeric_columns = [n for n, k in column_kinds.items() if k == 'numeric' and n in frame][:PROFILE_MAX_SERIES_COLUMNS]
+            timed = frame.dropna(subset=[time_column])
+            if not timed.empty:
+                days = timed[time_column].dt.strftime('%Y-%m-%d')
+                grouped = timed[numeric_columns].groupby(days).sum() if numeric_columns else None
+                for day, rows in days.value_counts().items():
+                    bucket = series.setdefault(day, {"rows": 0})
+                    bucket["rows"] += int(rows)
+                    if grouped is not None:
+                        for name in numeric_columns:
+                            bucket[name] = bucket.get(name, 0.0) + float(grouped.at[day, name])
+    
+    # Finalize per-column stats
+    column_stats_out = {}
+    for name, kind in column_kinds.items():
+        column_stats = stats[name]
+        entry = {"type": kind, "non_null": column_stats["count"], "nulls": column_stats["nulls"]}
+        if kind == 'numeric' and column_stats["count"]:
+            mean = column_stats["sum"] / column_stats["count"]
+            variance = max(column_stats["sumsq"] / column_stats["count"] - mean * mean, 0.0)
+            column_stats["mean"], column_stats["std"] = mean, variance ** 0.5
+            entry.update({
+                "min": _round_stat(column_stats["min"]),
+                "max": _round_stat(column_stats["max"]),
+                "mean": _round_stat(mean),
+                "std": _round_stat(column_stats["std"]),
+                "sum": _round_stat(column_stats["sum"])
+            })
+        elif kind == 'datetime' and column_stats["count"]:
+            entry.update({"min": str(column_stats["min"]), "max": str(column_stats["max"])})
+        elif kind == 'categorical':
+            counts = top_values[name]
+            entry["distinct"] = len(counts) if len(counts) < PROFILE_MAX_TRACKED_VALUES else f">={PROFILE_MAX_TRACKED_VALUES}"
+            entry["top_values"] = [[value[:80], count] for value, count in counts.most_common(PROFILE_TOP_VALUES)]
+        column_stats_out[name] = entry
+    
+    # Second pass: count values more than 3 standard deviations from the mean
+    anomalies = []
+    outlier_columns = {n: s for n, s in stats.items()
+                       if column_kinds[n] == 'numeric' and s["count"] > 10 and s.get("std")}
+    if outlier_columns:
+        outliers = {name: {"count": 0, "examples": []} for name in outlier_columns}
+        for chunk in _iter_tabular_chunks(path, fmt, chunk_rows):
+            chunk.columns = [str(c) for c in chunk.columns]
+            frame = coerce(chunk)
+            for name, column_stats in outlier_columns.items():
+                if name not in frame:
+                    continue
+                values = frame[name].dropna()
+                mask = (values - column_stats["mean"]).abs() > 3 * column_stats["std"]
+                flagged = values[mask]
+                outliers[name]["count"] += int(len(flagged))
+                examples = outliers[name]["examples"]
+                if len(examples) < 3:
+                    examples.extend(_round_stat(v) for v in flagged.head(3 - len(examples)).tolist())
+        for name, found in outliers.items():
+            if found["count"]:
+                anomalies.append({"type": "outlier_values", "column": name, "count": found["count"],
+                                  "examples": found["examples"], "rule": "|value - mean| > 3 std"})
+    
+    # Roll daily buckets up to months for long ranges and flag unusual periods
+    time_series = None
+    if series:
+        days = sorted(series)
+        granularity = 'day'
+        buckets = series
+        if len(days) > 90:
+            granularity = 'month'
+            buckets = {}
+            for day in days:
+                month = buckets.setdefault(day[:7], {"rows": 0})
+                for key, value in series[day].items():
+                    month[key] = month.get(key, 0) + value
+        periods = sorted(buckets)
+        rows = np.array([buckets[p]["rows"] for p in periods], dtype='float64')
+        if len(rows) >= 6 and rows.std() > 0:
+            z_scores = (rows - rows.mean()) / rows.std()
+            # First and last periods are usually partial, so they are not judged
+            for period, z in list(zip(periods, z_scores))[1:-1]:
+                if abs(z) > 3:
+                    anomalies.append({"type": "unusual_period_volume", "period": period,
+                                      "rows": int(buckets[period]["rows"]), "z_score": _round_stat(z)})
+        time_series = {
+            "time_column": time_column,
+            "granularity": granularity,
+            # Keep the prompt compact - the most recent periods matter most
+            "periods": [{"period": p, **{k: int(v) if k == "rows" else _round_stat(v) for k, v in buckets[p].items()}}
+                        for p in periods[-24:]],
+            "total_periods": len(periods)
+        }
+    
+    return {
+        "format": fmt,
+        "rows": total_rows,
+        "column_count": len(column_kinds),
+        "schema": [{"name": name, "type": kind} for name, kind in column_kinds.items()],
+        "columns": column_stats_out,
+        "time_series": time_series,
+        "anomalies": anomalies
+    }
+
+async def get_file_data_profile(file_doc: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Profile a tabular upload in the process pool, caching the profile on the file record"""
+    fmt = tabular_format(file_doc)
+    if not fmt or file_doc.get('storage') != 'blob':
+        return None
+    if file_doc.get('data_profile'):
+        return file_doc['data_profile']
+    
+    loop = asyncio.get_running_loop()
+    try:
+        profile = await loop.run_in_executor(
+            get_profile_pool(), profile_tabular_file, str(blob_path(file_doc['content_hash'])), fmt
+        )
+    except Exception as e:
+        logging.warning(f"[FILE_ANALYSIS] Could not profile {file_doc['filename']} as {fmt}: {str(e)}")
+        return None
+    
+    await db.uploaded_files.update_many(
+        {"content_hash": file_doc['content_hash']},
+        {"$set": {"data_profile": profile}}
+    )
+    return profile
+
 # ============ FILE UPLOAD & ANALYSIS ============
 
 @api_router.post("/files/upload")
 async def upload_file(file: UploadFile = File(...), user_id: str = Depends(get_current_user)):
     try:
-        # Read file content
-        content = await file.read()
-        file_size = len(content)
-        
-        # Limit file size to 10MB
-        if file_size > 10 * 1024 * 1024:
-            raise HTTPException(status_code=400, detail="File size exceeds 10MB limit")
-        
-        # Determine if text-based or binary
-        file_type = file.content_type or "application/octet-stream"
-        
-        # Store content as base64 for binary files or decode for text
-        if file_type.startswith('text') or file_type in ['application/json', 'application/csv']:
-            file_content = content.decode('utf-8')
-        else:
-            file_content = base64.b64encode(content).decode('utf-8')
-        
-        uploaded_file = UploadedFile(
-            user_id=user_id,
-            filename=file.filename,
-            file_type=file_type,
-            file_size=file_size,
-            content=file_content
-        )
-        
-        file_dict = uploaded_file.model_dump()
-        file_dict['created_at'] = file_dict['created_at'].isoformat()
-        
-        await db.uploaded_files.insert_one(file_dict)
+        # Stream the upload into the blob store (size limit enforced while reading).
+        # The record is written while the blob's lock is held so a concurrent delete
+        # of the same content cannot remove the bytes underneath it.
+        async with store_upload_in_blob_store(file) as stored:
+            # Identical content already uploaded by this user - reuse the existing record
+            existing = await db.uploaded_files.find_one(
+                {"user_id": user_id, "content_hash": stored['content_hash']},
+                {"_id": 0, "id": 1, "filename": 1}
+            )
+            if existing:
+                return {
+                    "id": existing['id'],
+                    "filename": existing['filename'],
+                    "duplicate": True,
+                    "message": "File already uploaded"
+                }
+            
+            file_type = file.content_type or "application/octet-stream"
+            metadata = sniff_blob_metadata(stored['head'], file_type, file.filename)
+            
+            uploaded_file = UploadedFile(
+                user_id=user_id,
+                filename=file.filename,
+                file_type=file_type,
+                file_size=stored['file_size'],
+                storage="blob",
+                content_hash=stored['content_hash'],
+                sniffed_type=metadata['sniffed_type'],
+                is_text=metadata['is_text']
+            )
+            
+            file_dict = uploaded_file.model_dump()
+            file_dict['created_at'] = file_dict['created_at'].isoformat()
+            
+            await db.uploaded_files.insert_one(file_dict)
         
         return {"id": uploaded_file.id, "filename": file.filename, "message": "File uploaded successfully"}
         
+    except HTTPException:
+        raise
     except Exception as e:
         logging.error(f"File upload error: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to upload file: {str(e)}")
@@ -1472,33 +2010,81 @@ async def get_file(file_id: str, user_id: str = Depends(get_current_user)):
         raise HTTPException(status_code=404, detail="File not found")
     return file_doc
 
-@api_router.post("/files/{file_id}/analyze")
-async def analyze_file(file_id: str, user_id: str = Depends(get_current_user)):
-    # Get file
+@api_router.get("/files/{file_id}/content")
+async def download_file_content(file_id: str, user_id: str = Depends(get_current_user)):
+    """Stream the raw bytes of an uploaded file"""
     file_doc = await db.uploaded_files.find_one({"id": file_id, "user_id": user_id}, {"_id": 0})
     if not file_doc:
         raise HTTPException(status_code=404, detail="File not found")
     
-    # Get business profile for context
-    profile = await db.business_profiles.find_one({"user_id": user_id}, {"_id": 0})
+    if file_doc.get('storage') == 'blob':
+        path = blob_path(file_doc['content_hash'])
+        if not path.exists():
+            raise HTTPException(status_code=404, detail="File content missing from blob store")
+        return FileResponse(path, media_type=file_doc['file_type'], filename=file_doc['filename'])
     
-    try:
-        # Prepare content for analysis
-        if file_doc['file_type'].startswith('text') or 'csv' in file_doc['file_type'] or 'json' in file_doc['file_type']:
-            file_content = file_doc['content'][:10000]  # Limit to first 10k chars
-        else:
-            file_content = "[Binary file - cannot analyze content directly]"
-        
-        business_name = profile.get('business_name') or profile.get('business_idea', 'your business')
-        
-        analysis_prompt = f"""Analyze this file for {business_name} and provide actionable insights.
+    # Legacy inline documents
+    content = file_doc.get('content') or ''
+    if file_doc['file_type'].startswith('text') or file_doc['file_type'] in ['application/json', 'application/csv']:
+        return Response(content=content.encode('utf-8'), media_type=file_doc['file_type'])
+    return Response(content=base64.b64decode(content), media_type=file_doc['file_type'])
+
+# Bump whenever the analysis prompt changes so stale cached analyses are not reused
+FILE_ANALYSIS_PROMPT_VERSION = "2"
+FILE_ANALYSIS_MODEL = ('anthropic', 'claude-4-sonnet-20250514')
+
+def business_profile_version(profile: Optional[Dict[str, Any]]) -> str:
+    """Short fingerprint of the business profile fields that feed into prompts"""
+    if not profile:
+        return "none"
+    relevant = {k: v for k, v in profile.items() if k not in ('id', 'user_id', 'created_at', 'updated_at')}
+    encoded = json_lib.dumps(relevant, sort_keys=True, default=str).encode('utf-8')
+    return hashlib.sha256(encoded).hexdigest()[:16]
+
+def file_content_hash(file_doc: Dict[str, Any]) -> str:
+    """Content hash of an uploaded file (computed on the fly for legacy inline documents)"""
+    if file_doc.get('content_hash'):
+        return file_doc['content_hash']
+    return hashlib.sha256((file_doc.get('content') or '').encode('utf-8')).hexdigest()
+
+async def run_file_analysis(file_doc: Dict[str, Any], profile: Optional[Dict[str, Any]], force_refresh: bool = False) -> Dict[str, Any]:
+    """Analyze an uploaded file, reusing a cached analysis of identical content when possible"""
+    content_hash = file_content_hash(file_doc)
+    profile_version = business_profile_version(profile)
+    cache_key = f"{content_hash}:{profile_version}:{FILE_ANALYSIS_PROMPT_VERSION}"
+    
+    if not force_refresh:
+        cached = await db.file_analysis_cache.find_one_and_update(
+            {"cache_key": cache_key},
+            {"$inc": {"hit_count": 1}, "$set": {"last_hit_at": datetime.now(timezone.utc).isoformat()}},
+            projection={"_id": 0, "analysis": 1}
+        )
+        if cached:
+            logging.info(f"[FILE_ANALYSIS] Cache hit for {file_doc['id']} ({cache_key})")
+            return {"analysis": cached['analysis'], "cached": True}
+    
+    # Prepare content for analysis - tabular files are summarized locally over the whole file
+    data_profile = await get_file_data_profile(file_doc)
+    if data_profile:
+        content_section = f"""Data Profile (computed locally over all {data_profile['rows']} rows):
+```json
+{json_lib.dumps(data_profile, default=str)}
+```"""
+    elif file_doc.get('is_text') or file_doc['file_type'].startswith('text') or 'csv' in file_doc['file_type'] or 'json' in file_doc['file_type']:
+        file_content = await read_uploaded_file_text(file_doc, 10000)  # Limit to first 10k chars
+        content_section = f"Content Preview:\n{file_content}"
+    else:
+        content_section = "Content Preview:\n[Binary file - cannot analyze content directly]"
+    
+    business_name = (profile.get('business_name') or profile.get('business_idea', 'your business')) if profile else 'your business'
+    
+    analysis_prompt = f"""Analyze this file for {business_name} and provide actionable insights.
 
 File: {file_doc['filename']}
 Type: {file_doc['file_type']}
 Size: {file_doc['file_size']} bytes
 
-Content Preview:
-{file_content}
+{content_section}
 
 Provide a **concise analysis** (3-5 key points) focusing on:
 • **Financial insights** (if applicable)
@@ -1507,49 +2093,610 @@ Provide a **concise analysis** (3-5 key points) focusing on:
 • **Red flags or risks**
 
 Use markdown formatting for clarity."""
-        
-        chat = LlmChat(
-            api_key=os.environ.get('EMERGENT_LLM_KEY'),
-            session_id=str(uuid.uuid4()),
-            system_message="You are a business analyst expert. Provide concise, actionable insights from files."
-        ).with_model('anthropic', 'claude-4-sonnet-20250514')
-        
-        user_message = UserMessage(text=analysis_prompt)
+    
+    chat = LlmChat(
+        api_key=os.environ.get('EMERGENT_LLM_KEY'),
+        session_id=str(uuid.uuid4()),
+        system_message="You are a business analyst expert. Provide concise, actionable insights from files."
+    ).with_model(*FILE_ANALYSIS_MODEL)
+    
+    user_message = UserMessage(text=analysis_prompt)
+    async with llm_semaphore:
         response = await chat.send_message(user_message)
+    
+    await db.file_analysis_cache.update_one(
+        {"cache_key": cache_key},
+        {"$set": {
+            "cache_key": cache_key,
+            "content_hash": content_hash,
+            "profile_version": profile_version,
+            "prompt_version": FILE_ANALYSIS_PROMPT_VERSION,
+            "model": "/".join(FILE_ANALYSIS_MODEL),
+            "analysis": response,
+            "created_at": datetime.now(timezone.utc).isoformat()
+        }, "$setOnInsert": {"hit_count": 0}},
+        upsert=True
+    )
+    
+    return {"analysis": response, "cached": False}
+
+@api_router.post("/files/{file_id}/analyze")
+async def analyze_file(file_id: str, force_refresh: bool = False, user_id: str = Depends(get_current_user)):
+    # Get file
+    file_doc = await db.uploaded_files.find_one({"id": file_id, "user_id": user_id}, {"_id": 0, "content": 0})
+    if not file_doc:
+        raise HTTPException(status_code=404, detail="File not found")
+    
+    # Get business profile for context
+    profile = await db.business_profiles.find_one({"user_id": user_id}, {"_id": 0})
+    
+    try:
+        if file_doc.get('storage') != 'blob':
+            # Legacy inline documents need their content for hashing and the preview
+            file_doc = await db.uploaded_files.find_one({"id": file_id, "user_id": user_id}, {"_id": 0})
+        
+        analysis = await run_file_analysis(file_doc, profile, force_refresh=force_refresh)
         
         # Save analysis to file record
-        await db.uploaded_files.update_one(
-            {"id": file_id},
-            {"$set": {"analysis": response}}
-        )
+        if analysis['analysis'] != file_doc.get('analysis'):
+            await db.uploaded_files.update_one(
+                {"id": file_id},
+                {"$set": {"analysis": analysis['analysis']}}
+            )
         
-        return {"analysis": response}
+        return analysis
         
     except Exception as e:
         logging.error(f"File analysis error: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to analyze file: {str(e)}")
 
+class FileBatchAnalyzeRequest(BaseModel):
+    file_ids: List[str]
+    force_refresh: bool = False
+
+# Batch analyses still running in the background, kept referenced until they finish
+_file_analysis_tasks: set = set()
+
+@api_router.post("/files/analyze-batch")
+async def analyze_files_batch(request: FileBatchAnalyzeRequest, user_id: str = Depends(get_current_user)):
+    """Analyze several files concurrently, streaming each result (NDJSON) as soon as it finishes"""
+    file_ids = list(dict.fromkeys(request.file_ids))  # Dedupe, keep order
+    if not file_ids:
+        raise HTTPException(status_code=400, detail="No file ids provided")
+    if len(file_ids) > 50:
+        raise HTTPException(status_code=400, detail="At most 50 files can be analyzed per batch")
+    
+    file_docs = await db.uploaded_files.find(
+        {"id": {"$in": file_ids}, "user_id": user_id},
+        {"_id": 0}
+    ).to_list(length=len(file_ids))
+    docs_by_id = {doc['id']: doc for doc in file_docs}
+    profile = await db.business_profiles.find_one({"user_id": user_id}, {"_id": 0})
+    
+    async def analyze_one(file_id: str) -> Dict[str, Any]:
+        file_doc = docs_by_id.get(file_id)
+        if not file_doc:
+            return {"file_id": file_id, "status": "not_found"}
+        try:
+            # Provider concurrency is bounded inside run_file_analysis by llm_semaphore
+            analysis = await run_file_analysis(file_doc, profile, force_refresh=request.force_refresh)
+            return {"file_id": file_id, "filename": file_doc['filename'], "status": "completed", **analysis}
+        except Exception as e:
+            logging.error(f"[FILE_ANALYSIS] Batch analysis failed for {file_id}: {str(e)}")
+            return {"file_id": file_id, "filename": file_doc['filename'], "status": "failed", "error": str(e)}
+    
+    results: asyncio.Queue = asyncio.Queue()
+    
+    async def analyze_all():
+        from pymongo import UpdateOne
+        
+        updates = []
+        
+        async def run_one(file_id: str):
+            result = await analyze_one(file_id)
+            if result['status'] == 'completed' and result['analysis'] != docs_by_id[result['file_id']].get('analysis'):
+                updates.append(UpdateOne({"id": result['file_id']}, {"$set": {"analysis": result['analysis']}}))
+            results.put_nowait(result)
+        
+        try:
+            await asyncio.gather(*(run_one(file_id) for file_id in file_ids))
+        finally:
+            # Persist every new analysis in a single round trip
+            if updates:
+                await db.uploaded_files.bulk_write(updates, ordered=False)
+    
+    # Analysis and persistence run apart from the response, so a client that disconnects
+    # mid-stream does not throw away analyses that were already paid for
+    task = asyncio.create_task(analyze_all())
+    _file_analysis_tasks.add(task)
+    task.add_done_callback(_file_analysis_tasks.discard)
+    
+    async def stream_results():
+        counts = {"completed": 0, "failed": 0, "not_found": 0}
+        for _ in file_ids:
+            result = await results.get()
+            counts[result['status']] += 1
+            yield json_lib.dumps(result) + "\n"
+        
+        await asyncio.shield(task)
+        yield json_lib.dumps({"done": True, **counts}) + "\n"
+    
+    return StreamingResponse(stream_results(), media_type="application/x-ndjson")
+
 @api_router.delete("/files/{file_id}")
 async def delete_file(file_id: str, user_id: str = Depends(get_current_user)):
+    file_doc = await db.uploaded_files.find_one({"id": file_id, "user_id": user_id}, {"_id": 0, "content_hash": 1})
     result = await db.uploaded_files.delete_one({"id": file_id, "user_id": user_id})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="File not found")
+    
+    # Blobs are shared by identical uploads - only drop the bytes once nobody references them
+    await release_blob_if_unreferenced(file_doc.get('content_hash') if file_doc else None)
     return {"message": "File deleted successfully"}
 
-# ============ AI SELF-LEARNING & RESEARCH ============
+# ============ LEARNINGS RETRIEVAL ============
+
+# In-process BM25 index over each user's ai_learnings so a chat turn only gets
+# the learnings relevant to what is being asked. Built lazily on first use and
+# kept current as learnings are inserted. Indexes are rebuilt after a TTL so
+# learnings written by other workers show up, and only the most recently used
+# users' indexes are kept in memory.
+LEARNINGS_PER_MESSAGE = 5
+LEARNINGS_INDEX_TTL_SECONDS = int(os.environ.get('LEARNINGS_INDEX_TTL_SECONDS', 300))
+LEARNINGS_INDEX_MAX_USERS = int(os.environ.get('LEARNINGS_INDEX_MAX_USERS', 200))
+LEARNING_SEARCH_STOPWORDS = frozenset("""
+a an and are as at be but by can do for from has have how i if in into is it its me my
+of on or our so that the their them then there these they this to was we what when
+which who why will with you your
+""".split())
+
+def tokenize_for_search(text: str) -> List[str]:
+    """Lowercase word tokens with stopwords removed and plurals folded"""
+    tokens = []
+    for token in re.findall(r"[a-z0-9$%]+", (text or '').lower()):
+        if len(token) < 2 or token in LEARNING_SEARCH_STOPWORDS:
+            continue
+        if len(token) > 3 and token.endswith('s') and not token.endswith('ss'):
+            token = token[:-1]
+        tokens.append(token)
+    return tokens
+
+class LearningsIndex:
+    """BM25 index over one user's learnings, updated incrementally"""
+    
+    K1 = 1.5
+    B = 0.75
+    
+    def __init__(self):
+        self.learnings: Dict[str, Dict[str, Any]] = {}
+        self.doc_lengths: Dict[str, int] = {}
+        self.postings: Dict[str, Dict[str, int]] = {}  # term -> {learning id: term frequency}
+        self.total_length = 0
+        self.expires_at = time.monotonic() + LEARNINGS_INDEX_TTL_SECONDS
+    
+    def __len__(self):
+        return len(self.learnings)
+    
+    def add(self, learning: Dict[str, Any]):
+        learning_id = learning['id']
+        if learning_id in self.learnings:
+            self.remove(learning_id)
+        
+        tokens = tokenize_for_search(f"{learning.get('category', '')} {learning.get('insight', '')}".replace('_', ' '))
+        term_counts: Dict[str, int] = {}
+        for token in tokens:
+            term_counts[token] = term_counts.get(token, 0) + 1
+        for term, count in term_counts.items():
+            self.postings.setdefault(term, {})[learning_id] = count
+        
+        self.learnings[learning_id] = {
+            "id": learning_id,
+            "category": learning.get('category', 'general'),
+            "insight": learning.get('insight', ''),
+            "confidence_score": learning.get('confidence_score', 1.0)
+        }
+        self.doc_lengths[learning_id] = len(tokens)
+        self.total_length += len(tokens)
+    
+    def remove(self, learning_id: str):
+        if learning_id not in self.learnings:
+            return
+        learning = self.learnings.pop(learning_id)
+        self.total_length -= self.doc_lengths.pop(learning_id)
+        for term in set(tokenize_for_search(f"{learning['category']} {learning['insight']}".replace('_', ' '))):
+            term_postings = self.postings.get(term)
+            if term_postings is not None:
+                term_postings.pop(learning_id, None)
+                if not term_postings:
+                    del self.postings[term]
+    
+    def search(self, query: str, k: int = LEARNINGS_PER_MESSAGE) -> List[Dict[str, Any]]:
+        """Return the k learnings most relevant to the query (empty if nothing matches)"""
+        if not self.learnings:
+            return []
+        
+        doc_count = len(self.learnings)
+        avg_length = (self.total_length / doc_count) or 1.0
+        scores: Dict[str, float] = {}
+        for term in set(tokenize_for_search(query)):
+            term_postings = self.postings.get(term)
+            if not term_postings:
+                continue
+            df = len(term_postings)
+            idf = math.log(1 + (doc_count - df + 0.5) / (df + 0.5))
+            for learning_id, tf in term_postings.items():
+                norm = self.K1 * (1 - self.B + self.B * self.doc_lengths[learning_id] / avg_length)
+                scores[learning_id] = scores.get(learning_id, 0.0) + idf * tf * (self.K1 + 1) / (tf + norm)
+        
+        # Confidence breaks ties between similarly relevant learnings
+        ranked = heapq.nlargest(
+            k, scores.items(),
+            key=lambda item: item[1] * (0.75 + 0.25 * float(self.learnings[item[0]]['confidence_score'] or 0))
+        )
+        return [self.learnings[learning_id] for learning_id, _ in ranked]
+    
+    def top(self, k: int = LEARNINGS_PER_MESSAGE) -> List[Dict[str, Any]]:
+        """Return the k most confident learnings, for queries that match nothing"""
+        return heapq.nlargest(k, self.learnings.values(), key=lambda learning: float(learning['confidence_score'] or 0))
+
+_learnings_indexes: 'OrderedDict[str, LearningsIndex]' = OrderedDict()
+_learnings_index_locks: "weakref.WeakValueDictionary[str, asyncio.Lock]" = weakref.WeakValueDictionary()
+
+def cached_learnings_index(user_id: str) -> Optional[LearningsIndex]:
+    """Return the user's index if it is built and has not expired"""
+    index = _learnings_indexes.get(user_id)
+    if index is None:
+        return None
+    if index.expires_at < time.monotonic():
+        del _learnings_indexes[user_id]
+        return None
+    _learnings_indexes.move_to_end(user_id)
+    return index
+
+async def get_learnings_index(user_id: str) -> LearningsIndex:
+    """Return the user's learnings index, building it from Mongo on first use"""
+    index = cached_learnings_index(user_id)
+    if index is not None:
+        return index
+    
+    lock = _learnings_index_locks.get(user_id)
+    if lock is None:
+        lock = _learnings_index_locks[user_id] = asyncio.Lock()
+    async with lock:
+        index = cached_learnings_index(user_id)
+        if index is None:
+            index = LearningsIndex()
+            cursor = db.ai_learnings.find(
+                {"user_id": user_id, **ACTIVE_LEARNING_FILTER},
+                {"_id": 0, "id": 1, "category": 1, "insight": 1, "confidence_score": 1}
+            )
+            async for learning in cursor:
+                index.add(learning)
+            _learnings_indexes[user_id] = index
+            while len(_learnings_indexes) > LEARNINGS_INDEX_MAX_USERS:
+                _learnings_indexes.popitem(last=False)
+            logging.info(f"[LEARNINGS] Built search index for user {user_id} ({len(index)} learnings)")
+    return index
+
+def index_learning(user_id: str, learning: Dict[str, Any]):
+    """Add a newly inserted learning to the user's index (if it has been built yet)"""
+    index = cached_learnings_index(user_id)
+    if index is not None:
+        index.add(learning)
+
+# ============ LEARNINGS CONSOLIDATION ============
+
+# Research and conversation learning insert new documents on every run. Consolidation
+# merges near-duplicates (boosting confidence when an insight is corroborated),
+# decays stale learnings and caps how many stay active per user.
+LEARNING_SIMILARITY_THRESHOLD = 0.6  # Jaccard similarity of token sets
+LEARNING_CORROBORATION_BOOST = 0.05
+LEARNING_HALF_LIFE_DAYS = 90
+LEARNING_MIN_CONFIDENCE = 0.15
+LEARNING_MAX_ACTIVE_PER_USER = 100
+ACTIVE_LEARNING_FILTER = {"status": {"$ne": "archived"}}
+
+def _parse_timestamp(value: Any) -> Optional[datetime]:
+    if isinstance(value, datetime):
+        return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+    if isinstance(value, str):
+        try:
+            parsed = datetime.fromisoformat(value)
+            return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+        except ValueError:
+            return None
+    return None
+
+def cluster_similar_learnings(learnings: List[Dict[str, Any]], threshold: float = LEARNING_SIMILARITY_THRESHOLD) -> List[List[Dict[str, Any]]]:
+    """Greedily group near-duplicate learnings; the first learning of each cluster is its representative.
+    
+    Learnings are expected to be sorted by confidence (highest first). Candidates are found
+    through shared tokens so the comparison stays close to linear for typical collections.
+    """
+    token_sets = [frozenset(tokenize_for_search(learning.get('insight', ''))) for learning in learnings]
+    docs_by_token: Dict[str, List[int]] = {}
+    for position, tokens in enumerate(token_sets):
+        for token in tokens:
+            docs_by_token.setdefault(token, []).append(position)
+    
+    assigned = [False] * len(learnings)
+    clusters = []
+    for position, tokens in enumerate(token_sets):
+        if assigned[position]:
+            continue
+        assigned[position] = True
+        cluster = [learnings[position]]
+        
+        shared_counts: Dict[int, int] = {}
+        for token in tokens:
+            for other in docs_by_token[token]:
+                if other > position and not assigned[other]:
+                    shared_counts[other] = shared_counts.get(other, 0) + 1
+        for other, shared in sorted(shared_counts.items()):
+            union = len(tokens) + len(token_sets[other]) - shared
+            if union and shared / union >= threshold:
+                assigned[other] = True
+                cluster.append(learnings[other])
+        clusters.append(cluster)
+    return clusters
+
+async def consolidate_user_learnings(user_id: str) -> Dict[str, int]:
+    """Merge, decay and cap a user's active learnings"""
+    from pymongo import UpdateOne, DeleteOne
+    
+    now = datetime.now(timezone.utc)
+    learnings = await db.ai_learnings.find(
+        {"user_id": user_id, **ACTIVE_LEARNING_FILTER},
+        {"_id": 0}
+    ).to_list(length=None)
+    if not learnings:
+        return {"active": 0, "merged": 0, "archived": 0, "decayed": 0}
+    
+    # Decay confidence for the time elapsed since the last decay
+    decayed = 0
+    for learning in learnings:
+        reference = _parse_timestamp(learning.get('decayed_at')) or _parse_timestamp(learning.get('created_at')) or now
+        age_days = max((now - reference).total_seconds() / 86400, 0)
+        factor = 0.5 ** (age_days / LEARNING_HALF_LIFE_DAYS)
+        learning['confidence_score'] = float(learning.get('confidence_score') or 0) * factor
+        if factor < 0.999:
+            decayed += 1
+    
+    learnings.sort(key=lambda learning: learning['confidence_score'], reverse=True)
+    clusters = cluster_similar_learnings(learnings)
+    
+    operations = []
+    merged = 0
+    survivors = []
+    for cluster in clusters:
+        representative = cluster[0]
+        duplicates = cluster[1:]
+        updates = {
+            "confidence_score": representative['confidence_score'],
+            "decayed_at": now.isoformat(),
+            "status": "active"
+        }
+        if duplicates:
+            # Independent sources agreeing on an insight make it more trustworthy
+            updates["confidence_score"] = min(1.0, representative['confidence_score'] + LEARNING_CORROBORATION_BOOST * len(duplicates))
+            updates["corroboration_count"] = sum(learning.get('corroboration_count', 1) for learning in cluster)
+            updates["applied_count"] = sum(learning.get('applied_count', 0) for learning in cluster)
+            updates["last_corroborated"] = now.isoformat()
+            for duplicate in duplicates:
+                operations.append(DeleteOne({"id": duplicate['id'], "user_id": user_id}))
+            merged += len(duplicates)
+        representative['confidence_score'] = updates['confidence_score']
+        survivors.append((representative, updates))
+    
+    # Cap active learnings, dropping the weakest first
+    survivors.sort(key=lambda item: item[1]['confidence_score'], reverse=True)
+    archived = 0
+    for rank, (learning, updates) in enumerate(survivors):
+        if rank >= LEARNING_MAX_ACTIVE_PER_USER or updates['confidence_score'] < LEARNING_MIN_CONFIDENCE:
+            updates['status'] = 'archived'
+            archived += 1
+        operations.append(UpdateOne({"id": learning['id'], "user_id": user_id}, {"$set": updates}))
+    
+    if operations:
+        await db.ai_learnings.bulk_write(operations, ordered=False)
+    
+    # The search index is rebuilt lazily from the consolidated set
+    _learnings_indexes.pop(user_id, None)
+    
+    stats = {"active": len(survivors) - archived, "merged": merged, "archived": archived, "decayed": decayed}
+    logging.info(f"[LEARNINGS] Consolidated learnings for user {user_id}: {stats}")
+    return stats
+
+# ============ WEB SEARCH ============
+
+# Research mode queries a pluggable search provider. Results are cached under a
+# normalized query key and shared across users, so the same industry queries
+# are only fetched once per TTL.
+SEARCH_PROVIDER = os.environ.get('SEARCH_PROVIDER', '')  # "serper", "tavily" or "local"
+SEARCH_CACHE_TTL_SECONDS = int(os.environ.get('SEARCH_CACHE_TTL_SECONDS', str(6 * 3600)))
+SEARCH_CACHE_MAX_ENTRIES = 2000
+SEARCH_DEADLINE_SECONDS = float(os.environ.get('SEARCH_DEADLINE_SECONDS', '8'))
+SEARCH_RESULTS_PER_QUERY = 3
+
+class SearchProvider(ABC):
+    """Interface for web search backends. Results are dicts with title, url and snippet."""
+    
+    name = "base"
+    
+    @abstractmethod
+    async def search(self, query: str, max_results: int = SEARCH_RESULTS_PER_QUERY) -> List[Dict[str, str]]:
+        ...
+
+class LocalSearchProvider(SearchProvider):
+    """Offline stand-in that ranks a fixed corpus by token overlap (used in tests and when no API is configured)"""
+    
+    name = "local"
+    
+    def __init__(self, corpus: Optional[List[Dict[str, str]]] = None):
+        self.corpus = corpus or []
+        self.calls = 0
+    
+    async def search(self, query: str, max_results: int = SEARCH_RESULTS_PER_QUERY) -> List[Dict[str, str]]:
+        self.calls += 1
+        query_tokens = set(tokenize_for_search(query))
+        scored = []
+        for position, document in enumerate(self.corpus):
+            overlap = len(query_tokens & set(tokenize_for_search(f"{document.get('title', '')} {document.get('snippet', '')}")))
+            if overlap:
+                scored.append((-overlap, position, document))
+        return [document for _, _, document in sorted(scored)[:max_results]]
+
+class SerperSearchProvider(SearchProvider):
+    name = "serper"
+    
+    def __init__(self, api_key: str):
+        self.api_key = api_key
+    
+    async def search(self, query: str, max_results: int = SEARCH_RESULTS_PER_QUERY) -> List[Dict[str, str]]:
+        async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=SEARCH_DEADLINE_SECONDS)) as session:
+            async with session.post(
+                "https://google.serper.dev/search",
+                headers={"X-API-KEY": self.api_key, "Content-Type": "application/json"},
+                json={"q": query, "num": max_results}
+            ) as resp:
+                resp.raise_for_status()
+                data = await resp.json()
+        return [
+            {"title": item.get('title', ''), "url": item.get('link', ''), "snippet": item.get('snippet', '')}
+            for item in data.get('organic', [])[:max_results]
+        ]
+
+class TavilySearchProvider(SearchProvider):
+    name = "tavily"
+    
+    def __init__(self, api_key: str):
+        self.api_key = api_key
+    
+    async def search(self, query: str, max_results: int = SEARCH_RESULTS_PER_QUERY) -> List[Dict[str, str]]:
+        async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=SEARCH_DEADLINE_SECONDS)) as session:
+            async with session.post(
+                "https://api.tavily.com/search",
+                json={"api_key": self.api_key, "query": query, "max_results": max_results}
+            ) as resp:
+                resp.raise_for_status()
+                data = await resp.json()
+        return [
+            {"title": item.get('title', ''), "url": item.get('url', ''), "snippet": item.get('content', '')[:500]}
+            for item in data.get('results', [])[:max_results]
+        ]
+
+def normalize_search_query(query: str) -> str:
+    """Cache key for a query: case, punctuation, stopwords and word order do not matter"""
+    return " ".join(sorted(set(tokenize_for_search(query))))
+
+class SearchResultCache:
+    """Shared TTL cache of search results with single-flight fetching per normalized query"""
+    
+    def __init__(self, ttl_seconds: int = SEARCH_CACHE_TTL_SECONDS, max_entries: int = SEARCH_CACHE_MAX_ENTRIES):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.entries: 'OrderedDict[str, tuple]' = OrderedDict()  # key -> (expires_at, results)
+        self.in_flight: Dict[str, asyncio.Task] = {}
+        self.hits = 0
+        self.misses = 0
+    
+    def get(self, key: str) -> Optional[List[Dict[str, str]]]:
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        expires_at, results = entry
+        if expires_at < time.monotonic():
+            del self.entries[key]
+            return None
+        self.entries.move_to_end(key)
+        return results
+    
+    def put(self, key: str, results: List[Dict[str, str]]):
+        self.entries[key] = (time.monotonic() + self.ttl_seconds, results)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+    
+    async def fetch(self, provider: SearchProvider, query: str) -> List[Dict[str, str]]:
+        key = f"{provider.name}:{normalize_search_query(query)}"
+        cached = self.get(key)
+        if cached is not None:
+            self.hits += 1
+            return cached
+        
+        task = self.in_flight.get(key)
+        if task is None:
+            self.misses += 1
+            
+            async def run():
+                try:
+                    results = await provider.search(query)
+                    # An empty answer may be an outage or an unconfigured provider; ask again next time
+                    if results:
+                        self.put(key, results)
+                    return results
+                finally:
+                    self.in_flight.pop(key, None)
+            
+            task = asyncio.create_task(run())
+            self.in_flight[key] = task
+        # Shielded so one caller hitting its deadline does not abort the fetch for everyone else
+        return await asyncio.shield(task)
+
+search_cache = SearchResultCache()
+_search_provider: Optional[SearchProvider] = None
+
+def get_search_provider() -> SearchProvider:
+    global _search_provider
+    if _search_provider is None:
+        provider_name = SEARCH_PROVIDER.lower()
+        if provider_name in ('', 'serper') and os.environ.get('SERPER_API_KEY'):
+            _search_provider = SerperSearchProvider(os.environ['SERPER_API_KEY'])
+        elif provider_name in ('', 'tavily') and os.environ.get('TAVILY_API_KEY'):
+            _search_provider = TavilySearchProvider(os.environ['TAVILY_API_KEY'])
+        else:
+            _search_provider = LocalSearchProvider()
+            logging.warning(
+                f"[WEB_SEARCH] No API key for search provider '{provider_name or 'any'}'; "
+                "research runs without web results (set SERPER_API_KEY or TAVILY_API_KEY)"
+            )
+        logging.info(f"[WEB_SEARCH] Using {_search_provider.name} search provider")
+    return _search_provider
+
+def set_search_provider(provider: SearchProvider):
+    """Swap the search backend (e.g. a LocalSearchProvider with a fixed corpus in tests)"""
+    global _search_provider
+    _search_provider = provider
+
+async def web_search_many(queries: List[str], deadline: float = SEARCH_DEADLINE_SECONDS) -> Dict[str, List[Dict[str, str]]]:
+    """Run several searches concurrently; queries still pending at the deadline are dropped"""
+    provider = get_search_provider()
+    tasks = {asyncio.create_task(search_cache.fetch(provider, query)): query for query in queries}
+    done, pending = await asyncio.wait(tasks, timeout=deadline)
+    for task in pending:
+        task.cancel()
+    if pending:
+        logging.warning(f"[WEB_SEARCH] {len(pending)} of {len(queries)} searches missed the {deadline}s deadline")
+    
+    results = {}
+    for task in done:
+        if task.exception():
+            logging.error(f"Web search error for '{tasks[task]}': {str(task.exception())}")
+            continue
+        results[tasks[task]] = task.result()
+    return results
 
 async def web_search(query: str) -> str:
-    """Perform web search using a search API"""
+    """Perform web search using the configured search provider"""
     try:
-        # Using a simple web search approach
-        async with aiohttp.ClientSession() as session:
-            # You can replace this with actual search API like Serper, Tavily, etc.
-            # For now, we'll use a simulated search
-            return f"Search results for: {query} (Web search integration placeholder)"
+        results = (await web_search_many([query])).get(query, [])
+        return "\n".join(f"- {r['title']} ({r['url']}): {r['snippet']}" for r in results)
     except Exception as e:
         logging.error(f"Web search error: {str(e)}")
         return ""
 
+# ============ AI SELF-LEARNING & RESEARCH ============
+
 @api_router.post("/ai/research")
 async def trigger_ai_research(user_id: str = Depends(get_current_user)):
     """AI researches strategies for user's business type"""
@@ -1570,6 +2717,16 @@ async def trigger_ai_research(user_id: str = Depends(get_current_user)):
             f"micro-influencer success stories {industry} monetization"
         ]
         
+        # Fetch search results for all queries concurrently (cached across users in the same industry)
+        search_results = await web_search_many(research_queries)
+        findings = []
+        for query in research_queries:
+            for item in search_results.get(query, []):
+                findings.append(f"- {item['title']} ({item['url']}): {item['snippet']}")
+        findings_section = ""
+        if findings:
+            findings_section = "\n\nWeb search findings (cite and build on these where relevant):\n" + "\n".join(findings)
+        
         research_prompt = f"""Research and analyze successful strategies for a {business_type} in {industry}.
 
 Focus on:
@@ -1579,7 +2736,7 @@ Focus on:
 4. **Free/cheap methods** - Prioritize low-cost approaches
 
 Research queries to consider:
-{chr(10).join([f"- {q}" for q in research_queries])}
+{chr(10).join([f"- {q}" for q in research_queries])}{findings_section}
 
 Provide 5-7 key insights in this format:
 **Insight #X: [Title]**
@@ -1623,11 +2780,16 @@ Be specific with examples and numbers."""
                     learning_dict['last_applied'] = learning_dict['last_applied'].isoformat()
                 
                 await db.ai_learnings.insert_one(learning_dict)
+                index_learning(user_id, learning_dict)
                 learnings_created += 1
         
+        consolidation = await consolidate_user_learnings(user_id)
+        
         return {
             "research_completed": True,
             "insights_found": learnings_created,
+            "search_results_used": len(findings),
+            "consolidation": consolidation,
             "research_summary": research_results[:500] + "...",
             "message": f"AI researched {learnings_created} insights for your {business_type}"
         }
@@ -1719,10 +2881,14 @@ Return ONLY the JSON, no other text."""
                 learning_dict['last_applied'] = learning_dict['last_applied'].isoformat()
             
             await db.ai_learnings.insert_one(learning_dict)
+            index_learning(user_id, learning_dict)
             learnings_created += 1
         
+        consolidation = await consolidate_user_learnings(user_id)
+        
         return {
             "learnings_extracted": learnings_created,
+            "consolidation": consolidation,
             "message": f"Extracted {learnings_created} insights from your conversations"
         }
         
@@ -1731,14 +2897,28 @@ Return ONLY the JSON, no other text."""
         return {"learnings_extracted": 0, "error": str(e)}
 
 @api_router.get("/ai/learnings")
-async def get_ai_learnings(user_id: str = Depends(get_current_user)):
-    """Get all AI learnings for user"""
+async def get_ai_learnings(q: Optional[str] = None, limit: int = 10, user_id: str = Depends(get_current_user)):
+    """Get all AI learnings for user, or the ones most relevant to `q`"""
+    if q:
+        learnings_index = await get_learnings_index(user_id)
+        learnings = learnings_index.search(q, k=min(max(limit, 1), 50))
+        return {"learnings": learnings, "total": len(learnings)}
+    
     learnings = list(await db.ai_learnings.find(
-        {"user_id": user_id},
+        {"user_id": user_id, **ACTIVE_LEARNING_FILTER},
         {"_id": 0}
     ).sort("created_at", -1).to_list(50))
     return {"learnings": learnings, "total": len(learnings)}
 
+@api_router.post("/ai/learnings/consolidate")
+async def consolidate_ai_learnings(user_id: str = Depends(get_current_user)):
+    """Merge duplicate learnings, decay stale ones and enforce the per-user cap"""
+    try:
+        return await consolidate_user_learnings(user_id)
+    except Exception as e:
+        logging.error(f"Learning consolidation error: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to consolidate learnings: {str(e)}")
+
 # ============ ROOT & HEALTH ============
 
 @api_router.get("/")
@@ -1758,6 +2938,7 @@ class WorkflowEdge(BaseModel):
     source: str
     target: str
     type: Optional[str] = None
+    label: Optional[str] = None  # Branch taken from a condition ('true'/'false') or switch (case value/'default')
 
 class Workflow(BaseModel):
     model_config = ConfigDict(extra="ignore")
@@ -1766,6 +2947,7 @@ class Workflow(BaseModel):
     name: str
     nodes: List[WorkflowNode]
     edges: List[WorkflowEdge]
+    validation_warnings: List[str] = []  # Non-fatal problems found when the workflow was compiled
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
     updated_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
@@ -1783,12 +2965,17 @@ async def create_workflow(workflow: WorkflowCreate, user_id: str = Depends(get_c
         edges=workflow.edges
     )
     
-    await db.workflows.insert_one(workflow_doc.model_dump())
+    doc = workflow_doc.model_dump()
+    compiled = compiled_workflow_fields(doc)
+    doc.update(compiled)
+    workflow_doc.validation_warnings = compiled['validation_warnings']
+    
+    await db.workflows.insert_one(doc)
     return workflow_doc
 
 @api_router.get("/workflows", response_model=List[Workflow])
 async def get_workflows(user_id: str = Depends(get_current_user)):
-    workflows = await db.workflows.find({"user_id": user_id}, {"_id": 0}).to_list(length=None)
+    workflows = await db.workflows.find({"user_id": user_id}, {"_id": 0, "execution_plan": 0}).to_list(length=None)
     return workflows
 
 @api_router.get("/workflows/executions")
@@ -1797,53 +2984,447 @@ async def get_executions(user_id: str = Depends(get_current_user)):
         {"user_id": user_id},
         {"_id": 0}
     ).sort("started_at", -1).limit(50).to_list(length=50)
+    for execution in executions:
+        execution['results'] = await hydrate_result_media(execution.get('results', {}))
     return executions
 
 @api_router.get("/workflows/executions/{execution_id}")
-async def get_execution(execution_id: str, user_id: str = Depends(get_current_user)):
+async def get_execution(execution_id: str, include_results: bool = True, user_id: str = Depends(get_current_user)):
+    # Progress polling passes include_results=false to skip the (possibly large) node outputs
+    projection = {"_id": 0} if include_results else {"_id": 0, "results": 0}
     execution = await db.workflow_executions.find_one(
         {"id": execution_id, "user_id": user_id},
-        {"_id": 0}
+        projection
     )
     if not execution:
         raise HTTPException(status_code=404, detail="Execution not found")
+    if include_results:
+        execution['results'] = await hydrate_result_media(execution.get('results', {}))
     return execution
 
-# ============ INTEGRATIONS ENDPOINTS ============
-
-class IntegrationConfig(BaseModel):
-    apiKey: Optional[str] = None
-    accountSid: Optional[str] = None
-    authToken: Optional[str] = None
-
-@api_router.get("/integrations")
-async def get_integrations(user_id: str = Depends(get_current_user)):
-    """Get user's integration configurations"""
-    logging.info(f"[INTEGRATIONS] Getting integrations for user: {user_id}")
-    user = await db.users.find_one({"id": user_id}, {"_id": 0, "integrations": 1})
-    integrations = user.get("integrations", {}) if user else {}
-    logging.info(f"[INTEGRATIONS] Found integrations: {list(integrations.keys())}")
-    return integrations
-
-@api_router.post("/integrations/{service}")
-async def save_integration(service: str, config: IntegrationConfig, user_id: str = Depends(get_current_user)):
-    """Save integration configuration for a service"""
+@api_router.post("/workflows/executions/{execution_id}/stream-token")
+async def create_execution_stream_token(execution_id: str, user_id: str = Depends(get_current_user)):
+    """Issue a single-use token for opening the execution's event stream"""
+    if not await db.workflow_executions.count_documents({"id": execution_id, "user_id": user_id}, limit=1):
+        raise HTTPException(status_code=404, detail="Execution not found")
+    token = await issue_stream_token(user_id, execution_id)
+    return {"stream_token": token, "expires_in": STREAM_TOKEN_TTL_SECONDS}
+
+@api_router.get("/workflows/executions/{execution_id}/events")
+async def stream_execution_events(execution_id: str, user_id: str = Depends(get_stream_user)):
+    """Server-Sent Events stream of an execution's node, progress, log and status events"""
+    # Subscribe before reading the snapshot so no event falls in between
+    queue = execution_events.subscribe(execution_id)
+    execution = await db.workflow_executions.find_one(
+        {"id": execution_id, "user_id": user_id},
+        {"_id": 0}
+    )
+    if not execution:
+        execution_events.unsubscribe(execution_id, queue)
+        raise HTTPException(status_code=404, detail="Execution not found")
     
-    # Validate the API key/credentials before saving
-    if service == "elevenlabs":
+    async def event_stream():
         try:
-            # Test the API key by fetching available voices
-            test_url = "https://api.elevenlabs.io/v1/voices"
-            test_headers = {"xi-api-key": config.apiKey}
-            
-            response = requests.get(test_url, headers=test_headers, timeout=10)
-            
-            if response.status_code != 200:
-                logging.error(f"ElevenLabs API key validation failed: {response.status_code} - {response.text}")
-                raise HTTPException(
-                    status_code=400,
-                    detail=f"Invalid ElevenLabs API key. Please check your key and try again."
-                )
+            # The snapshot carries results as stored: artifact handles, not media
+            yield format_sse('snapshot', execution)
+            if execution['status'] in TERMINAL_EXECUTION_STATUSES:
+                return
+            
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=EXECUTION_EVENT_HEARTBEAT)
+                except asyncio.TimeoutError:
+                    # Also covers executions finished by another process, whose events never reach this bus
+                    current = await db.workflow_executions.find_one(
+                        {"id": execution_id},
+                        {"_id": 0, "status": 1, "progress": 1, "error": 1}
+                    )
+                    if not current or current['status'] in TERMINAL_EXECUTION_STATUSES:
+                        yield format_sse('status', {"type": "status", "execution_id": execution_id, **(current or {"status": "failed"})})
+                        return
+                    yield ": keep-alive\n\n"
+                    continue
+                
+                yield format_sse(event['type'], event)
+                if event['type'] == 'status' and event['status'] in TERMINAL_EXECUTION_STATUSES:
+                    return
+        finally:
+            execution_events.unsubscribe(execution_id, queue)
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@api_router.get("/workflows/executions/{execution_id}/profile")
+async def get_execution_profile(
+    execution_id: str,
+    output: str = Query("json", alias="format"),
+    user_id: str = Depends(get_current_user)
+):
+    """Per-node timing breakdown and critical path of an execution (format=text for a plain-text table)"""
+    execution = await db.workflow_executions.find_one(
+        {"id": execution_id, "user_id": user_id},
+        {"_id": 0, "id": 1, "status": 1, "duration": 1, "node_spans": 1, "reused_nodes": 1}
+    )
+    if not execution:
+        raise HTTPException(status_code=404, detail="Execution not found")
+    
+    profile = execution_profile(execution)
+    if output == 'text':
+        return Response(content=render_execution_profile(profile), media_type="text/plain")
+    return profile
+
+@api_router.delete("/workflows/node-cache")
+async def clear_node_cache(user_id: str = Depends(get_current_user)):
+    entries = await db.node_result_cache.find(
+        {"user_id": user_id},
+        {"_id": 0, "user_id": 1, "cache_key": 1, "artifact_hashes": 1}
+    ).to_list(length=None)
+    for entry in entries:
+        await evict_node_cache_entry(entry)
+    return {"message": "Node cache cleared", "entries_removed": len(entries)}
+
+@api_router.delete("/workflows/executions/{execution_id}")
+async def delete_execution(execution_id: str, user_id: str = Depends(get_current_user)):
+    execution = await db.workflow_executions.find_one(
+        {"id": execution_id, "user_id": user_id},
+        {"_id": 0, "status": 1, "blob_refs": 1}
+    )
+    if not execution:
+        raise HTTPException(status_code=404, detail="Execution not found")
+    if execution['status'] in ('queued', 'running'):
+        raise HTTPException(status_code=409, detail="Execution is still running")
+
+    await db.workflow_executions.delete_one({"id": execution_id, "user_id": user_id})
+    await release_artifacts(execution.get('blob_refs', []))
+    return {"message": "Execution deleted successfully"}
+
+@api_router.get("/workflows/artifacts/{artifact_hash}")
+async def get_workflow_artifact(artifact_hash: str, user_id: str = Depends(get_current_user)):
+    # Only serve artifacts referenced by one of the user's executions
+    if not await db.workflow_executions.count_documents({"user_id": user_id, "blob_refs": artifact_hash}, limit=1):
+        raise HTTPException(status_code=404, detail="Artifact not found")
+    artifact = await db.workflow_artifacts.find_one({"hash": artifact_hash}, {"_id": 0})
+    path = blob_path(artifact_hash)
+    if not artifact or not path.exists():
+        raise HTTPException(status_code=404, detail="Artifact not found")
+    return FileResponse(path, media_type=artifact.get('mime') or 'application/octet-stream')
+
+# ============ WORKFLOW BATCHES ============
+
+# A batch runs one workflow once per input row. Each row becomes an ordinary execution whose
+# inputs feed the start node and fill `{{field}}` placeholders in node settings. Rows of all
+# batches share one budget of concurrently running executions, so a large batch is paced by
+# provider quota instead of flooding it; pending rows only get an execution once a slot frees.
+WORKFLOW_BATCH_CONCURRENCY = int(os.environ.get('WORKFLOW_BATCH_CONCURRENCY', '4'))
+WORKFLOW_BATCH_MAX_ROWS = int(os.environ.get('WORKFLOW_BATCH_MAX_ROWS', '1000'))
+WORKFLOW_INPUT_PLACEHOLDER = re.compile(r"\{\{\s*([\w-]+)\s*\}\}")
+
+batch_execution_slots = asyncio.Semaphore(WORKFLOW_BATCH_CONCURRENCY)
+
+# Background tasks of batches running in this process, by batch id
+_batch_tasks: Dict[str, asyncio.Task] = {}
+
+class WorkflowBatchRequest(BaseModel):
+    rows: Optional[List[Dict[str, Any]]] = None  # Inline input rows...
+    file_id: Optional[str] = None  # ...or an uploaded CSV file, one row per line
+    concurrency: Optional[int] = None  # Cap for this batch, within the global budget
+    deadline_seconds: Optional[float] = None  # Per row execution; see ExecutionStartRequest
+
+def normalize_input_row(row: Dict[str, Any]) -> Dict[str, Any]:
+    """Field names usable as `{{field}}` placeholders (and as Mongo keys): 'Product Name' -> 'Product_Name'"""
+    normalized = {}
+    for key, value in row.items():
+        field = re.sub(r"[^\w-]+", "_", str(key or '').strip()).strip('_')
+        if field:
+            normalized[field] = value
+    return normalized
+
+def render_input_placeholders(value: Any, inputs: Dict[str, Any]) -> Any:
+    """Fill `{{field}}` placeholders in node settings from an execution's inputs; unknown fields are kept"""
+    if isinstance(value, str):
+        return WORKFLOW_INPUT_PLACEHOLDER.sub(
+            lambda match: str(inputs[match.group(1)]) if match.group(1) in inputs else match.group(0),
+            value
+        )
+    if isinstance(value, dict):
+        return {key: render_input_placeholders(item, inputs) for key, item in value.items()}
+    if isinstance(value, list):
+        return [render_input_placeholders(item, inputs) for item in value]
+    return value
+
+async def load_batch_rows(request: WorkflowBatchRequest, user_id: str) -> List[Dict[str, Any]]:
+    if request.file_id:
+        file_doc = await db.uploaded_files.find_one({"id": request.file_id, "user_id": user_id}, {"_id": 0})
+        if not file_doc:
+            raise HTTPException(status_code=404, detail="File not found")
+        if tabular_format(file_doc) != 'csv':
+            raise HTTPException(status_code=400, detail="Batch input files must be CSV")
+        text = (await read_uploaded_file_text(file_doc)).lstrip('\ufeff')
+        rows = [row for row in csv.DictReader(io.StringIO(text)) if any((value or '').strip() for value in row.values())]
+    else:
+        rows = request.rows or []
+    
+    if not rows:
+        raise HTTPException(status_code=400, detail="Provide input rows or a CSV file with at least one row")
+    if len(rows) > WORKFLOW_BATCH_MAX_ROWS:
+        raise HTTPException(status_code=400, detail=f"At most {WORKFLOW_BATCH_MAX_ROWS} rows can be run per batch")
+    if not all(isinstance(row, dict) for row in rows):
+        raise HTTPException(status_code=400, detail="Each row must be an object of input fields")
+    return [normalize_input_row(row) for row in rows]
+
+@api_router.post("/workflows/{workflow_id}/batch")
+async def run_workflow_batch(workflow_id: str, request: WorkflowBatchRequest, user_id: str = Depends(get_current_user)):
+    """Run a workflow once per input row, a bounded number of rows at a time"""
+    workflow = await db.workflows.find_one({"id": workflow_id, "user_id": user_id}, {"_id": 0})
+    if not workflow:
+        raise HTTPException(status_code=404, detail="Workflow not found")
+    
+    rows = await load_batch_rows(request, user_id)
+    plan = await workflow_execution_plan(workflow)
+    concurrency = min(max(1, request.concurrency or WORKFLOW_BATCH_CONCURRENCY), WORKFLOW_BATCH_CONCURRENCY)
+    
+    batch = {
+        "id": str(uuid.uuid4()),
+        "workflow_id": workflow_id,
+        "workflow_name": workflow.get('name', 'Unnamed Workflow'),
+        "user_id": user_id,
+        "status": "running",
+        "concurrency": concurrency,
+        "total": len(rows),
+        "counts": {"pending": len(rows), "running": 0, "completed": 0, "failed": 0, "cancelled": 0},
+        # Results of these nodes (the ones nothing runs after) are what the export reports per row
+        "output_nodes": [node_id for node_id in plan['order'] if not plan['children'][node_id]],
+        "rows": [{"index": index, "inputs": row, "status": "pending"} for index, row in enumerate(rows)],
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "completed_at": None,
+        **worker_lease_fields()
+    }
+    await db.workflow_batches.insert_one(dict(batch))
+    
+    task = asyncio.create_task(run_batch_rows(batch['id'], workflow, user_id, plan, rows, concurrency, request.deadline_seconds))
+    _batch_tasks[batch['id']] = task
+    task.add_done_callback(lambda _: _batch_tasks.pop(batch['id'], None))
+    logging.info(f"[BATCH] Started batch {batch['id']} of workflow {workflow_id}: {len(rows)} rows, {concurrency} at a time")
+    
+    return {"batch_id": batch['id'], "workflow_id": workflow_id, "status": "running", "total": len(rows)}
+
+async def run_batch_rows(
+    batch_id: str,
+    workflow: Dict[str, Any],
+    user_id: str,
+    plan: Dict[str, Any],
+    rows: List[Dict[str, Any]],
+    concurrency: int,
+    deadline_seconds: Optional[float] = None
+):
+    """Run a batch's rows as executions and keep the batch record's row statuses and counts current"""
+    semaphore = asyncio.Semaphore(concurrency)
+    
+    async def run_row(index: int, row: Dict[str, Any]) -> str:
+        async with semaphore, batch_execution_slots:
+            # A cancelled batch starts no further rows
+            if await db.workflow_batches.count_documents({"id": batch_id, "cancel_requested_at": {"$ne": None}}, limit=1):
+                await db.workflow_batches.update_one(
+                    {"id": batch_id},
+                    {"$set": {f"rows.{index}.status": "cancelled"}, "$inc": {"counts.pending": -1, "counts.cancelled": 1}}
+                )
+                return 'cancelled'
+            try:
+                execution = await create_workflow_execution(
+                    workflow, user_id, plan,
+                    inputs=row,
+                    deadline_seconds=deadline_seconds,
+                    batch_id=batch_id
+                )
+            except Exception as e:
+                logging.error(f"[BATCH] Row {index} of batch {batch_id} could not be started: {str(e)}")
+                await db.workflow_batches.update_one(
+                    {"id": batch_id},
+                    {
+                        "$set": {f"rows.{index}.status": "failed", f"rows.{index}.error": f"Execution could not be started: {str(e)}"},
+                        "$inc": {"counts.pending": -1, "counts.failed": 1}
+                    }
+                )
+                return 'failed'
+            await db.workflow_batches.update_one(
+                {"id": batch_id},
+                {
+                    "$set": {f"rows.{index}.status": "running", f"rows.{index}.execution_id": execution.id},
+                    "$inc": {"counts.pending": -1, "counts.running": 1}
+                }
+            )
+            task = _execution_tasks.get(execution.id)
+            if task:
+                await asyncio.wait([task])
+        
+        finished = await db.workflow_executions.find_one({"id": execution.id}, {"_id": 0, "status": 1, "error": 1}) or {}
+        outcome = finished.get('status') if finished.get('status') in ('completed', 'cancelled') else 'failed'
+        await db.workflow_batches.update_one(
+            {"id": batch_id},
+            {
+                "$set": {f"rows.{index}.status": outcome, f"rows.{index}.error": finished.get('error')},
+                "$inc": {"counts.running": -1, f"counts.{outcome}": 1}
+            }
+        )
+        return outcome
+    
+    outcomes = await asyncio.gather(*(run_row(index, row) for index, row in enumerate(rows)), return_exceptions=True)
+    completed = sum(1 for outcome in outcomes if outcome == 'completed')
+    for outcome in outcomes:
+        if isinstance(outcome, Exception):
+            logging.error(f"[BATCH] Row of batch {batch_id} could not be run: {outcome}")
+    
+    if await db.workflow_batches.count_documents({"id": batch_id, "cancel_requested_at": {"$ne": None}}, limit=1):
+        final_status = 'cancelled'
+    else:
+        final_status = 'completed' if completed == len(rows) else 'failed' if not completed else 'partial'
+    await db.workflow_batches.update_one(
+        {"id": batch_id},
+        {"$set": {"status": final_status, "completed_at": datetime.now(timezone.utc).isoformat()}}
+    )
+    logging.info(f"[BATCH] Batch {batch_id} finished: {completed}/{len(rows)} rows completed")
+
+@api_router.post("/workflows/batches/{batch_id}/cancel")
+async def cancel_workflow_batch(batch_id: str, user_id: str = Depends(get_current_user)):
+    """Stop a batch: pending rows never start and running rows' executions are cancelled"""
+    flagged = await db.workflow_batches.update_one(
+        {"id": batch_id, "user_id": user_id, "status": "running"},
+        {"$set": {"cancel_requested_at": datetime.now(timezone.utc).isoformat()}}
+    )
+    if not flagged.matched_count:
+        batch = await db.workflow_batches.find_one({"id": batch_id, "user_id": user_id}, {"_id": 0, "status": 1})
+        if not batch:
+            raise HTTPException(status_code=404, detail="Batch not found")
+        raise HTTPException(status_code=409, detail=f"Batch already {batch['status']}")
+    
+    running = await db.workflow_executions.find(
+        {"batch_id": batch_id, "status": {"$in": ['queued', 'running']}},
+        {"_id": 0, "id": 1}
+    ).to_list(length=None)
+    await asyncio.gather(*(request_execution_cancel(execution['id']) for execution in running))
+    return {"batch_id": batch_id, "status": "cancelling", "executions_cancelled": len(running)}
+
+@api_router.get("/workflows/batches")
+async def get_workflow_batches(user_id: str = Depends(get_current_user)):
+    return await db.workflow_batches.find(
+        {"user_id": user_id},
+        {"_id": 0, "rows": 0}
+    ).sort("created_at", -1).limit(50).to_list(length=50)
+
+@api_router.get("/workflows/batches/{batch_id}")
+async def get_workflow_batch(batch_id: str, user_id: str = Depends(get_current_user)):
+    batch = await db.workflow_batches.find_one({"id": batch_id, "user_id": user_id}, {"_id": 0})
+    if not batch:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    return batch
+
+@api_router.get("/workflows/batches/{batch_id}/export")
+async def export_workflow_batch(
+    batch_id: str,
+    output: str = Query("ndjson", alias="format"),
+    user_id: str = Depends(get_current_user)
+):
+    """Stream one record per row (inputs, status and the output nodes' results) as NDJSON or CSV.
+    
+    Media in results is exported as artifact handles, downloadable from /workflows/artifacts/{hash}.
+    """
+    if output not in ('ndjson', 'csv'):
+        raise HTTPException(status_code=400, detail="Format must be ndjson or csv")
+    batch = await db.workflow_batches.find_one({"id": batch_id, "user_id": user_id}, {"_id": 0})
+    if not batch:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    
+    input_fields = list(dict.fromkeys(field for row in batch['rows'] for field in row['inputs']))
+    
+    async def export_records():
+        page_size = 100
+        for start in range(0, len(batch['rows']), page_size):
+            page = batch['rows'][start:start + page_size]
+            execution_ids = [row['execution_id'] for row in page if row.get('execution_id')]
+            executions = {
+                execution['id']: execution
+                async for execution in db.workflow_executions.find(
+                    {"id": {"$in": execution_ids}},
+                    {"_id": 0, "id": 1, "status": 1, "error": 1, "duration": 1, "results": 1}
+                )
+            }
+            for row in page:
+                execution = executions.get(row.get('execution_id'), {})
+                results = execution.get('results', {})
+                yield {
+                    "index": row['index'],
+                    "status": execution.get('status', row['status']),
+                    "execution_id": row.get('execution_id'),
+                    "error": execution.get('error', row.get('error')),
+                    "duration": execution.get('duration'),
+                    "inputs": row['inputs'],
+                    "outputs": {node_id: results[node_id] for node_id in batch['output_nodes'] if node_id in results}
+                }
+    
+    async def stream_ndjson():
+        async for record in export_records():
+            yield json_lib.dumps(record, default=str) + "\n"
+    
+    async def stream_csv():
+        columns = ["index", "status", "execution_id", "error", "duration"]
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(columns + input_fields + ["outputs"])
+        async for record in export_records():
+            writer.writerow(
+                [record[column] for column in columns]
+                + [record['inputs'].get(field, '') for field in input_fields]
+                + [json_lib.dumps(record['outputs'], default=str)]
+            )
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    
+    filename = f"batch-{batch_id}.{output}"
+    return StreamingResponse(
+        stream_ndjson() if output == 'ndjson' else stream_csv(),
+        media_type="application/x-ndjson" if output == 'ndjson' else "text/csv",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+# ============ INTEGRATIONS ENDPOINTS ============
+
+class IntegrationConfig(BaseModel):
+    apiKey: Optional[str] = None
+    accountSid: Optional[str] = None
+    authToken: Optional[str] = None
+
+@api_router.get("/integrations")
+async def get_integrations(user_id: str = Depends(get_current_user)):
+    """Get user's integration configurations"""
+    logging.info(f"[INTEGRATIONS] Getting integrations for user: {user_id}")
+    user = await db.users.find_one({"id": user_id}, {"_id": 0, "integrations": 1})
+    integrations = user.get("integrations", {}) if user else {}
+    logging.info(f"[INTEGRATIONS] Found integrations: {list(integrations.keys())}")
+    return integrations
+
+@api_router.post("/integrations/{service}")
+async def save_integration(service: str, config: IntegrationConfig, user_id: str = Depends(get_current_user)):
+    """Save integration configuration for a service"""
+    
+    # Validate the API key/credentials before saving
+    if service == "elevenlabs":
+        try:
+            # Test the API key by fetching available voices
+            test_url = "https://api.elevenlabs.io/v1/voices"
+            test_headers = {"xi-api-key": config.apiKey}
+            
+            response = requests.get(test_url, headers=test_headers, timeout=10)
+            
+            if response.status_code != 200:
+                logging.error(f"ElevenLabs API key validation failed: {response.status_code} - {response.text}")
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"Invalid ElevenLabs API key. Please check your key and try again."
+                )
             
             logging.info(f"ElevenLabs API key validated successfully for user {user_id}")
             
@@ -4173,7 +5754,6 @@ async def voice_chat_with_agent(agent_id: str, voice_data: dict, user_id: str =
         
         from emergentintegrations.llm.openai import OpenAISpeechToText
         from dotenv import load_dotenv
-        import tempfile
         import os as os_module
         
         load_dotenv()
@@ -4193,84 +5773,66 @@ async def voice_chat_with_agent(agent_id: str, voice_data: dict, user_id: str =
         audio_bytes = base64.b64decode(audio_base64)
         logging.info(f"[CONVERSATIONAL_AI] Audio decoded: {len(audio_bytes)} bytes")
         
-        # Save original audio to temp file
-        with tempfile.NamedTemporaryFile(suffix='.webm', delete=False) as temp_audio:
-            temp_audio.write(audio_bytes)
-            temp_input_path = temp_audio.name
-        
-        logging.info(f"[CONVERSATIONAL_AI] Audio saved to: {temp_input_path}")
-        
-        # Convert to WAV using FFmpeg (Whisper works best with WAV)
-        temp_output_path = temp_input_path.replace('.webm', '.wav')
-        
-        logging.info(f"[CONVERSATIONAL_AI] Converting audio to WAV using FFmpeg...")
-        
-        import subprocess
-        
         # Skip FFmpeg if file is too small (likely empty/corrupted)
         if len(audio_bytes) < 1000:
             logging.warning(f"[CONVERSATIONAL_AI] ⚠️ Audio too small ({len(audio_bytes)} bytes), skipping FFmpeg")
             raise Exception(f"Audio file too small: {len(audio_bytes)} bytes. Please speak longer and louder.")
         
-        try:
-            # Convert using ffmpeg - hide banner and loglevel
-            result = subprocess.run([
-                'ffmpeg', '-hide_banner', '-loglevel', 'error',
-                '-i', temp_input_path,
-                '-ar', '16000',  # 16kHz sample rate (good for speech)
-                '-ac', '1',       # Mono
-                '-f', 'wav',      # Force WAV format
-                '-y',             # Overwrite output
-                temp_output_path
-            ], capture_output=True, text=True, timeout=30)
+        # The recording and its WAV conversion live in a scratch directory removed after transcription
+        async with media_pool.scratch_dir() as scratch_dir:
+            temp_input_path = str(scratch_dir / 'input.webm')
+            with open(temp_input_path, 'wb') as temp_audio:
+                temp_audio.write(audio_bytes)
+            
+            logging.info(f"[CONVERSATIONAL_AI] Audio saved to: {temp_input_path}")
+            
+            # Convert to WAV using FFmpeg (Whisper works best with WAV)
+            temp_audio_path = str(scratch_dir / 'input.wav')
             
-            if result.returncode == 0 and os_module.path.exists(temp_output_path):
-                wav_size = os_module.path.getsize(temp_output_path)
+            logging.info(f"[CONVERSATIONAL_AI] Converting audio to WAV using FFmpeg...")
+            
+            try:
+                # Convert using ffmpeg - hide loglevel noise
+                await media_pool.run([
+                    '-loglevel', 'error',
+                    '-i', temp_input_path,
+                    '-ar', '16000',  # 16kHz sample rate (good for speech)
+                    '-ac', '1',       # Mono
+                    '-f', 'wav',      # Force WAV format
+                    '-y',             # Overwrite output
+                    temp_audio_path
+                ], tag='CONVERSATIONAL_AI', timeout=30)
+                
+                wav_size = os_module.path.getsize(temp_audio_path)
                 logging.info(f"[CONVERSATIONAL_AI] ✅ FFmpeg conversion successful")
                 logging.info(f"[CONVERSATIONAL_AI] Input: {len(audio_bytes)} bytes → Output: {wav_size} bytes")
                 
-                if wav_size > 1000:  # Valid WAV file
-                    temp_audio_path = temp_output_path
-                else:
+                if wav_size <= 1000:  # Not a valid WAV file
                     logging.error(f"[CONVERSATIONAL_AI] ❌ Converted file too small: {wav_size} bytes")
                     raise Exception("FFmpeg produced invalid audio file")
-            else:
-                logging.error(f"[CONVERSATIONAL_AI] ❌ FFmpeg failed (code {result.returncode})")
-                logging.error(f"[CONVERSATIONAL_AI] STDERR: {result.stderr}")
-                logging.error(f"[CONVERSATIONAL_AI] STDOUT: {result.stdout}")
-                raise Exception(f"FFmpeg conversion failed: {result.stderr}")
-                
-        except Exception as ffmpeg_error:
-            logging.error(f"[CONVERSATIONAL_AI] ❌ FFmpeg error: {str(ffmpeg_error)}")
-            raise Exception(f"Audio conversion failed: {str(ffmpeg_error)}")
-        
-        try:
-            # Transcribe audio
-            logging.info(f"[CONVERSATIONAL_AI] Calling Whisper API...")
-            with open(temp_audio_path, 'rb') as audio_file:
-                transcription = await stt.transcribe(
-                    file=audio_file,
-                    model="whisper-1",
-                    response_format="json"
-                )
-            
-            user_message = transcription.text
-            logging.info(f"[CONVERSATIONAL_AI] ✅ Transcribed successfully: {user_message[:100]}")
+                    
+            except Exception as ffmpeg_error:
+                logging.error(f"[CONVERSATIONAL_AI] ❌ FFmpeg error: {str(ffmpeg_error)}")
+                raise Exception(f"Audio conversion failed: {str(ffmpeg_error)}")
             
-        except Exception as whisper_error:
-            logging.error(f"[CONVERSATIONAL_AI] ❌ Whisper transcription failed: {str(whisper_error)}")
-            import traceback
-            logging.error(traceback.format_exc())
-            raise
-        finally:
-            # Clean up temp files
             try:
-                if 'temp_input_path' in locals():
-                    os_module.unlink(temp_input_path)
-                if 'temp_output_path' in locals() and os_module.path.exists(temp_output_path):
-                    os_module.unlink(temp_output_path)
-            except Exception as cleanup_error:
-                logging.warning(f"[CONVERSATIONAL_AI] Cleanup error: {str(cleanup_error)}")
+                # Transcribe audio
+                logging.info(f"[CONVERSATIONAL_AI] Calling Whisper API...")
+                with open(temp_audio_path, 'rb') as audio_file:
+                    transcription = await stt.transcribe(
+                        file=audio_file,
+                        model="whisper-1",
+                        response_format="json"
+                    )
+                
+                user_message = transcription.text
+                logging.info(f"[CONVERSATIONAL_AI] ✅ Transcribed successfully: {user_message[:100]}")
+                
+            except Exception as whisper_error:
+                logging.error(f"[CONVERSATIONAL_AI] ❌ Whisper transcription failed: {str(whisper_error)}")
+                import traceback
+                logging.error(traceback.format_exc())
+                raise
         
         # Step 2: Get LLM response using LlmChat
         logging.info(f"[CONVERSATIONAL_AI] ===== STEP 2: LLM CHAT =====")
@@ -5006,6 +6568,7 @@ async def update_workflow(workflow_id: str, workflow: WorkflowCreate, user_id: s
         "edges": [edge.model_dump() for edge in workflow.edges],
         "updated_at": datetime.now(timezone.utc).isoformat()
     }
+    update_doc.update(compiled_workflow_fields(update_doc))
     
     await db.workflows.update_one(
         {"id": workflow_id, "user_id": user_id},
@@ -5021,146 +6584,2317 @@ async def delete_workflow(workflow_id: str, user_id: str = Depends(get_current_u
         raise HTTPException(status_code=404, detail="Workflow not found")
     return {"message": "Workflow deleted successfully"}
 
-class WorkflowExecution(BaseModel):
-    model_config = ConfigDict(extra="ignore")
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
-    workflow_id: str
-    workflow_name: str
-    user_id: str
-    status: str  # 'running', 'completed', 'failed'
-    progress: int = 0
-    current_node: Optional[str] = None
-    started_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
-    completed_at: Optional[datetime] = None
-    duration: Optional[int] = None  # milliseconds
-    execution_log: List[str] = []
-    results: Dict[str, Any] = {}
-    error: Optional[str] = None
+# ============ EXECUTION PROFILING ============
 
-# Execution routes moved above to avoid route conflicts
+# Every node an execution runs gets a span: when it became runnable, started and ended, how long
+# it waited on providers (Sora, ElevenLabs, LLMs, HTTP) vs ran ffmpeg, the size of its input
+# and output, whether its result came from the cache and how many provider requests were
+# retried. Provider and media helpers report into the span of the node that called them through
+# a context variable; loop items run inside their loop node's span, so a loop's provider and
+# media times add up across items and can exceed its duration.
+current_node_span: contextvars.ContextVar[Optional[Dict[str, Any]]] = contextvars.ContextVar('current_node_span', default=None)
 
-@api_router.post("/workflows/{workflow_id}/execute")
-async def execute_workflow(workflow_id: str, user_id: str = Depends(get_current_user)):
-    workflow = await db.workflows.find_one({"id": workflow_id, "user_id": user_id}, {"_id": 0})
-    if not workflow:
-        raise HTTPException(status_code=404, detail="Workflow not found")
+def new_node_span(node_type: str, parents: List[str], queued_at: datetime) -> Dict[str, Any]:
+    return {
+        "node_type": node_type,
+        "parents": parents,
+        "queued_at": queued_at.isoformat(),
+        "started_at": datetime.now(timezone.utc).isoformat(),
+        "ended_at": None,
+        "provider_ms": 0,
+        "media_ms": 0,
+        "media_queue_ms": 0,
+        "retries": 0
+    }
+
+@contextlib.contextmanager
+def span_timer(kind: str):
+    """Add the time spent in the block to the calling node's `<kind>_ms` (nothing outside an execution)"""
+    span = current_node_span.get()
+    started = time.monotonic()
+    try:
+        yield
+    finally:
+        if span is not None:
+            span[f"{kind}_ms"] += int((time.monotonic() - started) * 1000)
+
+def count_span_retry(span: Optional[Dict[str, Any]] = None):
+    span = span if span is not None else current_node_span.get()
+    if span is not None:
+        span['retries'] += 1
+
+def payload_bytes(value: Any) -> int:
+    """Approximate size of a node input or result: artifacts and blobs by their stored size, the rest as text"""
+    if isinstance(value, dict):
+        if isinstance(value.get('size_bytes'), int) and ('artifact' in value or 'blob' in value):
+            return value['size_bytes']
+        return sum(len(str(key)) + payload_bytes(item) for key, item in value.items())
+    if isinstance(value, list):
+        return sum(payload_bytes(item) for item in value)
+    if isinstance(value, str):
+        return len(value.encode('utf-8'))
+    return 0 if value is None else len(str(value))
+
+def execution_profile(execution: Dict[str, Any]) -> Dict[str, Any]:
+    """Per-node breakdown and critical path of an execution, from its node spans.
     
-    # Create execution record
-    execution = WorkflowExecution(
-        workflow_id=workflow_id,
-        workflow_name=workflow.get('name', 'Unnamed Workflow'),
-        user_id=user_id,
-        status='running'
-    )
-    await db.workflow_executions.insert_one(execution.model_dump())
+    The critical path starts at the node that finished last and walks back through the parent
+    that finished last each time: the chain of nodes the execution actually waited on.
+    """
+    spans = {node_id: span for node_id, span in (execution.get('node_spans') or {}).items() if span.get('ended_at')}
+    times = {
+        node_id: {key: datetime.fromisoformat(span[key]) for key in ('queued_at', 'started_at', 'ended_at')}
+        for node_id, span in spans.items()
+    }
     
-    # Store execution_id for use in nested function scope
-    execution_id = execution.id
+    def elapsed_ms(start: datetime, end: datetime) -> int:
+        return max(0, int((end - start).total_seconds() * 1000))
     
-    # Build execution graph
-    nodes_dict = {node['id']: node for node in workflow['nodes']}
-    edges_dict = {}
-    for edge in workflow['edges']:
-        source = edge['source']
-        if source not in edges_dict:
-            edges_dict[source] = []
-        edges_dict[source].append(edge['target'])
+    nodes = []
+    for node_id in sorted(spans, key=lambda node_id: times[node_id]['started_at']):
+        span = spans[node_id]
+        duration = elapsed_ms(times[node_id]['started_at'], times[node_id]['ended_at'])
+        nodes.append({
+            "node_id": node_id,
+            "node_type": span['node_type'],
+            "queued_at": span['queued_at'],
+            "started_at": span['started_at'],
+            "ended_at": span['ended_at'],
+            "queue_ms": elapsed_ms(times[node_id]['queued_at'], times[node_id]['started_at']),
+            "duration_ms": duration,
+            "provider_ms": span['provider_ms'],
+            "media_ms": span['media_ms'],
+            "media_queue_ms": span['media_queue_ms'],
+            # Our own work: Python, Mongo, artifact writes
+            "other_ms": max(0, duration - span['provider_ms'] - span['media_ms'] - span['media_queue_ms']),
+            "input_bytes": span.get('input_bytes', 0),
+            "output_bytes": span.get('output_bytes', 0),
+            "cache_hit": span.get('cache_hit', False),
+            "retries": span['retries']
+        })
+    by_id = {node['node_id']: node for node in nodes}
     
-    # Find start node
-    start_nodes = [node for node in workflow['nodes'] if node['type'] == 'start']
-    if not start_nodes:
-        raise HTTPException(status_code=400, detail="Workflow must have a start node")
+    critical_path = []
+    current = max(spans, key=lambda node_id: times[node_id]['ended_at']) if spans else None
+    while current:
+        critical_path.append(current)
+        parents = [parent for parent in spans[current].get('parents', []) if parent in spans]
+        current = max(parents, key=lambda parent: times[parent]['ended_at']) if parents else None
+    critical_path.reverse()
     
-    # Execute workflow
-    results = {}
-    execution_log = []
-    total_nodes = len(workflow['nodes'])
-    completed_nodes = 0
+    by_type: Dict[str, Dict[str, int]] = {}
+    for node in nodes:
+        totals = by_type.setdefault(node['node_type'], {"nodes": 0, "duration_ms": 0, "provider_ms": 0, "media_ms": 0})
+        totals['nodes'] += 1
+        for key in ('duration_ms', 'provider_ms', 'media_ms'):
+            totals[key] += node[key]
     
-    async def execute_node(node_id: str, input_data: Any = None):
-        node = nodes_dict.get(node_id)
-        if not node:
-            return None
-        
-        node_type = node['type']
-        node_data = node['data']
-        
-        execution_log.append(f"Executing {node_type} node: {node_id}")
-        
+    return {
+        "execution_id": execution['id'],
+        "status": execution.get('status'),
+        "duration_ms": execution.get('duration'),
+        "critical_path": [
+            {key: by_id[node_id][key] for key in ('node_id', 'node_type', 'queue_ms', 'duration_ms', 'provider_ms', 'media_ms')}
+            for node_id in critical_path
+        ],
+        "critical_path_ms": sum(by_id[node_id]['queue_ms'] + by_id[node_id]['duration_ms'] for node_id in critical_path),
+        "nodes": nodes,
+        "by_type": by_type,
+        "reused_nodes": execution.get('reused_nodes', [])
+    }
+
+def render_execution_profile(profile: Dict[str, Any]) -> str:
+    """Plain-text table of a profile, critical path nodes marked with *"""
+    on_path = {node['node_id'] for node in profile['critical_path']}
+    lines = [
+        f"Execution {profile['execution_id']} ({profile['status']}), {profile['duration_ms'] or 0} ms; "
+        f"critical path {profile['critical_path_ms']} ms: {' -> '.join(node['node_id'] for node in profile['critical_path']) or '-'}",
+        "",
+        f"  {'node':<28} {'type':<14} {'queue':>8} {'total':>8} {'provider':>9} {'media':>8} {'other':>8} {'in':>10} {'out':>10}  cache retries"
+    ]
+    for node in profile['nodes']:
+        lines.append(
+            f"{'*' if node['node_id'] in on_path else ' '} {node['node_id'][:28]:<28} {node['node_type'][:14]:<14} "
+            f"{node['queue_ms']:>8} {node['duration_ms']:>8} {node['provider_ms']:>9} {node['media_ms']:>8} {node['other_ms']:>8} "
+            f"{node['input_bytes']:>10} {node['output_bytes']:>10}  {'hit' if node['cache_hit'] else '-':<5} {node['retries']:>7}"
+        )
+    return "\n".join(lines) + "\n"
+
+# ============ MEDIA PROCESSING ============
+
+# ffmpeg jobs run as async subprocesses through one pool, so encodes never block the event loop
+# and at most MEDIA_MAX_PROCESSES of them compete for the CPU; further jobs queue in order.
+MEDIA_MAX_PROCESSES = int(os.environ.get('MEDIA_MAX_PROCESSES', str(max(1, (os.cpu_count() or 2) // 2))))
+MEDIA_JOB_TIMEOUT = float(os.environ.get('MEDIA_JOB_TIMEOUT', '900'))  # seconds
+MEDIA_SCRATCH_TMPFS = os.environ.get('MEDIA_SCRATCH_TMPFS', '/dev/shm')
+MEDIA_SCRATCH_MIN_FREE = 1024 * 1024 * 1024  # Fall back to disk when the tmpfs has less than 1GB free
+
+class MediaJobError(Exception):
+    pass
+
+class MediaProcessPool:
+    """Bounded pool of ffmpeg subprocesses with per-job timeouts and progress reporting"""
+    
+    def __init__(self, max_processes: int):
+        self.max_processes = max_processes
+        self._slots = asyncio.Semaphore(max_processes)
+        self.queued = 0
+        self.running = 0
+    
+    def scratch_root(self) -> Path:
+        """tmpfs when it has room, so intermediate files never touch the disk"""
         try:
-            if node_type == 'start':
-                result = {"status": "started", "data": input_data}
-            
-            elif node_type == 'gemini':
-                # Execute AI chat node with conversation history and context from previous AI nodes
-                prompt = node_data.get('prompt', 'Hello')
-                model = node_data.get('model', 'gemini-2.5-pro')
-                
-                # Build context from all previous AI responses in this workflow
-                context_history = []
-                audio_specs_found = False
-                
-                for prev_node_id, prev_result in results.items():
-                    if isinstance(prev_result, dict) and 'response' in prev_result and 'model' in prev_result:
-                        # This was an AI node - include its response in context
-                        response_text = prev_result['response']
-                        context_history.append({
-                            'node_id': prev_node_id,
-                            'response': response_text
-                        })
-                        
-                        # Check if this response contains audio/voice specifications
-                        if any(keyword in response_text.upper() for keyword in ['VOICE:', 'SPEAKING:', 'BACKGROUND AUDIO:', 'VOICEOVER']):
-                            audio_specs_found = True
-                
-                # Build enriched prompt with context
-                if context_history:
-                    context_text = "\n\n" + "="*80 + "\n"
-                    context_text += "PREVIOUS AI RESPONSES - USE FOR CONTEXT AND CONTINUITY\n"
-                    context_text += "="*80 + "\n"
-                    
-                    for idx, ctx in enumerate(context_history, 1):
-                        context_text += f"\n--- Previous AI Node {idx} ({ctx['node_id']}) ---\n{ctx['response']}\n"
-                    
-                    context_text += "\n" + "="*80 + "\n"
-                    context_text += "YOUR CURRENT TASK\n"
-                    context_text += "="*80 + "\n\n"
-                    
-                    if audio_specs_found:
-                        enriched_prompt = context_text + prompt + "\n\n[CRITICAL INSTRUCTIONS:\n- If the previous AI specified VOICE/AUDIO characteristics, you MUST use the EXACT SAME specifications for perfect audio continuity\n- Copy voice gender, age, tone, speaking pace, background audio EXACTLY as specified\n- This ensures the same voice and sounds throughout all videos\n- For script continuation, complete the incomplete sentence naturally\n- Maintain visual and narrative continuity as well]"
-                    else:
-                        enriched_prompt = context_text + prompt + "\n\n[Remember: Use the previous AI responses above as context to maintain continuity and coherence in your response.]"
-                else:
-                    enriched_prompt = prompt
+            if shutil.disk_usage(MEDIA_SCRATCH_TMPFS).free >= MEDIA_SCRATCH_MIN_FREE:
+                return Path(MEDIA_SCRATCH_TMPFS) / 'apoe-media'
+        except OSError:
+            pass
+        return BLOB_STORE_DIR / 'tmp' / 'media'
+    
+    @contextlib.asynccontextmanager
+    async def scratch_dir(self):
+        """A private scratch directory, removed with everything in it when the block exits"""
+        root = self.scratch_root()
+        root.mkdir(parents=True, exist_ok=True)
+        path = root / str(uuid.uuid4())
+        path.mkdir()
+        try:
+            yield path
+        finally:
+            await asyncio.to_thread(shutil.rmtree, path, True)
+    
+    async def run(
+        self,
+        args: List[str],
+        tag: str = 'MEDIA',
+        timeout: float = MEDIA_JOB_TIMEOUT,
+        duration: Optional[float] = None,
+        on_progress=None,
+        capture_output: bool = False
+    ) -> Optional[bytes]:
+        """Run ffmpeg with args (everything after 'ffmpeg'), waiting for a free slot first.
+        
+        With the expected output duration, on_progress(fraction) is called as ffmpeg reports
+        progress. With capture_output, whatever ffmpeg writes to stdout (pipe:1) is returned
+        instead. The process is killed when it exceeds timeout or the caller is cancelled.
+        Raises MediaJobError with the tail of ffmpeg's stderr when the job fails.
+        """
+        self.queued += 1
+        try:
+            with span_timer('media_queue'):
+                await self._slots.acquire()
+        finally:
+            self.queued -= 1
+        self.running += 1
+        try:
+            with span_timer('media'):
+                progress_args = [] if capture_output else ['-progress', 'pipe:1']
+                proc = await asyncio.create_subprocess_exec(
+                    'ffmpeg', '-hide_banner', '-nostdin', '-nostats', *progress_args, *args,
+                    stdout=asyncio.subprocess.PIPE,
+                    stderr=asyncio.subprocess.PIPE,
+                    start_new_session=True  # Own process group, so a kill takes any helper processes with it
+                )
+                stderr_tail = deque(maxlen=40)
+                output = bytearray()
                 
-                logging.info(f"[GEMINI] Node {node_id} executing with {len(context_history)} previous AI context(s)")
+                async def read_progress():
+                    if capture_output:
+                        while chunk := await proc.stdout.read(BLOB_CHUNK_SIZE):
+                            output.extend(chunk)
+                        return
+                    # -progress writes key=value blocks; out_time_us is the position reached so far
+                    async for line in proc.stdout:
+                        key, _, value = line.decode(errors='replace').strip().partition('=')
+                        if key == 'out_time_us' and duration and on_progress and value.isdigit():
+                            on_progress(min(int(value) / 1_000_000 / duration, 1.0))
                 
-                # Use execution-specific session to maintain conversation history within workflow
-                chat = LlmChat(
-                    api_key=os.environ.get('EMERGENT_LLM_KEY'),
-                    session_id=f"{workflow_id}_{execution_id}",  # Unique per workflow execution
-                    system_message="You are a helpful AI assistant in an automation workflow. When provided with previous AI responses, use them as context to maintain continuity, consistency, and logical flow in your responses."
-                ).with_model('gemini', model)
+                async def read_stderr():
+                    async for line in proc.stderr:
+                        stderr_tail.append(line.decode(errors='replace').rstrip())
                 
-                user_message = UserMessage(text=enriched_prompt)
-                response = await chat.send_message(user_message)
-                result = {"response": response, "model": model, "original_prompt": prompt}
-            
-            elif node_type == 'http':
-                # Execute HTTP request
-                url = node_data.get('url', '')
-                method = node_data.get('method', 'GET').upper()
+                readers = [asyncio.create_task(read_progress()), asyncio.create_task(read_stderr())]
+                try:
+                    await asyncio.wait_for(proc.wait(), timeout=timeout)
+                    await asyncio.gather(*readers)
+                except asyncio.TimeoutError:
+                    logging.error(f"[{tag}] ffmpeg timed out after {int(timeout)}s; killing it")
+                    raise MediaJobError(f"ffmpeg timed out after {int(timeout)} seconds")
+                finally:
+                    if proc.returncode is None:
+                        try:
+                            os.killpg(proc.pid, signal.SIGKILL)
+                        except ProcessLookupError:
+                            pass
+                        await proc.wait()
+                    for reader in readers:
+                        reader.cancel()
+                    await asyncio.gather(*readers, return_exceptions=True)
+        finally:
+            self.running -= 1
+            self._slots.release()
+        
+        if proc.returncode != 0:
+            stderr = '\n'.join(stderr_tail)
+            logging.error(f"[{tag}] ffmpeg failed with code {proc.returncode}: {stderr}")
+            raise MediaJobError(f"ffmpeg failed: {stderr}")
+        return bytes(output) if capture_output else None
+
+media_pool = MediaProcessPool(MEDIA_MAX_PROCESSES)
+
+# ============ VIDEO STITCHING ============
+
+# Clips that share codec parameters (consecutive Sora clips nearly always do) are joined with the
+# concat demuxer and stream copy; only the audio, normalized and crossfaded, is encoded. Anything
+# else is scaled to the first clip's format and re-encoded.
+STITCH_AUDIO_FADE = 0.25  # seconds faded out and back in at each join
+STITCH_LOUDNORM = 'loudnorm=I=-16:LRA=11:TP=-1.5'
+STITCH_VIDEO_KEYS = ('codec_name', 'profile', 'width', 'height', 'pix_fmt', 'r_frame_rate')
+
+async def probe_media_streams(path: str) -> Optional[Dict[str, Any]]:
+    """Duration plus the first video and audio stream of a media file, or None when ffprobe cannot read it"""
+    try:
+        proc = await asyncio.create_subprocess_exec(
+            'ffprobe', '-v', 'error',
+            '-show_entries',
+            'stream=codec_type,codec_name,profile,width,height,pix_fmt,r_frame_rate,sample_rate,channels:format=duration',
+            '-of', 'json',
+            path,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL
+        )
+        with span_timer('media'):
+            stdout, _ = await proc.communicate()
+        probe = json_lib.loads(stdout.decode() or '{}')
+    except (OSError, ValueError):
+        return None
+    
+    streams = probe.get('streams') or []
+    if not streams:
+        return None
+    try:
+        duration = float(probe.get('format', {}).get('duration'))
+    except (TypeError, ValueError):
+        duration = None
+    return {
+        "duration": duration,
+        "video": next((stream for stream in streams if stream.get('codec_type') == 'video'), None),
+        "audio": next((stream for stream in streams if stream.get('codec_type') == 'audio'), None)
+    }
+
+def stitch_stream_copy_compatible(probes: List[Optional[Dict[str, Any]]]) -> bool:
+    """Whether the clips' video streams can be concatenated without re-encoding"""
+    if any(probe is None or probe['video'] is None or not probe['duration'] for probe in probes):
+        return False
+    first = probes[0]['video']
+    return all(
+        all(probe['video'].get(key) == first.get(key) for key in STITCH_VIDEO_KEYS)
+        for probe in probes[1:]
+    )
+
+def stitch_audio_filters(probes: List[Optional[Dict[str, Any]]], first_input: int) -> Tuple[List[str], str]:
+    """Filter chains normalizing each clip's audio and joining them in order.
+    
+    Each clip's audio is padded or trimmed to the clip's length and only faded out and back
+    in at the joins, never overlapped, so it stays in sync with the concatenated video.
+    Clips without audio contribute silence of their length. Returns the chains and the output label.
+    """
+    durations = [(probe or {}).get('duration') or 0 for probe in probes]
+    last = len(probes) - 1
+    
+    filters = []
+    for index, probe in enumerate(probes):
+        duration = durations[index]
+        if probe and probe['audio'] is not None:
+            source = f"[{first_input + index}:a]"
+        else:
+            source = f"anullsrc=r=48000:cl=stereo:d={duration or 1},"
+        chain = f"{source}{STITCH_LOUDNORM},aresample=48000"
+        if duration:
+            fade = min(STITCH_AUDIO_FADE, duration / 4)
+            chain += f",apad,atrim=0:{duration},asetpts=PTS-STARTPTS"
+            if index > 0:
+                chain += f",afade=t=in:st=0:d={fade}"
+            if index < last:
+                chain += f",afade=t=out:st={round(duration - fade, 3)}:d={fade}"
+        filters.append(f"{chain}[a{index}]")
+    
+    if len(probes) == 1:
+        return filters, "[a0]"
+    filters.append(''.join(f"[a{index}]" for index in range(len(probes))) + f"concat=n={len(probes)}:v=0:a=1[aout]")
+    return filters, "[aout]"
+
+def stitch_video_graph(paths: List[str], probes: List[Optional[Dict[str, Any]]], scratch_dir: Path, stream_copy: bool) -> Dict[str, Any]:
+    """ffmpeg inputs, filters, video map and codec options joining the clips' video streams.
+    
+    With stream_copy, input 0 is a concat demuxer list and every clip is also opened on its own
+    for its audio; otherwise every clip is scaled and padded to the first readable clip's size
+    and frame rate and re-encoded. 'audio_input' is the index of the first clip's own input.
+    """
+    inputs = []
+    if stream_copy:
+        concat_file = scratch_dir / 'concat.txt'
+        with open(concat_file, 'w') as f:
+            for path in paths:
+                escaped = str(path).replace("'", "'\\''")
+                f.write(f"file '{escaped}'\n")
+        inputs.extend(['-f', 'concat', '-safe', '0', '-i', str(concat_file)])
+    for path in paths:
+        inputs.extend(['-i', str(path)])
+    
+    if stream_copy:
+        return {"inputs": inputs, "filters": [], "map": '0:v:0', "codec": ['-c:v', 'copy'], "audio_input": 1}
+    
+    reference = next((probe['video'] for probe in probes if probe and probe['video']), None) or {}
+    width, height = reference.get('width') or 1280, reference.get('height') or 720
+    frame_rate = reference.get('r_frame_rate') or '30'
+    filters = [
+        f"[{index}:v]scale={width}:{height}:force_original_aspect_ratio=decrease,"
+        f"pad={width}:{height}:(ow-iw)/2:(oh-ih)/2,setsar=1,fps={frame_rate}[v{index}]"
+        for index in range(len(paths))
+    ]
+    filters.append(''.join(f"[v{index}]" for index in range(len(paths))) + f"concat=n={len(paths)}:v=1:a=0[vout]")
+    return {
+        "inputs": inputs,
+        "filters": filters,
+        "map": '[vout]',
+        "codec": ['-c:v', 'libx264', '-preset', 'medium', '-crf', '23', '-pix_fmt', 'yuv420p'],
+        "audio_input": 0
+    }
+
+def stitch_modes(probes: List[Optional[Dict[str, Any]]]) -> List[str]:
+    """Ways to join the clips, fastest first; re-encoding is always the last resort"""
+    return ['stream_copy', 'reencode'] if stitch_stream_copy_compatible(probes) else ['reencode']
+
+async def stitch_videos(paths: List[str], output_path: str, scratch_dir: Path, on_progress=None) -> str:
+    """Join video files into output_path; returns the path taken, 'stream_copy' or 'reencode'"""
+    probes = list(await asyncio.gather(*(probe_media_streams(path) for path in paths)))
+    total_duration = sum((probe or {}).get('duration') or 0 for probe in probes)
+    
+    for mode in stitch_modes(probes):
+        graph = stitch_video_graph(paths, probes, scratch_dir, stream_copy=mode == 'stream_copy')
+        audio_filters, audio_label = stitch_audio_filters(probes, first_input=graph['audio_input'])
+        cmd = graph['inputs'] + [
+            '-filter_complex', ';'.join(graph['filters'] + audio_filters),
+            '-map', graph['map'], '-map', audio_label,
+            *graph['codec'],
+            '-c:a', 'aac', '-b:a', '192k', '-ar', '48000',
+            '-movflags', '+faststart', '-y', output_path
+        ]
+        try:
+            await media_pool.run(cmd, tag='STITCH', duration=total_duration, on_progress=on_progress)
+            return mode
+        except MediaJobError as e:
+            if mode == 'reencode':
+                raise
+            logging.warning(f"[STITCH] Stream copy failed, re-encoding instead: {str(e)[-300:]}")
+
+def audio_overlay_command(video_path: str, audio_path: str, output_path: str) -> List[str]:
+    """ffmpeg arguments replacing a video's audio with a voiceover, ending with the shorter of the two"""
+    return [
+        '-i', video_path,
+        '-i', audio_path,
+        '-c:v', 'copy',  # Copy video stream (no re-encode for speed)
+        '-map', '0:v:0',  # Use video from first input
+        '-map', '1:a:0',  # Use audio from second input (voiceover)
+        '-c:a', 'aac',
+        '-b:a', '192k',
+        '-shortest',  # End when shortest stream ends
+        '-y',
+        output_path
+    ]
+
+# ============ MEDIA GRAPH FUSION ============
+
+# A stitch → audiooverlay → audiostitch chain would decode and write the full video once per
+# node. When no other branch consumes the intermediate videos, the chain is rendered by its
+# last node in a single ffmpeg run; the earlier nodes only record their inputs ("fused_into").
+# The rendered video is the one the last node would produce when every node runs on its own.
+# Should the last node fail, the earlier nodes are rendered on their own after all.
+FUSABLE_MEDIA_NEXT = {
+    'stitch': ('audiooverlay', 'audiostitch'),
+    'audiooverlay': ('audiostitch',)
+}
+
+def plan_media_chains(plan: Dict[str, Any], nodes_dict: Dict[str, Dict[str, Any]]) -> Dict[str, List[str]]:
+    """Fusable media chains of a plan and its loop bodies, indexed by each member node"""
+    chains: Dict[str, List[str]] = {}
+    for node_id in plan['order']:
+        if nodes_dict[node_id]['type'] != 'stitch':
+            continue
+        chain = [node_id]
+        while True:
+            tail = chain[-1]
+            children = plan['children'][tail]
+            # The intermediate output must feed the next node only, and cached nodes keep real outputs
+            if len(children) != 1 or node_cache_policy(nodes_dict[tail]) != 'never':
+                break
+            child = children[0]
+            if nodes_dict[child]['type'] not in FUSABLE_MEDIA_NEXT.get(nodes_dict[tail]['type'], ()):
+                break
+            if node_cache_policy(nodes_dict[child]) != 'never':
+                break
+            chain.append(child)
+        if len(chain) > 1:
+            for member in chain:
+                chains[member] = chain
+    for body in plan.get('loop_bodies', {}).values():
+        chains.update(plan_media_chains(body, nodes_dict))
+    return chains
+
+async def render_media_chain(stages: List[Dict[str, Any]], output_path: str, scratch_dir: Path, on_progress=None) -> Dict[str, Any]:
+    """Render a fused chain with one ffmpeg run.
+    
+    stages follow the chain: {"type": "stitch", "videos": [paths]}, then optionally
+    {"type": "audiooverlay", "audio": handle} and {"type": "audiostitch", "tts": handle, "music": handle}.
+    Only the audio of the last stage is built; replaced audio is never rendered.
+    Returns the output duration and the stitch mode used.
+    """
+    videos = stages[0]['videos']
+    probes = list(await asyncio.gather(*(probe_media_streams(path) for path in videos)))
+    duration = sum((probe or {}).get('duration') or 0 for probe in probes)
+    limit = None
+    # audiostitch takes the stitch node's video, not the overlay's, so an overlay
+    # before it has no effect on the output
+    audio_stage = stages[-1] if len(stages) > 1 else None
+    if audio_stage and audio_stage['type'] == 'audiooverlay' and audio_stage['audio'].get('duration'):
+        # The overlay ends with the shorter of the video and the voiceover
+        duration = min(duration, audio_stage['audio']['duration'])
+        limit = duration
+    
+    for mode in stitch_modes(probes):
+        graph = stitch_video_graph(videos, probes, scratch_dir, stream_copy=mode == 'stream_copy')
+        inputs = list(graph['inputs'])
+        next_input = inputs.count('-i')
+        filters = list(graph['filters'])
+        
+        if audio_stage is None:
+            audio_filters, audio_map = stitch_audio_filters(probes, first_input=graph['audio_input'])
+            filters.extend(audio_filters)
+        elif audio_stage['type'] == 'audiooverlay':
+            inputs.extend(['-i', artifact_path(audio_stage['audio'])])
+            audio_map = f"{next_input}:a:0"
+        else:
+            # TTS at full volume over music at 30%, both trimmed to the video
+            tracks = [(audio_stage.get('tts'), 'tts', 1.0), (audio_stage.get('music'), 'music', 0.3)]
+            labels = []
+            for handle, label, volume in tracks:
+                if handle:
+                    inputs.extend(['-i', artifact_path(handle)])
+                    filters.append(f"[{next_input}:a]atrim=0:{duration},volume={volume}[{label}]")
+                    labels.append(f"[{label}]")
+                    next_input += 1
+            if len(labels) == 2:
+                filters.append(f"{''.join(labels)}amix=inputs=2:duration=first:dropout_transition=2[aout]")
+                audio_map = "[aout]"
+            else:
+                audio_map = labels[0]
+        
+        cmd = inputs
+        if filters:
+            cmd += ['-filter_complex', ';'.join(filters)]
+        cmd += ['-map', graph['map'], '-map', audio_map, *graph['codec'], '-c:a', 'aac', '-b:a', '192k']
+        if audio_stage is None:
+            cmd += ['-ar', '48000']
+        else:
+            # Audio nodes keep their track's sample rate when run on their own too
+            cmd.append('-shortest')
+        if limit:
+            cmd += ['-t', str(limit)]
+        cmd += ['-movflags', '+faststart', '-y', output_path]
+        
+        try:
+            await media_pool.run(cmd, tag='MEDIA_CHAIN', duration=duration, on_progress=on_progress)
+            return {"duration": duration, "stitch_mode": mode}
+        except MediaJobError as e:
+            if mode == 'reencode':
+                raise
+            logging.warning(f"[MEDIA_CHAIN] Stream copy failed, re-encoding instead: {str(e)[-300:]}")
+
+# ============ FRAME EXTRACTION ============
+
+# Frames are cut from video artifacts by ffmpeg seeking straight to the wanted position and
+# piping a single encoded image back over stdout; nothing is decoded beyond that point and no
+# temp files are written. Extracted frames are remembered per video artifact in `video_frames`.
+FRAME_FORMATS = {
+    'png': ('image/png', ['-c:v', 'png']),
+    'webp': ('image/webp', ['-c:v', 'libwebp', '-quality', '80']),
+    'jpeg': ('image/jpeg', ['-c:v', 'mjpeg', '-q:v', '3'])
+}
+FRAME_MAX_COUNT = 16
+FRAME_LAST_WINDOW = 0.5  # seconds before the end decoded to find the last frame
+
+def frame_timestamps(node_data: Dict[str, Any], duration: Optional[float]) -> List[Optional[float]]:
+    """Positions to extract, in seconds; None stands for the last frame.
+    
+    Timestamps at or past the end of the video (when its duration is known) become the last frame.
+    """
+    mode = node_data.get('frameMode', 'last')
+    if mode == 'timestamps':
+        timestamps = []
+        for value in str(node_data.get('timestamps', '')).split(','):
+            try:
+                at = max(0.0, float(value))
+            except ValueError:
+                continue
+            timestamps.append(None if duration and at >= duration else at)
+        return timestamps[:FRAME_MAX_COUNT] or [None]
+    if mode == 'count' and duration:
+        count = min(max(1, int(node_data.get('frameCount') or 1)), FRAME_MAX_COUNT)
+        # Evenly spaced, centred in equal slices so the first and last are not black fades
+        return [round(duration * (index + 0.5) / count, 3) for index in range(count)]
+    return [None]
+
+async def extract_video_frame(video: Dict[str, Any], at: Optional[float], image_format: str = 'png') -> Dict[str, Any]:
+    """Image artifact of the frame of a video artifact at `at` seconds (None: the last frame)"""
+    frame_key = f"{image_format}@{'last' if at is None else at}"
+    cached = await db.video_frames.find_one({"video": video['artifact'], "key": frame_key}, {"_id": 0})
+    if cached and Path(artifact_path(cached['image'])).exists() and await db.workflow_artifacts.find_one({"hash": cached['image']['artifact']}):
+        return cached['image']
+    
+    mime, codec_args = FRAME_FORMATS[image_format]
+    if at is None:
+        # -sseof seeks to just before the end; reverse hands the final frame out first
+        seek_args = ['-sseof', f"-{FRAME_LAST_WINDOW}", '-i', artifact_path(video), '-vf', 'reverse']
+    else:
+        seek_args = ['-ss', str(at), '-i', artifact_path(video)]
+    image_bytes = await media_pool.run(
+        ['-loglevel', 'error', *seek_args, '-frames:v', '1', *codec_args, '-f', 'image2pipe', 'pipe:1'],
+        tag='FRAMES', timeout=60, capture_output=True
+    )
+    if not image_bytes and at is not None:
+        # Past the last frame (the duration was unknown, or the container runs longer than the video)
+        return await extract_video_frame(video, None, image_format)
+    if not image_bytes:
+        raise MediaJobError("No frame at the end of the video")
+    
+    probe = await probe_media_streams(artifact_path(video))
+    video_stream = (probe or {}).get('video') or {}
+    image = await create_artifact(
+        'image', mime, data=image_bytes,
+        width=video_stream.get('width'), height=video_stream.get('height')
+    )
+    await db.video_frames.update_one(
+        {"video": video['artifact'], "key": frame_key},
+        {"$set": {"image": image, "created_at": datetime.now(timezone.utc).isoformat()}},
+        upsert=True
+    )
+    return image
+
+# ============ WORKFLOW ARTIFACTS ============
+
+# Media produced by workflow nodes is stored once in the blob store as an artifact. Nodes hand
+# each other small `<kind>_artifact` handles and ffmpeg reads the blob files in place.
+# `refcount` counts the executions whose results reference an artifact. Artifacts whose
+# node failed or was cancelled before its result was persisted never gain a reference;
+# they are swept once they have sat unreferenced for ARTIFACT_ORPHAN_GRACE_SECONDS.
+ARTIFACT_ORPHAN_GRACE_SECONDS = int(os.environ.get('ARTIFACT_ORPHAN_GRACE_SECONDS', 6 * 3600))
+ARTIFACT_SWEEP_INTERVAL = int(os.environ.get('ARTIFACT_SWEEP_INTERVAL', 600))
+
+async def probe_media_duration(path: str) -> Optional[float]:
+    """Return the duration of a media file in seconds, or None when ffprobe cannot read it"""
+    try:
+        proc = await asyncio.create_subprocess_exec(
+            'ffprobe', '-v', 'error',
+            '-show_entries', 'format=duration',
+            '-of', 'default=noprint_wrappers=1:nokey=1',
+            path,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL
+        )
+        with span_timer('media'):
+            stdout, _ = await proc.communicate()
+        return round(float(stdout.decode().strip()), 3)
+    except (OSError, ValueError):
+        return None
+
+def new_blob_tmp_path() -> Path:
+    """Scratch file path on the blob store's filesystem, so finished files can be moved in cheaply"""
+    tmp_dir = BLOB_STORE_DIR / 'tmp'
+    tmp_dir.mkdir(parents=True, exist_ok=True)
+    return tmp_dir / f"{uuid.uuid4()}.part"
+
+def hash_blob_file(path: str) -> Tuple[str, int]:
+    """Return the sha256 and size of a finished file"""
+    hasher = hashlib.sha256()
+    size = 0
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(BLOB_CHUNK_SIZE), b''):
+            hasher.update(chunk)
+            size += len(chunk)
+    return hasher.hexdigest(), size
+
+def move_file_into_blob_store(path: str, content_hash: str):
+    """Move a hashed file into the blob store, dropping it when the blob already exists"""
+    final_path = blob_path(content_hash)
+    if final_path.exists():
+        os.remove(path)
+    else:
+        final_path.parent.mkdir(parents=True, exist_ok=True)
+        shutil.move(str(path), final_path)
+
+async def create_artifact(kind: str, mime: str, data: Optional[bytes] = None, path: Optional[str] = None, **metadata) -> Dict[str, Any]:
+    """Store node output media as an artifact and return its handle.
+    
+    Pass either the raw bytes or the path of a finished file, which is moved into the store.
+    Audio and video durations are probed when not given.
+    """
+    if path is not None:
+        content_hash, size = await asyncio.to_thread(hash_blob_file, path)
+    else:
+        content_hash, size = hashlib.sha256(data).hexdigest(), len(data)
+    
+    # The artifact record is written under the blob's lock, so a concurrent release of
+    # the same content cannot delete the bytes between storing them and referencing them
+    async with blob_lock(content_hash):
+        if path is not None:
+            await asyncio.to_thread(move_file_into_blob_store, path, content_hash)
+        else:
+            await write_blob(data)
+        
+        if kind in ('video', 'audio') and metadata.get('duration') is None:
+            metadata['duration'] = await probe_media_duration(str(blob_path(content_hash)))
+        
+        handle = {"artifact": content_hash, "kind": kind, "mime": mime, "size_bytes": size}
+        handle.update({key: value for key, value in metadata.items() if value is not None})
+        
+        artifact_doc = {key: value for key, value in handle.items() if key != 'artifact'}
+        now = datetime.now(timezone.utc).isoformat()
+        await db.workflow_artifacts.update_one(
+            {"hash": content_hash},
+            {
+                "$setOnInsert": {
+                    "hash": content_hash,
+                    **artifact_doc,
+                    "refcount": 0,
+                    "created_at": now
+                },
+                # Restarts the orphan grace period when a node produces the same content again
+                "$set": {"touched_at": now}
+            },
+            upsert=True
+        )
+    return handle
+
+def artifact_path(handle: Dict[str, Any]) -> str:
+    return str(blob_path(handle['artifact']))
+
+async def read_artifact(handle: Dict[str, Any]) -> bytes:
+    return await read_blob(handle['artifact'])
+
+def result_artifact(result: Any, key: str) -> Optional[Dict[str, Any]]:
+    """Return the `<key>_artifact` handle of a node result, if it has one"""
+    if isinstance(result, dict):
+        handle = result.get(f"{key}_artifact")
+        if isinstance(handle, dict) and handle.get('artifact'):
+            return handle
+    return None
+
+def collect_artifact_hashes(value: Any, hashes: set) -> set:
+    """Collect the hashes of all artifact handles nested in a node result"""
+    if isinstance(value, dict):
+        if isinstance(value.get('artifact'), str) and 'kind' in value:
+            hashes.add(value['artifact'])
+        else:
+            for item in value.values():
+                collect_artifact_hashes(item, hashes)
+    elif isinstance(value, list):
+        for item in value:
+            collect_artifact_hashes(item, hashes)
+    return hashes
+
+async def retain_artifacts(hashes: List[str]):
+    if hashes:
+        await db.workflow_artifacts.update_many({"hash": {"$in": hashes}}, {"$inc": {"refcount": 1}})
+
+async def release_artifacts(hashes: List[str]):
+    """Drop one reference to each artifact and delete the ones nothing references anymore"""
+    if not hashes:
+        return
+    await db.workflow_artifacts.update_many({"hash": {"$in": hashes}}, {"$inc": {"refcount": -1}})
+    await db.workflow_artifacts.delete_many({"hash": {"$in": hashes}, "refcount": {"$lte": 0}})
+    remaining = await db.workflow_artifacts.find({"hash": {"$in": hashes}}, {"_id": 0, "hash": 1}).to_list(length=None)
+    remaining_hashes = {doc['hash'] for doc in remaining}
+    await forget_video_frames([content_hash for content_hash in hashes if content_hash not in remaining_hashes])
+    for content_hash in hashes:
+        await release_blob_if_unreferenced(content_hash)
+
+async def forget_video_frames(video_hashes: List[str]):
+    """Drop the remembered frames of deleted video artifacts"""
+    if video_hashes:
+        await db.video_frames.delete_many({"video": {"$in": video_hashes}})
+
+async def sweep_orphaned_artifacts() -> int:
+    """Delete artifacts that were created but never referenced by a persisted result"""
+    cutoff = (datetime.now(timezone.utc) - timedelta(seconds=ARTIFACT_ORPHAN_GRACE_SECONDS)).isoformat()
+    orphan_filter = {
+        "refcount": {"$lte": 0},
+        # Artifacts created before touched_at was recorded fall back to their creation time
+        "$or": [{"touched_at": {"$lt": cutoff}}, {"touched_at": None, "created_at": {"$lt": cutoff}}]
+    }
+    orphans = await db.workflow_artifacts.find(orphan_filter, {"_id": 0, "hash": 1}).to_list(length=1000)
+    
+    swept = 0
+    for orphan in orphans:
+        # Re-checked on delete, in case a result took a reference since the query
+        deleted = await db.workflow_artifacts.delete_one({"hash": orphan['hash'], **orphan_filter})
+        if deleted.deleted_count:
+            swept += 1
+            await forget_video_frames([orphan['hash']])
+            await release_blob_if_unreferenced(orphan['hash'])
+    if swept:
+        logging.info(f"[ARTIFACTS] Swept {swept} orphaned artifacts")
+    return swept
+
+async def sweep_orphaned_artifacts_forever():
+    while True:
+        try:
+            await sweep_orphaned_artifacts()
+        except Exception as e:
+            logging.error(f"[ARTIFACTS] Orphan sweep failed: {str(e)}")
+        await asyncio.sleep(ARTIFACT_SWEEP_INTERVAL)
+
+# ============ WORKER LEASES ============
+
+# Executions and batches run as background tasks inside the process that started them.
+# Each process stamps the documents it drives with its worker id and keeps renewing a
+# lease on them. Only documents whose lease ran out (their process died or restarted)
+# are treated as interrupted, so one worker or replica restarting never fails runs
+# that another one is still executing.
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+WORKER_LEASE_SECONDS = int(os.environ.get('WORKER_LEASE_SECONDS', 90))
+WORKER_LEASE_RENEW_INTERVAL = int(os.environ.get('WORKER_LEASE_RENEW_INTERVAL', 30))
+ACTIVE_EXECUTION_STATUSES = ('queued', 'running')
+
+def worker_lease_fields() -> Dict[str, str]:
+    """Owner and lease expiry to stamp on an execution or batch this process drives"""
+    lease_expires_at = datetime.now(timezone.utc) + timedelta(seconds=WORKER_LEASE_SECONDS)
+    return {"owner": WORKER_ID, "lease_expires_at": lease_expires_at.isoformat()}
+
+async def renew_worker_leases():
+    lease = worker_lease_fields()
+    await db.workflow_executions.update_many(
+        {"owner": WORKER_ID, "status": {"$in": list(ACTIVE_EXECUTION_STATUSES)}},
+        {"$set": lease}
+    )
+    await db.workflow_batches.update_many({"owner": WORKER_ID, "status": "running"}, {"$set": lease})
+
+async def recover_expired_leases():
+    """Fail executions and batches whose owning process stopped renewing their lease"""
+    now = datetime.now(timezone.utc).isoformat()
+    # Documents written before leases existed have no expiry and count as expired
+    expired = {"$or": [{"lease_expires_at": {"$lt": now}}, {"lease_expires_at": None}]}
+    
+    interrupted = await db.workflow_executions.find(
+        {"status": {"$in": list(ACTIVE_EXECUTION_STATUSES)}, **expired}, {"_id": 0, "id": 1}
+    ).to_list(length=None)
+    recovered = 0
+    for execution in interrupted:
+        # Through the state machine, so the failure is in status_history and watchers are told;
+        # the lease is checked again in case its worker renewed it since the query
+        if await transition_execution(
+            execution['id'], 'failed',
+            match=expired,
+            error="Execution interrupted: the worker running it stopped",
+            completed_at=now
+        ):
+            recovered += 1
+    if recovered:
+        logging.warning(f"[WORKFLOW] Marked {recovered} interrupted executions as failed")
+    
+    # Rows of an interrupted batch that never started stay pending
+    result = await db.workflow_batches.update_many(
+        {"status": "running", **expired},
+        {"$set": {
+            "status": "failed",
+            "error": "Batch interrupted: the worker running it stopped",
+            "completed_at": now
+        }}
+    )
+    if result.modified_count:
+        logging.warning(f"[BATCH] Marked {result.modified_count} interrupted batches as failed")
+
+async def maintain_worker_leases():
+    """Renew this process's leases and recover other processes' expired ones, forever"""
+    while True:
+        try:
+            await renew_worker_leases()
+            await recover_expired_leases()
+        except Exception as e:
+            logging.error(f"[LEASES] Lease maintenance failed: {str(e)}")
+        await asyncio.sleep(WORKER_LEASE_RENEW_INTERVAL)
+
+_lease_task: Optional[asyncio.Task] = None
+_artifact_sweep_task: Optional[asyncio.Task] = None
+
+# ============ EXECUTION EVENTS ============
+
+# Live execution progress is pushed to clients over Server-Sent Events. Events carry only
+# artifact handles, never media bytes; clients without a stream poll the light execution view.
+EXECUTION_EVENT_QUEUE_SIZE = 256
+EXECUTION_EVENT_HEARTBEAT = 15  # seconds
+TERMINAL_EXECUTION_STATUSES = ('completed', 'failed', 'cancelled')
+
+class ExecutionEventBus:
+    """In-process fan-out of execution events to the clients watching each execution"""
+    
+    def __init__(self):
+        self._subscribers: Dict[str, List[asyncio.Queue]] = {}
+    
+    def subscribe(self, execution_id: str) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=EXECUTION_EVENT_QUEUE_SIZE)
+        self._subscribers.setdefault(execution_id, []).append(queue)
+        return queue
+    
+    def unsubscribe(self, execution_id: str, queue: asyncio.Queue):
+        queues = self._subscribers.get(execution_id, [])
+        if queue in queues:
+            queues.remove(queue)
+        if not queues:
+            self._subscribers.pop(execution_id, None)
+    
+    def publish(self, execution_id: str, event_type: str, **data):
+        event = {"type": event_type, "execution_id": execution_id, "at": datetime.now(timezone.utc).isoformat(), **data}
+        for queue in self._subscribers.get(execution_id, []):
+            if queue.full():
+                # A slow client loses its oldest events rather than stalling the execution
+                queue.get_nowait()
+            queue.put_nowait(event)
+
+execution_events = ExecutionEventBus()
+
+def format_sse(event_type: str, data: Any) -> str:
+    return f"event: {event_type}\ndata: {json_lib.dumps(data, default=str)}\n\n"
+
+# ============ PROVIDER OPERATIONS ============
+
+# Long-running provider jobs (Sora videos, ElevenLabs music) are polled from one background
+# task instead of a sleeping loop per node, so any number of pending generations costs a heap
+# entry each rather than a blocked worker.
+PROVIDER_POLL_MIN_INTERVAL = float(os.environ.get('PROVIDER_POLL_MIN_INTERVAL', '2'))
+PROVIDER_POLL_MAX_INTERVAL = float(os.environ.get('PROVIDER_POLL_MAX_INTERVAL', '30'))
+PROVIDER_POLL_BACKOFF = 1.5
+PROVIDER_POLL_CONCURRENCY = int(os.environ.get('PROVIDER_POLL_CONCURRENCY', '8'))  # Status requests in flight at once
+PROVIDER_POLL_MAX_ERRORS = 3  # Consecutive failed status requests before an operation fails
+
+class ProviderOperationPoller:
+    """Polls pending provider operations and resolves each caller's future when it finishes.
+    
+    wait() registers a `check` coroutine function returning None while the operation is still
+    pending and the final value once it is done (raising fails the operation). Operations wait
+    in a heap ordered by their next poll time; each one's interval grows by PROVIDER_POLL_BACKOFF
+    up to PROVIDER_POLL_MAX_INTERVAL, so quick jobs are noticed early and slow ones cost few requests.
+    """
+    
+    def __init__(self):
+        self._heap: List[Tuple[float, int, Dict[str, Any]]] = []
+        self._counter = 0
+        self._wakeup = asyncio.Event()
+        self._slots = asyncio.Semaphore(PROVIDER_POLL_CONCURRENCY)
+        self._task: Optional[asyncio.Task] = None
+        self._polls = set()
+        self._session: Optional[aiohttp.ClientSession] = None
+    
+    def session(self) -> aiohttp.ClientSession:
+        """Shared HTTP session for provider requests"""
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession()
+        return self._session
+    
+    async def wait(self, name: str, check, first_interval: float = PROVIDER_POLL_MIN_INTERVAL, timeout: float = 600) -> Any:
+        loop = asyncio.get_running_loop()
+        operation = {
+            "name": name,
+            "check": check,
+            "future": loop.create_future(),
+            "interval": max(first_interval, 0.1),
+            "deadline": loop.time() + timeout,
+            "timeout": timeout,
+            "errors": 0,
+            "span": current_node_span.get()  # Polls run in the poller's task; retries are counted on the caller's node
+        }
+        self._schedule(operation, loop.time() + operation['interval'])
+        try:
+            return await operation['future']
+        finally:
+            # A caller that gave up (e.g. a cancelled execution) takes its operation out of the rotation
+            operation['future'].cancel()
+    
+    def pending(self) -> int:
+        return sum(1 for _, _, operation in self._heap if not operation['future'].done())
+    
+    def _schedule(self, operation: Dict[str, Any], due: float):
+        self._counter += 1
+        heapq.heappush(self._heap, (due, self._counter, operation))
+        self._wakeup.set()
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+    
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while self._heap:
+            due, _, operation = self._heap[0]
+            delay = due - loop.time()
+            if delay > 0:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            heapq.heappop(self._heap)
+            if operation['future'].done():
+                continue
+            await self._slots.acquire()
+            poll = asyncio.create_task(self._poll(operation))
+            self._polls.add(poll)
+            poll.add_done_callback(self._polls.discard)
+    
+    async def _poll(self, operation: Dict[str, Any]):
+        loop = asyncio.get_running_loop()
+        future = operation['future']
+        try:
+            value = await operation['check']()
+            operation['errors'] = 0
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            # A failed or timed out status request is retried; the provider job itself may be fine
+            operation['errors'] += 1
+            count_span_retry(operation['span'])
+            value = None
+            if operation['errors'] >= PROVIDER_POLL_MAX_ERRORS and not future.done():
+                future.set_exception(e)
+        except Exception as e:
+            if not future.done():
+                future.set_exception(e)
+            return
+        finally:
+            self._slots.release()
+        
+        if future.done():
+            return
+        if value is not None:
+            future.set_result(value)
+        elif loop.time() >= operation['deadline']:
+            future.set_exception(TimeoutError(f"{operation['name']} did not finish within {int(operation['timeout'])} seconds"))
+        else:
+            operation['interval'] = min(operation['interval'] * PROVIDER_POLL_BACKOFF, PROVIDER_POLL_MAX_INTERVAL)
+            self._schedule(operation, loop.time() + operation['interval'])
+    
+    async def close(self):
+        for task in [self._task, *self._polls]:
+            if task and not task.done():
+                task.cancel()
+        if self._session and not self._session.closed:
+            await self._session.close()
+
+provider_operations = ProviderOperationPoller()
+
+def sora_request_headers() -> Tuple[str, Dict[str, str]]:
+    """Base URL and auth headers for Sora 2 calls through the integration proxy"""
+    from emergentintegrations.llm.utils import get_integration_proxy_url, get_app_identifier
+    
+    headers = {"Authorization": f"Bearer {os.environ.get('EMERGENT_LLM_KEY')}"}
+    app_url = get_app_identifier()
+    if app_url:
+        headers['X-App-ID'] = app_url
+    return get_integration_proxy_url() + "/llm/openai/v1", headers
+
+async def generate_sora_video(prompt: str, size: str, duration: Any, image_bytes: Optional[bytes] = None, log_tag: str = 'VIDEOGEN') -> Path:
+    """Run a Sora 2 generation (text-to-video, or image-to-video with image_bytes) and download it.
+    
+    Returns the path of a temp file holding the video; the caller turns it into an artifact and removes it.
+    """
+    base_url, headers = sora_request_headers()
+    session = provider_operations.session()
+    
+    # Sora 2 expects multipart form data, with the reference image as a file upload
+    form = aiohttp.FormData()
+    form.add_field('model', 'sora-2')
+    form.add_field('prompt', prompt)
+    form.add_field('size', size)
+    form.add_field('seconds', str(duration))
+    if image_bytes:
+        form.add_field('input_reference', image_bytes, filename='image.png', content_type='image/png')
+    
+    async with session.post(f"{base_url}/videos", headers=headers, data=form, timeout=aiohttp.ClientTimeout(total=30)) as response:
+        if response.status != 200:
+            logging.error(f"[{log_tag}] API error {response.status}: {await response.text()}")
+        response.raise_for_status()
+        data = await response.json()
+    
+    operation_id = data.get("id") or data.get("operation_id")
+    if not operation_id:
+        raise ValueError(f"No operation ID returned from API: {data}")
+    logging.info(f"[{log_tag}] Video generation initiated with ID: {operation_id}")
+    
+    async def check() -> Optional[str]:
+        async with session.get(f"{base_url}/videos/{operation_id}", headers=headers, timeout=aiohttp.ClientTimeout(total=30)) as status_response:
+            status_response.raise_for_status()
+            status_data = await status_response.json()
+        status = status_data.get("status", "").lower()
+        if status in ["completed", "complete", "succeeded", "success"]:
+            return (status_data.get("video_url") or status_data.get("url") or
+                    status_data.get("download_url") or f"{base_url}/videos/{operation_id}/content")
+        if status in ["failed", "error"]:
+            raise RuntimeError(f"Video generation failed: {status_data.get('error', 'Unknown error')}")
+        logging.info(f"[{log_tag}] {operation_id} still processing (status: {status}, progress: {status_data.get('progress', 0)}%)")
+        return None
+    
+    video_uri = await provider_operations.wait(f"Video generation {operation_id}", check, first_interval=10, timeout=600)
+    logging.info(f"[{log_tag}] Downloading video from: {video_uri}")
+    
+    # Stream straight to disk; the file becomes the artifact
+    download_path = new_blob_tmp_path()
+    try:
+        async with session.get(video_uri, headers=headers, timeout=aiohttp.ClientTimeout(total=120)) as download_response:
+            download_response.raise_for_status()
+            with open(download_path, 'wb') as f:
+                async for chunk in download_response.content.iter_chunked(BLOB_CHUNK_SIZE):
+                    f.write(chunk)
+    except BaseException:
+        if download_path.exists():
+            download_path.unlink()
+        raise
+    return download_path
+
+# ============ NODE RESULT CACHE ============
+
+# Opt-in memoization of expensive node types. A node's `cachePolicy` is 'never' (default),
+# 'run' (reuse within one execution) or 'global' (reuse across the user's executions).
+# Keys cover the node type, normalized config, model and inputs, with media reduced to artifact hashes.
+NODE_CACHE_POLICIES = ('never', 'run', 'global')
+CACHEABLE_NODE_TYPES = {
+    'gemini', 'videogen', 'imagetovideo', 'imagegen', 'screenshot', 'stitch',
+    'texttospeech', 'audiooverlay', 'texttomusic', 'audiostitch'
+}
+NODE_CACHE_VERSION = '1'  # Bump when a node implementation changes its output
+NODE_MODEL_VERSIONS = {'videogen': 'sora-2', 'imagetovideo': 'sora-2', 'imagegen': 'gpt-image-1'}
+NODE_CACHE_IGNORED_KEYS = {'label', 'cachePolicy'}
+NODE_CACHE_MAX_BYTES = int(os.environ.get('NODE_CACHE_MAX_BYTES', str(2 * 1024 * 1024 * 1024)))  # Per user, including artifacts
+NODE_CACHE_MAX_ENTRY_BYTES = 1024 * 1024  # Inline result JSON larger than this is not cached
+
+def node_cache_policy(node: Dict[str, Any]) -> str:
+    policy = (node.get('data') or {}).get('cachePolicy') or 'never'
+    if node['type'] not in CACHEABLE_NODE_TYPES or policy not in NODE_CACHE_POLICIES:
+        return 'never'
+    return policy
+
+def canonical_cache_value(value: Any) -> Any:
+    """Normalize a config or result for cache keys: artifacts become their hash, strings are trimmed"""
+    if isinstance(value, dict):
+        if isinstance(value.get('artifact'), str) and 'kind' in value:
+            return {"artifact": value['artifact']}
+        return {
+            key: canonical_cache_value(item)
+            for key, item in sorted(value.items())
+            if key not in NODE_CACHE_IGNORED_KEYS
+        }
+    if isinstance(value, list):
+        return [canonical_cache_value(item) for item in value]
+    if isinstance(value, str):
+        return value.strip()
+    return value
+
+def node_cache_key(node: Dict[str, Any], input_data: Any, upstream: Dict[str, Any]) -> str:
+    node_data = node.get('data') or {}
+    key_doc = {
+        "version": NODE_CACHE_VERSION,
+        "type": node['type'],
+        "model": node_data.get('model') or node_data.get('model_id') or NODE_MODEL_VERSIONS.get(node['type']),
+        "config": canonical_cache_value(node_data),
+        "input": canonical_cache_value(input_data),
+        # Several node types read any upstream result, not just their direct input
+        "upstream": canonical_cache_value(upstream),
+    }
+    return hashlib.sha256(json_lib.dumps(key_doc, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+def is_successful_result(result: Any) -> bool:
+    """Whether a node result can be reused (by the node cache or when resuming an execution)"""
+    # 'partial' is a loop some of whose items failed; 'cancelled' a node stopped mid-run
+    return isinstance(result, dict) and result.get('status') not in ('error', 'failed', 'skipped', 'partial', 'cancelled')
+
+async def evict_node_cache_entry(entry: Dict[str, Any]):
+    deleted = await db.node_result_cache.delete_one({"user_id": entry['user_id'], "cache_key": entry['cache_key']})
+    if deleted.deleted_count:
+        await release_artifacts(entry.get('artifact_hashes', []))
+
+async def node_cache_get(user_id: str, cache_key: str) -> Optional[Dict[str, Any]]:
+    entry = await db.node_result_cache.find_one({"user_id": user_id, "cache_key": cache_key}, {"_id": 0})
+    if not entry:
+        return None
+    if any(not blob_path(content_hash).exists() for content_hash in entry.get('artifact_hashes', [])):
+        logging.warning(f"[NODE_CACHE] Dropping entry {cache_key} with missing artifacts")
+        await evict_node_cache_entry(entry)
+        return None
+    
+    await db.node_result_cache.update_one(
+        {"user_id": user_id, "cache_key": cache_key},
+        {"$set": {"last_hit_at": datetime.now(timezone.utc).isoformat()}, "$inc": {"hit_count": 1}}
+    )
+    return entry['result']
+
+async def node_cache_put(user_id: str, node_type: str, cache_key: str, result: Dict[str, Any]):
+    inline_size = len(json_lib.dumps(result, default=str))
+    if inline_size > NODE_CACHE_MAX_ENTRY_BYTES:
+        return
+    
+    artifact_hashes = list(collect_artifact_hashes(result, set()))
+    artifact_docs = await db.workflow_artifacts.find(
+        {"hash": {"$in": artifact_hashes}},
+        {"_id": 0, "size_bytes": 1}
+    ).to_list(length=None)
+    now = datetime.now(timezone.utc).isoformat()
+    
+    upsert = await db.node_result_cache.update_one(
+        {"user_id": user_id, "cache_key": cache_key},
+        {"$setOnInsert": {
+            "user_id": user_id,
+            "cache_key": cache_key,
+            "node_type": node_type,
+            "result": result,
+            "artifact_hashes": artifact_hashes,
+            "size_bytes": inline_size + sum(doc.get('size_bytes', 0) for doc in artifact_docs),
+            "hit_count": 0,
+            "created_at": now,
+            "last_hit_at": now
+        }},
+        upsert=True
+    )
+    if upsert.upserted_id is None:
+        return  # Another execution cached the same result first
+    
+    # Cache entries hold their own artifact references, so deleting executions keeps them usable
+    await retain_artifacts(artifact_hashes)
+    await enforce_node_cache_budget(user_id)
+
+async def enforce_node_cache_budget(user_id: str):
+    """Evict least recently used entries until the user's cache fits NODE_CACHE_MAX_BYTES"""
+    entries = await db.node_result_cache.find(
+        {"user_id": user_id},
+        {"_id": 0, "user_id": 1, "cache_key": 1, "size_bytes": 1, "artifact_hashes": 1}
+    ).sort("last_hit_at", 1).to_list(length=None)
+    
+    total = sum(entry['size_bytes'] for entry in entries)
+    for entry in entries:
+        if total <= NODE_CACHE_MAX_BYTES:
+            break
+        await evict_node_cache_entry(entry)
+        total -= entry['size_bytes']
+        logging.info(f"[NODE_CACHE] Evicted {entry['cache_key']} for user {user_id}")
+
+# ============ WORKFLOW SCHEDULER ============
+
+# Maximum number of workflow nodes of one execution running at the same time
+WORKFLOW_MAX_PARALLEL_NODES = int(os.environ.get('WORKFLOW_MAX_PARALLEL_NODES', '4'))
+
+# Loop nodes run their body once per item; edges labelled 'body' lead into the body
+LOOP_BODY_LABEL = 'body'
+LOOP_DEFAULT_CONCURRENCY = int(os.environ.get('WORKFLOW_LOOP_CONCURRENCY', '4'))
+LOOP_MAX_CONCURRENCY = int(os.environ.get('WORKFLOW_LOOP_MAX_CONCURRENCY', '16'))
+
+# Deadlines stop runaway work: a node is stopped after its `timeoutSeconds` setting (or the
+# default below), an execution after the deadline it was started with (or the default; 0: none).
+# Stopping cancels the node's task, which aborts its HTTP calls, provider polls and ffmpeg jobs.
+WORKFLOW_NODE_TIMEOUT = float(os.environ.get('WORKFLOW_NODE_TIMEOUT', '1200'))
+WORKFLOW_EXECUTION_DEADLINE = float(os.environ.get('WORKFLOW_EXECUTION_DEADLINE', '10800'))
+EXECUTION_CANCEL_POLL_INTERVAL = 5  # How often a running execution checks for a cancel requested through another process
+EXECUTION_CANCEL_GRACE = 10  # Seconds the cancel endpoint waits for a local execution to wind down
+
+def build_workflow_plan(workflow: Dict[str, Any]) -> Dict[str, Any]:
+    """Topologically sort the nodes reachable from the start node(s).
+    
+    Nodes reached through a loop node's 'body' edges make up that loop's body: they are left
+    out of the main order and get their own nested plan under plan['loop_bodies'].
+    Raises ValueError when the workflow has no start node, contains a cycle or a malformed loop body.
+    """
+    node_ids = [node['id'] for node in workflow['nodes']]
+    known = set(node_ids)
+    node_types = {node['id']: node['type'] for node in workflow['nodes']}
+    start_ids = [node['id'] for node in workflow['nodes'] if node['type'] == 'start']
+    if not start_ids:
+        raise ValueError("Workflow must have a start node")
+    
+    children: Dict[str, List[str]] = {node_id: [] for node_id in node_ids}
+    edge_labels: Dict[str, Dict[str, str]] = {}
+    for edge in workflow['edges']:
+        source, target = edge['source'], edge['target']
+        if source in known and target in known and target not in children[source]:
+            children[source].append(target)
+            if edge.get('label'):
+                edge_labels.setdefault(source, {})[target] = str(edge['label']).strip().lower()
+    
+    # Only nodes reachable from a start node are executed
+    reachable = set(start_ids) | reachable_from(children, start_ids)
+    
+    return build_plan_level(
+        [node_id for node_id in node_ids if node_id in reachable],
+        children, edge_labels, node_types, start_ids
+    )
+
+def reachable_from(children: Dict[str, List[str]], roots, within: Optional[set] = None) -> set:
+    """Nodes reachable from roots (not including the roots themselves), optionally only inside within"""
+    seen = set()
+    stack = list(roots)
+    while stack:
+        for child in children[stack.pop()]:
+            if child not in seen and (within is None or child in within):
+                seen.add(child)
+                stack.append(child)
+    return seen
+
+def build_plan_level(
+    level_ids: List[str],
+    children: Dict[str, List[str]],
+    edge_labels: Dict[str, Dict[str, str]],
+    node_types: Dict[str, str],
+    entry_ids: List[str]
+) -> Dict[str, Any]:
+    """Plan one level of a workflow: the main graph, or the body of a loop.
+    
+    Loop bodies found at this level are cut out and planned recursively, so a loop nested in
+    another loop's body belongs to the outer body's plan.
+    """
+    level = set(level_ids)
+    bodies: Dict[str, Tuple[List[str], set]] = {}
+    for node_id in level_ids:
+        if node_types[node_id] != 'loop':
+            continue
+        roots = [
+            child for child in children[node_id]
+            if child in level and edge_labels.get(node_id, {}).get(child) == LOOP_BODY_LABEL
+        ]
+        if roots:
+            body = set(roots) | reachable_from(children, roots, level)
+            if node_id in body:
+                raise ValueError(f"The body of loop {node_id} leads back to the loop")
+            bodies[node_id] = (roots, body)
+    
+    # Bodies of loops nested inside another body are handled by that body's plan
+    nested = set().union(*(body for _, body in bodies.values()))
+    outer_loops = [loop_id for loop_id in bodies if loop_id not in nested]
+    owner: Dict[str, str] = {}
+    for loop_id in outer_loops:
+        for node_id in bodies[loop_id][1]:
+            if node_id in owner:
+                raise ValueError(f"Node {node_id} is part of the bodies of both loop {owner[node_id]} and loop {loop_id}")
+            owner[node_id] = loop_id
+    
+    members = [node_id for node_id in level_ids if node_id not in owner]
+    member_set = set(members)
+    for node_id in level_ids:
+        for child in children[node_id]:
+            if child not in owner or owner.get(node_id) == owner[child]:
+                continue
+            # The only way into a body is its loop's body edges
+            if node_id != owner[child] or child not in bodies[node_id][0]:
+                raise ValueError(f"Node {child} in the body of loop {owner[child]} is connected from outside the loop body ({node_id})")
+    
+    parents: Dict[str, List[str]] = {node_id: [] for node_id in members}
+    for node_id in members:
+        for child in children[node_id]:
+            if child in member_set:
+                parents[child].append(node_id)
+    
+    # Kahn's algorithm, keeping the workflow's node order among ready nodes
+    remaining = {node_id: len(parents[node_id]) for node_id in members}
+    ready = [node_id for node_id in members if remaining[node_id] == 0]
+    order = []
+    while ready:
+        node_id = ready.pop(0)
+        order.append(node_id)
+        for child in children[node_id]:
+            if child in member_set:
+                remaining[child] -= 1
+                if remaining[child] == 0:
+                    ready.append(child)
+    
+    if len(order) < len(members):
+        cyclic = [node_id for node_id in members if remaining[node_id] > 0]
+        raise ValueError(f"Workflow contains a cycle (nodes that can never run: {', '.join(cyclic)})")
+    
+    return {
+        "order": order,
+        "start_nodes": entry_ids,
+        "parents": parents,
+        "children": {node_id: [child for child in children[node_id] if child in member_set] for node_id in order},
+        "edge_labels": {
+            node_id: {child: label for child, label in labels.items() if child in member_set}
+            for node_id, labels in edge_labels.items() if node_id in member_set
+        },
+        "loop_bodies": {
+            loop_id: build_plan_level(
+                [node_id for node_id in level_ids if owner.get(node_id) == loop_id],
+                children, edge_labels, node_types, bodies[loop_id][0]
+            )
+            for loop_id in outer_loops
+        }
+    }
+
+def branch_edge_taken(node_type: str, result: Any, label: Optional[str]) -> bool:
+    """Whether an outgoing edge with this label is followed once a node produced result.
+    
+    Unlabelled edges are always followed; labels only select branches of condition and switch nodes.
+    """
+    if not label or not isinstance(result, dict):
+        return True
+    if node_type == 'condition':
+        return label == str(result.get('branch', '')).lower()
+    if node_type == 'switch':
+        return label == str(result.get('matched_case') or 'default').lower()
+    return True
+
+def plan_ancestors(plan: Dict[str, Any], node_id: str) -> List[str]:
+    """All upstream nodes of node_id, in topological order"""
+    seen = set()
+    stack = list(plan['parents'][node_id])
+    while stack:
+        parent = stack.pop()
+        if parent not in seen:
+            seen.add(parent)
+            stack.extend(plan['parents'][parent])
+    return [candidate for candidate in plan['order'] if candidate in seen]
+
+def plan_descendants(plan: Dict[str, Any], node_ids) -> set:
+    """All downstream nodes of the given nodes (not including the nodes themselves)"""
+    seen = set()
+    stack = [child for node_id in node_ids for child in plan['children'][node_id]]
+    while stack:
+        child = stack.pop()
+        if child not in seen:
+            seen.add(child)
+            stack.extend(plan['children'][child])
+    return seen
+
+def node_fingerprint(node: Dict[str, Any]) -> str:
+    """Short hash of a node's type and config, used to spot nodes edited since an execution"""
+    payload = json_lib.dumps({"type": node['type'], "data": node.get('data') or {}}, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:16]
+
+def plan_fingerprints(plan: Dict[str, Any], nodes_dict: Dict[str, Dict[str, Any]]) -> Dict[str, str]:
+    """Fingerprints of a plan's nodes; a loop's fingerprint also covers every node of its body"""
+    fingerprints = {}
+    for node_id in plan['order']:
+        fingerprint = node_fingerprint(nodes_dict[node_id])
+        body = plan.get('loop_bodies', {}).get(node_id)
+        if body:
+            payload = json_lib.dumps([fingerprint, plan_fingerprints(body, nodes_dict)], sort_keys=True)
+            fingerprint = hashlib.sha256(payload.encode('utf-8')).hexdigest()[:16]
+        fingerprints[node_id] = fingerprint
+    return fingerprints
+
+def node_timeout(node: Dict[str, Any]) -> float:
+    """Seconds a node may run before it is stopped"""
+    try:
+        timeout = float((node.get('data') or {}).get('timeoutSeconds') or WORKFLOW_NODE_TIMEOUT)
+    except (TypeError, ValueError):
+        timeout = WORKFLOW_NODE_TIMEOUT
+    return max(timeout, 1.0)
+
+def loop_items(node_data: Dict[str, Any], input_data: Any) -> List[Any]:
+    """The items a loop node iterates over: an array field of its input, or 0..n-1 in count mode"""
+    if node_data.get('loopType', 'forEach') == 'count':
+        return list(range(max(0, int(node_data.get('iterations', 1)))))
+    if not isinstance(input_data, dict):
+        return input_data if isinstance(input_data, list) else []
+    
+    field = node_data.get('array') or 'data'
+    value = input_data.get(field)
+    if value is None and field == 'data':
+        value = input_data.get('items', input_data.get('response'))
+    if isinstance(value, str):
+        # AI nodes return text: accept a JSON array, otherwise one item per non-empty line
+        try:
+            value = json_lib.loads(value)
+        except ValueError:
+            value = [line.strip() for line in value.splitlines() if line.strip()]
+    return value if isinstance(value, list) else []
+
+def loop_item_input(item: Any, index: int) -> Dict[str, Any]:
+    """Input of a loop body's first nodes for one item"""
+    item_input = dict(item) if isinstance(item, dict) else {}
+    item_input.update({
+        "item": item,
+        "index": index,
+        "response": item if isinstance(item, str) else json_lib.dumps(item, default=str)
+    })
+    return item_input
+
+async def run_workflow_dag(
+    plan: Dict[str, Any],
+    run_node,
+    skip_node=None,
+    max_parallel: int = WORKFLOW_MAX_PARALLEL_NODES,
+    completed: Optional[Dict[str, List[str]]] = None
+):
+    """Run every node once all of its parents are resolved, up to max_parallel nodes at a time.
+    
+    run_node(node_id) returns the children whose incoming edge is taken (only the chosen
+    branch for condition/switch nodes), or None when the node failed, in which case its
+    children never start. A node all of whose incoming edges were not taken is skipped
+    (skip_node(node_id) is awaited), and so are its exclusive descendants; a join that still
+    has a taken incoming edge runs. `completed` maps nodes reused from an earlier execution
+    to their taken children; those nodes are not run again.
+    """
+    completed = completed or {}
+    semaphore = asyncio.Semaphore(max(1, max_parallel))
+    remaining = {node_id: len(plan['parents'][node_id]) for node_id in plan['order']}
+    live_inputs = {node_id: 0 for node_id in plan['order']}
+    ready = [node_id for node_id in plan['order'] if not plan['parents'][node_id] and node_id not in completed]
+    running = set()
+    
+    async def run(node_id: str):
+        async with semaphore:
+            return node_id, await run_node(node_id)
+    
+    def resolve(node_id: str, taken: Optional[List[str]]):
+        if taken is None:
+            return
+        for child in plan['children'][node_id]:
+            remaining[child] -= 1
+            if child in taken:
+                live_inputs[child] += 1
+            if remaining[child] == 0 and child not in completed:
+                ready.append(child)
+    
+    async def dispatch():
+        while ready:
+            node_id = ready.pop(0)
+            if live_inputs[node_id] or not plan['parents'][node_id]:
+                running.add(asyncio.create_task(run(node_id)))
+            else:
+                if skip_node:
+                    await skip_node(node_id)
+                resolve(node_id, [])
+    
+    for node_id in plan['order']:
+        if node_id in completed:
+            resolve(node_id, completed[node_id])
+    
+    try:
+        await dispatch()
+        while running:
+            done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+            running.difference_update(done)
+            for task in done:
+                node_id, taken = task.result()
+                resolve(node_id, taken)
+            await dispatch()
+    finally:
+        # On failure or cancellation, stop sibling branches that are still running
+        for task in running:
+            task.cancel()
+        if running:
+            await asyncio.gather(*running, return_exceptions=True)
+
+# ============ WORKFLOW COMPILATION ============
+
+# Workflows are compiled when they are saved: the graph is checked and its plan stored on the
+# workflow document, so a broken workflow is rejected by the editor instead of failing mid-run
+# and executions start from the stored plan. Bump the version when the plan format or the
+# checks change; plans stored by an older version are recompiled on the next run.
+WORKFLOW_PLAN_VERSION = 1
+
+# Node types the executor runs, with the media their results carry
+WORKFLOW_NODE_OUTPUTS: Dict[str, Tuple[str, ...]] = {
+    'start': (), 'gemini': (), 'http': (), 'database': (), 'elevenlabs': (), 'manychat': (),
+    'videogen': ('video',), 'imagetovideo': ('video',), 'imagegen': ('image',), 'screenshot': ('image',),
+    'stitch': ('video',), 'texttospeech': ('audio',), 'audiooverlay': ('video',), 'texttomusic': ('audio',),
+    'audiostitch': ('video',), 'taskplanner': (), 'condition': (), 'switch': (), 'loop': (), 'delay': (), 'end': (),
+}
+# Offered by the editor but not executable yet: saved with a warning
+WORKFLOW_DESIGN_ONLY_NODE_TYPES = {'elevenlabsconversational'}
+
+CONDITION_OPERATORS = ('equals', 'not_equals', 'greater_than', 'less_than', 'contains')
+DELAY_UNITS = ('seconds', 'minutes', 'hours')
+
+class WorkflowValidationError(ValueError):
+    """Raised by compile_workflow with every problem found in the workflow"""
+    
+    def __init__(self, errors: List[str]):
+        super().__init__("; ".join(errors))
+        self.errors = errors
+
+def workflow_source_hash(workflow: Dict[str, Any]) -> str:
+    """Hash of everything a plan depends on (node positions are left out)"""
+    payload = json_lib.dumps({
+        "nodes": [{"id": node['id'], "type": node['type'], "data": node.get('data') or {}} for node in workflow['nodes']],
+        "edges": [{"source": edge['source'], "target": edge['target'], "label": edge.get('label')} for edge in workflow['edges']]
+    }, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:16]
+
+def plan_node_ids(plan: Dict[str, Any]) -> List[str]:
+    """Every node of a plan, loop bodies included"""
+    node_ids = []
+    for node_id in plan['order']:
+        node_ids.append(node_id)
+        body = plan.get('loop_bodies', {}).get(node_id)
+        if body:
+            node_ids.extend(plan_node_ids(body))
+    return node_ids
+
+def workflow_node_config_errors(node: Dict[str, Any]) -> List[str]:
+    """Problems with a node's settings that would make it fail or misbehave at run time"""
+    node_type = node['type']
+    data = node.get('data') or {}
+    errors = []
+    
+    def check_number(field: str, default: Any, minimum: float, whole: bool = True):
+        value = data.get(field)
+        try:
+            number = (int if whole else float)(default if value in (None, '') else value)
+        except (TypeError, ValueError):
+            errors.append(f"{field} must be a {'whole ' if whole else ''}number")
+            return
+        if number < minimum:
+            errors.append(f"{field} must be at least {minimum}")
+    
+    if data.get('cachePolicy') and data['cachePolicy'] not in NODE_CACHE_POLICIES:
+        errors.append(f"unknown cache policy {data['cachePolicy']}")
+    check_number('timeoutSeconds', WORKFLOW_NODE_TIMEOUT, 1, whole=False)
+    
+    if node_type == 'http':
+        if not str(data.get('url') or '').strip():
+            errors.append("a URL is required")
+        if str(data.get('method') or 'GET').upper() not in ('GET', 'POST'):
+            errors.append(f"unsupported HTTP method {data['method']}")
+    elif node_type == 'database':
+        query = data.get('query', '{}')
+        if isinstance(query, str):
+            try:
+                query = json_lib.loads(query or '{}')
+            except ValueError:
+                query = None
+        if not isinstance(query, dict):
+            errors.append("the query must be a JSON object")
+    elif node_type == 'condition':
+        if data.get('operator', 'equals') not in CONDITION_OPERATORS:
+            errors.append(f"unknown operator {data['operator']}")
+    elif node_type == 'switch':
+        cases = data.get('cases', '[]')
+        if isinstance(cases, str):
+            try:
+                cases = json_lib.loads(cases or '[]')
+            except ValueError:
+                cases = None
+        if not isinstance(cases, list):
+            errors.append("cases must be a JSON array")
+    elif node_type == 'loop':
+        loop_type = data.get('loopType', 'forEach')
+        if loop_type not in ('forEach', 'count', 'while'):
+            errors.append(f"unknown loop type {loop_type}")
+        if loop_type == 'count':
+            check_number('iterations', 1, 0)
+        check_number('concurrency', LOOP_DEFAULT_CONCURRENCY, 1)
+    elif node_type == 'delay':
+        check_number('duration', 1, 0)
+        if data.get('unit', 'seconds') not in DELAY_UNITS:
+            errors.append(f"unknown unit {data['unit']}")
+    elif node_type == 'screenshot':
+        if data.get('format', 'png') not in FRAME_FORMATS:
+            errors.append(f"unsupported frame format {data['format']}")
+        frame_mode = data.get('frameMode', 'last')
+        if frame_mode not in ('last', 'count', 'timestamps'):
+            errors.append(f"unknown frame mode {frame_mode}")
+        elif frame_mode == 'count':
+            check_number('frameCount', 1, 1)
+        elif frame_mode == 'timestamps' and frame_timestamps(data, None) == [None]:
+            errors.append("no valid timestamps given")
+    elif node_type in ('videogen', 'imagetovideo'):
+        check_number('duration', 4, 1)
+    elif node_type == 'texttomusic':
+        check_number('duration_seconds', 120, 1, whole=False)
+    
+    return [f"Node {node['id']} ({node_type}): {error}" for error in errors]
+
+def workflow_node_input_errors(node: Dict[str, Any], parents: Dict[str, List[str]], nodes_dict: Dict[str, Dict[str, Any]]) -> List[str]:
+    """Problems with the media a node receives from the nodes connected upstream of it"""
+    node_id, node_type = node['id'], node['type']
+    ancestors = set()
+    stack = list(parents[node_id])
+    while stack:
+        parent = stack.pop()
+        if parent not in ancestors:
+            ancestors.add(parent)
+            stack.extend(parents[parent])
+    
+    def producers(kind: str, among) -> List[str]:
+        return [other for other in among if kind in WORKFLOW_NODE_OUTPUTS.get(nodes_dict[other]['type'], ())]
+    
+    errors = []
+    if node_type == 'screenshot':
+        # Reads the video of its direct input; loop items may carry videos of their own
+        if not producers('video', parents[node_id]) and not any(nodes_dict[parent]['type'] == 'loop' for parent in parents[node_id]):
+            errors.append("needs a video node connected directly into it")
+    elif node_type == 'stitch':
+        found = len(producers('video', ancestors))
+        if found < 2:
+            errors.append(f"needs at least 2 video nodes upstream (found {found})")
+    elif node_type == 'audiooverlay':
+        if not producers('video', ancestors):
+            errors.append("needs a video node upstream")
+        if not producers('audio', ancestors):
+            errors.append("needs a text-to-speech or music node upstream")
+    elif node_type == 'audiostitch':
+        if not any(nodes_dict[other]['type'] == 'stitch' for other in ancestors):
+            errors.append("needs a stitch node upstream")
+        if not producers('audio', ancestors):
+            errors.append("needs a text-to-speech or music node upstream")
+    elif node_type == 'imagetovideo':
+        if not (node.get('data') or {}).get('uploadedImage') and not producers('image', ancestors):
+            errors.append("needs an uploaded image or an image node upstream")
+    
+    return [f"Node {node_id} ({node_type}): {error}" for error in errors]
+
+def compile_workflow(workflow: Dict[str, Any]) -> Dict[str, Any]:
+    """Validate a workflow and build its execution plan.
+    
+    Returns the workflow document fields to store: `execution_plan` (version, source hash and
+    plan) and `validation_warnings`. Raises WorkflowValidationError listing every error found.
+    """
+    errors = []
+    warnings = []
+    nodes_dict: Dict[str, Dict[str, Any]] = {}
+    for node in workflow['nodes']:
+        if node['id'] in nodes_dict:
+            errors.append(f"Duplicate node id {node['id']}")
+        nodes_dict[node['id']] = node
+    for edge in workflow['edges']:
+        for end in (edge['source'], edge['target']):
+            if end not in nodes_dict:
+                warnings.append(f"Edge {edge['id']} points to missing node {end} and is ignored")
+    
+    try:
+        plan = build_workflow_plan(workflow)
+    except ValueError as e:
+        raise WorkflowValidationError(errors + [str(e)])
+    
+    planned = plan_node_ids(plan)
+    planned_set = set(planned)
+    orphans = [node_id for node_id in nodes_dict if node_id not in planned_set]
+    if orphans:
+        warnings.append(f"Not connected to a start node, so never run: {', '.join(orphans)}")
+    
+    parents: Dict[str, List[str]] = {node_id: [] for node_id in planned}
+    for edge in workflow['edges']:
+        source, target = edge['source'], edge['target']
+        if source in planned_set and target in planned_set and source not in parents[target]:
+            parents[target].append(source)
+    
+    for node_id in planned:
+        node = nodes_dict[node_id]
+        if node['type'] in WORKFLOW_DESIGN_ONLY_NODE_TYPES:
+            warnings.append(f"Node {node_id} ({node['type']}): cannot run in workflows yet and will fail")
+        elif node['type'] not in WORKFLOW_NODE_OUTPUTS:
+            errors.append(f"Node {node_id}: unknown node type {node['type']}")
+        else:
+            errors.extend(workflow_node_config_errors(node))
+            errors.extend(workflow_node_input_errors(node, parents, nodes_dict))
+    
+    if errors:
+        raise WorkflowValidationError(errors)
+    return {
+        "execution_plan": {
+            "version": WORKFLOW_PLAN_VERSION,
+            "source": workflow_source_hash(workflow),
+            "compiled_at": datetime.now(timezone.utc).isoformat(),
+            "plan": plan
+        },
+        "validation_warnings": warnings
+    }
+
+def compiled_workflow_fields(workflow: Dict[str, Any]) -> Dict[str, Any]:
+    """compile_workflow for the API: an invalid workflow is a 400 listing its errors"""
+    try:
+        return compile_workflow(workflow)
+    except WorkflowValidationError as e:
+        raise HTTPException(status_code=400, detail=f"Workflow is invalid: {e}")
+
+async def workflow_execution_plan(workflow: Dict[str, Any]) -> Dict[str, Any]:
+    """The workflow's stored plan, recompiled (and stored again) when missing or out of date"""
+    stored = workflow.get('execution_plan') or {}
+    if stored.get('version') == WORKFLOW_PLAN_VERSION and stored.get('source') == workflow_source_hash(workflow):
+        return stored['plan']
+    
+    compiled = compiled_workflow_fields(workflow)
+    await db.workflows.update_one({"id": workflow['id']}, {"$set": compiled})
+    logging.info(f"[WORKFLOW] Recompiled plan of workflow {workflow['id']} (version {WORKFLOW_PLAN_VERSION})")
+    return compiled['execution_plan']['plan']
+
+class WorkflowExecution(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    workflow_id: str
+    workflow_name: str
+    user_id: str
+    status: str  # 'queued', 'running', 'completed', 'failed', 'cancelled'
+    progress: int = 0
+    current_node: Optional[str] = None
+    queued_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    started_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    completed_at: Optional[datetime] = None
+    duration: Optional[int] = None  # milliseconds
+    execution_log: List[str] = []
+    results: Dict[str, Any] = {}
+    blob_refs: List[str] = []  # Blob store hashes of heavy outputs referenced from results
+    failed_nodes: List[str] = []
+    skipped_nodes: List[str] = []  # Nodes on branches a condition/switch did not take
+    node_fingerprints: Dict[str, str] = {}  # Node config hashes at execution time, by node id
+    node_spans: Dict[str, Dict[str, Any]] = {}  # Timing, provider/media time and sizes of each node run, by node id
+    parent_execution_id: Optional[str] = None  # Set when this execution resumes an earlier one
+    resumed_from_node: Optional[str] = None
+    reused_nodes: List[str] = []
+    inputs: Dict[str, Any] = {}  # Fed to the start node and to `{{field}}` placeholders in node settings
+    batch_id: Optional[str] = None
+    deadline_seconds: Optional[float] = None  # Counted from when the execution starts running
+    cancel_requested_at: Optional[datetime] = None
+    error: Optional[str] = None
+
+# Allowed execution state transitions: queued -> running -> completed/failed/cancelled
+EXECUTION_TRANSITIONS = {
+    'running': ['queued'],
+    'completed': ['running'],
+    'failed': ['queued', 'running'],
+    'cancelled': ['queued', 'running'],
+}
+
+# Background tasks of executions running in this process, by execution id
+_execution_tasks: Dict[str, asyncio.Task] = {}
+
+async def transition_execution(
+    execution_id: str,
+    new_status: str,
+    log_lines: Optional[List[str]] = None,
+    match: Optional[Dict[str, Any]] = None,
+    **fields
+) -> bool:
+    """Atomically move an execution to a new state; returns False if the transition is not allowed.
+    
+    match adds conditions the execution must still meet for the transition to apply.
+    """
+    now = datetime.now(timezone.utc)
+    push = {"status_history": {"status": new_status, "at": now.isoformat()}}
+    if log_lines:
+        push["execution_log"] = {"$each": log_lines}
+    result = await db.workflow_executions.update_one(
+        {"id": execution_id, "status": {"$in": EXECUTION_TRANSITIONS[new_status]}, **(match or {})},
+        {
+            "$set": {"status": new_status, **fields},
+            "$push": push
+        }
+    )
+    if result.modified_count == 0:
+        logging.warning(f"[WORKFLOW] Execution {execution_id} could not transition to {new_status}")
+        return False
+    
+    if log_lines:
+        execution_events.publish(execution_id, 'log', lines=log_lines)
+    execution_events.publish(
+        execution_id, 'status',
+        status=new_status,
+        **{key: fields[key] for key in ('progress', 'error', 'duration') if key in fields}
+    )
+    return True
+
+# Base64 media outputs above this size are kept in the blob store and referenced from results,
+# so each per-node update stays small however many media nodes the workflow has
+WORKFLOW_INLINE_RESULT_LIMIT = int(os.environ.get('WORKFLOW_INLINE_RESULT_LIMIT', 16 * 1024))
+
+async def offload_result_media(value: Any, blob_refs: List[str]) -> Any:
+    """Return a copy of a node result with large `*_base64` fields replaced by blob references"""
+    if isinstance(value, dict):
+        stored = {}
+        for key, item in value.items():
+            if key.endswith('_base64') and isinstance(item, str) and len(item) > WORKFLOW_INLINE_RESULT_LIMIT:
+                data = await asyncio.to_thread(base64.b64decode, item)
+                content_hash = await write_blob(data)
+                blob_refs.append(content_hash)
+                stored[key[:-len('_base64')] + '_ref'] = {"blob": content_hash, "size_bytes": len(data)}
+            else:
+                stored[key] = await offload_result_media(item, blob_refs)
+        return stored
+    if isinstance(value, list):
+        return [await offload_result_media(item, blob_refs) for item in value]
+    return value
+
+def collect_result_blob_refs(value: Any, hashes: set) -> set:
+    """Collect the hashes of the offloaded `*_ref` blobs nested in a node result"""
+    if isinstance(value, dict):
+        for key, item in value.items():
+            if key.endswith('_ref') and isinstance(item, dict) and isinstance(item.get('blob'), str):
+                hashes.add(item['blob'])
+            else:
+                collect_result_blob_refs(item, hashes)
+    elif isinstance(value, list):
+        for item in value:
+            collect_result_blob_refs(item, hashes)
+    return hashes
+
+async def hydrate_result_media(value: Any) -> Any:
+    """Inline referenced blobs and artifacts back as `*_base64` fields"""
+    if isinstance(value, dict):
+        hydrated = {}
+        for key, item in value.items():
+            if key.endswith('_ref') and isinstance(item, dict) and 'blob' in item:
+                try:
+                    data = await read_blob(item['blob'])
+                    hydrated[key[:-len('_ref')] + '_base64'] = base64.b64encode(data).decode('utf-8')
+                except FileNotFoundError:
+                    logging.warning(f"[WORKFLOW] Result blob {item['blob']} is missing")
+                    hydrated[key] = item
+            elif key.endswith('_artifact') and isinstance(item, dict) and item.get('artifact'):
+                # Keep the handle and inline the media for clients that still expect base64
+                hydrated[key] = item
+                try:
+                    data = await read_artifact(item)
+                    hydrated[key[:-len('_artifact')] + '_base64'] = base64.b64encode(data).decode('utf-8')
+                except FileNotFoundError:
+                    logging.warning(f"[WORKFLOW] Artifact {item['artifact']} is missing")
+            else:
+                hydrated[key] = await hydrate_result_media(item)
+        return hydrated
+    if isinstance(value, list):
+        return [await hydrate_result_media(item) for item in value]
+    return value
+
+# Execution routes moved above to avoid route conflicts
+
+class ExecutionStartRequest(BaseModel):
+    deadline_seconds: Optional[float] = None  # Overrides WORKFLOW_EXECUTION_DEADLINE; 0 for no deadline
+
+@api_router.post("/workflows/{workflow_id}/execute")
+async def execute_workflow(workflow_id: str, request: Optional[ExecutionStartRequest] = None, user_id: str = Depends(get_current_user)):
+    workflow = await db.workflows.find_one({"id": workflow_id, "user_id": user_id}, {"_id": 0})
+    if not workflow:
+        raise HTTPException(status_code=404, detail="Workflow not found")
+    
+    plan = await workflow_execution_plan(workflow)
+    execution = await create_workflow_execution(
+        workflow, user_id, plan,
+        deadline_seconds=request.deadline_seconds if request else None
+    )
+    
+    return {
+        "execution_id": execution.id,
+        "workflow_id": workflow_id,
+        "status": "queued"
+    }
+
+async def request_execution_cancel(execution_id: str) -> bool:
+    """Flag a queued or running execution as cancelled and stop it if it runs in this process.
+    
+    An execution running in another process notices the flag within EXECUTION_CANCEL_POLL_INTERVAL.
+    Returns False when the execution had already finished.
+    """
+    flagged = await db.workflow_executions.update_one(
+        {"id": execution_id, "status": {"$in": ['queued', 'running']}},
+        {"$set": {"cancel_requested_at": datetime.now(timezone.utc).isoformat()}}
+    )
+    if not flagged.matched_count:
+        return False
+    
+    task = _execution_tasks.get(execution_id)
+    if task:
+        task.cancel()
+        await asyncio.wait([task], timeout=EXECUTION_CANCEL_GRACE)
+    return True
+
+@api_router.post("/workflows/executions/{execution_id}/cancel")
+async def cancel_execution(execution_id: str, user_id: str = Depends(get_current_user)):
+    """Stop an execution: running nodes are aborted, results of finished nodes are kept"""
+    execution = await db.workflow_executions.find_one({"id": execution_id, "user_id": user_id}, {"_id": 0, "status": 1})
+    if not execution:
+        raise HTTPException(status_code=404, detail="Execution not found")
+    if not await request_execution_cancel(execution_id):
+        raise HTTPException(status_code=409, detail=f"Execution already {execution['status']}")
+    
+    current = await db.workflow_executions.find_one({"id": execution_id}, {"_id": 0, "status": 1})
+    return {"execution_id": execution_id, "status": current['status'], "cancel_requested": True}
+
+class ExecutionResumeRequest(BaseModel):
+    from_node_id: Optional[str] = None
+
+def resume_seed_results(
+    plan: Dict[str, Any],
+    previous: Dict[str, Any],
+    current_fingerprints: Dict[str, str],
+    from_node_id: Optional[str] = None
+) -> Tuple[Dict[str, Any], set]:
+    """Split a resumed run into the earlier results it reuses and the nodes it runs again.
+    
+    Nodes that failed, never ran, were stopped or were edited since are rerun, along with
+    from_node_id and everything downstream of those. Returns (seed_results, rerun).
+    """
+    previous_results = previous.get('results', {})
+    previous_failed = set(previous.get('failed_nodes', []))
+    previous_fingerprints = previous.get('node_fingerprints', {})
+    
+    def reusable(node_id: str) -> bool:
+        result = previous_results.get(node_id)
+        # A skipped node stays skipped as long as the branch decisions upstream are reused
+        was_skipped = isinstance(result, dict) and result.get('status') == 'skipped'
+        return (
+            node_id not in previous_failed
+            and (is_successful_result(result) or was_skipped)
+            and previous_fingerprints.get(node_id) == current_fingerprints[node_id]
+        )
+    
+    rerun_roots = {node_id for node_id in plan['order'] if not reusable(node_id)}
+    if from_node_id:
+        rerun_roots.add(from_node_id)
+    rerun = rerun_roots | plan_descendants(plan, rerun_roots)
+    seed_results = {node_id: previous_results[node_id] for node_id in plan['order'] if node_id not in rerun}
+    return seed_results, rerun
+
+@api_router.post("/workflows/executions/{execution_id}/resume")
+async def resume_execution(execution_id: str, request: ExecutionResumeRequest, user_id: str = Depends(get_current_user)):
+    """Re-run an execution from a node, reusing the earlier results of everything upstream.
+    
+    Without from_node_id, reruns the nodes that failed, never ran or were edited since,
+    plus their descendants.
+    """
+    previous = await db.workflow_executions.find_one({"id": execution_id, "user_id": user_id}, {"_id": 0})
+    if not previous:
+        raise HTTPException(status_code=404, detail="Execution not found")
+    if previous['status'] in ('queued', 'running'):
+        raise HTTPException(status_code=409, detail="Execution is still running")
+    
+    workflow = await db.workflows.find_one({"id": previous['workflow_id'], "user_id": user_id}, {"_id": 0})
+    if not workflow:
+        raise HTTPException(status_code=404, detail="Workflow not found")
+    
+    plan = await workflow_execution_plan(workflow)
+    
+    if request.from_node_id and request.from_node_id not in plan['children']:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Node {request.from_node_id} is not a top-level node of the workflow (to re-run a loop body, resume from its loop node)"
+        )
+    
+    nodes_dict = {node['id']: node for node in workflow['nodes']}
+    seed_results, rerun = resume_seed_results(plan, previous, plan_fingerprints(plan, nodes_dict), request.from_node_id)
+    if not rerun:
+        raise HTTPException(status_code=400, detail="Every node of this execution already completed; choose a node to re-run from")
+    
+    execution = await create_workflow_execution(
+        workflow, user_id, plan,
+        seed_results=seed_results,
+        inputs=previous.get('inputs'),
+        deadline_seconds=previous.get('deadline_seconds'),
+        parent_execution_id=execution_id,
+        resumed_from_node=request.from_node_id
+    )
+    await db.workflow_executions.update_one({"id": execution_id}, {"$addToSet": {"resumed_by": execution.id}})
+    
+    return {
+        "execution_id": execution.id,
+        "workflow_id": workflow['id'],
+        "status": "queued",
+        "parent_execution_id": execution_id,
+        "reused_nodes": list(seed_results),
+        "rerun_nodes": [node_id for node_id in plan['order'] if node_id in rerun]
+    }
+
+async def create_workflow_execution(
+    workflow: Dict[str, Any],
+    user_id: str,
+    plan: Dict[str, Any],
+    seed_results: Optional[Dict[str, Any]] = None,
+    inputs: Optional[Dict[str, Any]] = None,
+    deadline_seconds: Optional[float] = None,
+    **lineage
+) -> WorkflowExecution:
+    """Record a queued execution and start it in the background.
+    
+    seed_results are results reused from an earlier execution; those nodes are not run again.
+    inputs are handed to the start node(s) and fill `{{field}}` placeholders in node settings.
+    deadline_seconds overrides WORKFLOW_EXECUTION_DEADLINE (0: no deadline).
+    """
+    seed_results = seed_results or {}
+    inputs = inputs or {}
+    if deadline_seconds is None:
+        deadline_seconds = WORKFLOW_EXECUTION_DEADLINE
+    nodes_dict = {node['id']: node for node in workflow['nodes']}
+    
+    execution = WorkflowExecution(
+        workflow_id=workflow['id'],
+        workflow_name=workflow.get('name', 'Unnamed Workflow'),
+        user_id=user_id,
+        status='queued',
+        progress=int(len(seed_results) / len(plan['order']) * 100),
+        results=seed_results,
+        reused_nodes=list(seed_results),
+        inputs=inputs,
+        deadline_seconds=deadline_seconds or None,
+        node_fingerprints=plan_fingerprints(plan, nodes_dict),
+        execution_log=[
+            f"Reusing result of node {node_id} from execution {lineage.get('parent_execution_id')}"
+            for node_id in seed_results
+        ],
+        **lineage
+    )
+    execution_doc = execution.model_dump()
+    execution_doc['status_history'] = [{"status": "queued", "at": execution.queued_at.isoformat()}]
+    execution_doc.update(worker_lease_fields())
+    
+    # The new execution holds its own references to the reused artifacts and offloaded blobs,
+    # so deleting the execution they came from does not remove them
+    seed_artifacts = list(collect_artifact_hashes(seed_results, set()))
+    seed_blobs = collect_result_blob_refs(seed_results, set()) - set(seed_artifacts)
+    execution_doc['blob_refs'] = seed_artifacts + sorted(seed_blobs)
+    await db.workflow_executions.insert_one(execution_doc)
+    await retain_artifacts(seed_artifacts)
+    
+    # Run in the background - the execution continues even if the client disconnects
+    start_workflow_execution(execution.id, workflow, user_id, plan, seed_results, inputs, execution.deadline_seconds)
+    return execution
+
+def start_workflow_execution(
+    execution_id: str,
+    workflow: Dict[str, Any],
+    user_id: str,
+    plan: Dict[str, Any],
+    seed_results: Optional[Dict[str, Any]] = None,
+    inputs: Optional[Dict[str, Any]] = None,
+    deadline_seconds: Optional[float] = None
+) -> asyncio.Task:
+    """Schedule an execution as a background task owned by this process"""
+    task = asyncio.create_task(run_workflow_execution(execution_id, workflow, user_id, plan, seed_results, inputs, deadline_seconds))
+    _execution_tasks[execution_id] = task
+    task.add_done_callback(lambda _: _execution_tasks.pop(execution_id, None))
+    return task
+
+async def run_workflow_execution(
+    execution_id: str,
+    workflow: Dict[str, Any],
+    user_id: str,
+    plan: Dict[str, Any],
+    seed_results: Optional[Dict[str, Any]] = None,
+    inputs: Optional[Dict[str, Any]] = None,
+    deadline_seconds: Optional[float] = None
+):
+    """Execute a workflow graph, persisting progress on the execution record"""
+    workflow_id = workflow['id']
+    started_at = datetime.now(timezone.utc)
+    deadline_at = started_at + timedelta(seconds=deadline_seconds) if deadline_seconds else None
+    if not await transition_execution(
+        execution_id, 'running',
+        started_at=started_at,
+        deadline_at=deadline_at.isoformat() if deadline_at else None
+    ):
+        return
+    
+    inputs = inputs or {}
+    nodes_dict = {
+        node['id']: {**node, 'data': render_input_placeholders(node.get('data') or {}, inputs)} if inputs else node
+        for node in workflow['nodes']
+    }
+    execution_order = plan['order']
+    
+    # Execute workflow; seeded nodes were reused from an earlier execution and do not run again
+    seed_results = seed_results or {}
+    results = dict(seed_results)
+    execution_log = []
+    failed_nodes = set()
+    total_nodes = len(execution_order)
+    completed_nodes = len(seed_results)
+    persisted_log_lines = 0
+    retained_artifacts = collect_artifact_hashes(seed_results, set())  # Artifacts this execution already holds a reference to
+    run_cache: Dict[str, Any] = {}  # Results of nodes with a 'run' or 'global' cache policy, by cache key
+    # Caps the nodes doing work at once across the whole execution, loop bodies included
+    node_slots = asyncio.Semaphore(WORKFLOW_MAX_PARALLEL_NODES)
+    persist_lock = asyncio.Lock()  # Keeps concurrent branches' log pushes in order
+    
+    def take_new_log_lines() -> List[str]:
+        nonlocal persisted_log_lines
+        new_lines = execution_log[persisted_log_lines:]
+        persisted_log_lines = len(execution_log)
+        return new_lines
+    
+    fused_chains = plan_media_chains(plan, nodes_dict)
+    
+    def fused_media_stages(node_id: str, results: Dict[str, Any]) -> Optional[List[Dict[str, Any]]]:
+        """Inputs recorded by the nodes before node_id in its fused chain.
+        
+        None when node_id is not fused or an earlier member produced a real output instead
+        (e.g. reused from an execution that did not fuse it); the node then runs on its own.
+        """
+        chain = fused_chains.get(node_id)
+        if not chain:
+            return None
+        stages = []
+        for member in chain[:chain.index(node_id)]:
+            member_result = results.get(member)
+            if not isinstance(member_result, dict) or not member_result.get('fused_into'):
+                return None
+            if 'video_inputs' in member_result:
+                stages.append({"type": "stitch", "videos": [artifact_path(handle) for handle in member_result['video_inputs']]})
+            else:
+                stages.append({"type": "audiooverlay", "audio": member_result['audio_input']})
+        return stages
+    
+    async def store_node_result(result: Any) -> Tuple[Any, List[str]]:
+        """Offload a result's heavy media and take references to its new artifacts"""
+        blob_refs = []
+        stored_result = await offload_result_media(result, blob_refs)
+        new_artifacts = list(collect_artifact_hashes(stored_result, set()) - retained_artifacts)
+        retained_artifacts.update(new_artifacts)
+        await retain_artifacts(new_artifacts)
+        blob_refs.extend(new_artifacts)
+        return stored_result, blob_refs
+    
+    async def render_fused_members(node_id: str):
+        """Render the nodes fused into node_id on their own, as if they had never been fused.
+        
+        Called when node_id, the last node of a fused chain, failed, so the stitched video
+        (and the overlay) the chain would have produced node by node still exists.
+        """
+        stages = fused_media_stages(node_id, results)
+        if not stages:
+            return
+        chain = fused_chains[node_id]
+        execution_log.append(f"Fused chain {chain} failed at {node_id}; rendering {', '.join(chain[:-1])} on their own")
+        members = {}
+        try:
+            async with node_slots, media_pool.scratch_dir() as temp_dir:
+                video = None
+                for index, (member, stage) in enumerate(zip(chain, stages)):
+                    output_path = f"{temp_dir}/fused_member_{index}.mp4"
+                    if stage['type'] == 'stitch':
+                        stitch_mode = await stitch_videos(stage['videos'], output_path, temp_dir)
+                        video = await create_artifact('video', 'video/mp4', path=output_path)
+                        members[member] = {
+                            "status": "success",
+                            "video_artifact": video,
+                            "videos_stitched": len(stage['videos']),
+                            "stitch_mode": stitch_mode,
+                            "prompt": f"Stitched {len(stage['videos'])} videos together"
+                        }
+                    else:
+                        cmd = audio_overlay_command(artifact_path(video), artifact_path(stage['audio']), output_path)
+                        await media_pool.run(cmd, tag='AUDIO_OVERLAY', duration=video.get('duration'))
+                        video = await create_artifact('video', 'video/mp4', path=output_path)
+                        members[member] = {"status": "success", "video_artifact": video, "prompt": "Video with voiceover overlay"}
+        except Exception as e:
+            logging.error(f"[MEDIA_CHAIN] Rendering the nodes fused into {node_id} failed: {str(e)}")
+            execution_log.append(f"Rendering the nodes fused into {node_id} failed: {str(e)}")
+        
+        for member, member_result in members.items():
+            results[member] = member_result
+            stored_result, blob_refs = await store_node_result(member_result)
+            async with persist_lock:
+                await db.workflow_executions.update_one(
+                    {"id": execution_id},
+                    {"$set": {f"results.{member}": stored_result}, "$addToSet": {"blob_refs": {"$each": blob_refs}}}
+                )
+            execution_events.publish(
+                execution_id, 'node_finished',
+                node_id=member,
+                node_type=nodes_dict[member]['type'],
+                failed=False,
+                cached=False,
+                result=stored_result
+            )
+    
+    def media_progress_reporter(node_id: str):
+        """Callback publishing a node's ffmpeg progress as node_progress events, once per percent"""
+        reported = {"percent": -1}
+        
+        def report(fraction: float):
+            percent = int(fraction * 100)
+            if percent > reported["percent"]:
+                reported["percent"] = percent
+                execution_events.publish(execution_id, 'node_progress', node_id=node_id, progress=percent)
+        return report
+    
+    async def execute_node(node_id: str, input_data: Any, results: Dict[str, Any], failures: Optional[set] = None):
+        # `results` holds the outputs of this node's upstream nodes only, in topological order,
+        # so parallel sibling branches never leak into each other. A node that raises is added
+        # to `failures` (the execution's failed nodes unless a loop item tracks its own)
+        node = nodes_dict.get(node_id)
+        if not node:
+            return None
+        
+        node_type = node['type']
+        node_data = node['data']
+        
+        execution_log.append(f"Executing {node_type} node: {node_id}")
+        on_media_progress = media_progress_reporter(node_id)
+        
+        try:
+            if node_type == 'start':
+                result = {"status": "started", "data": input_data}
+            
+            elif node_type == 'gemini':
+                # Execute AI chat node with conversation history and context from previous AI nodes
+                prompt = node_data.get('prompt', 'Hello')
+                model = node_data.get('model', 'gemini-2.5-pro')
+                
+                # Build context from all previous AI responses in this workflow
+                context_history = []
+                audio_specs_found = False
+                
+                for prev_node_id, prev_result in results.items():
+                    if isinstance(prev_result, dict) and 'response' in prev_result and 'model' in prev_result:
+                        # This was an AI node - include its response in context
+                        response_text = prev_result['response']
+                        context_history.append({
+                            'node_id': prev_node_id,
+                            'response': response_text
+                        })
+                        
+                        # Check if this response contains audio/voice specifications
+                        if any(keyword in response_text.upper() for keyword in ['VOICE:', 'SPEAKING:', 'BACKGROUND AUDIO:', 'VOICEOVER']):
+                            audio_specs_found = True
                 
-                async with aiohttp.ClientSession() as session:
-                    if method == 'GET':
-                        async with session.get(url) as resp:
-                            result = {"status": resp.status, "data": await resp.text()}
-                    elif method == 'POST':
-                        body = node_data.get('body', {})
-                        async with session.post(url, json=body) as resp:
-                            result = {"status": resp.status, "data": await resp.text()}
+                # Build enriched prompt with context
+                if context_history:
+                    context_text = "\n\n" + "="*80 + "\n"
+                    context_text += "PREVIOUS AI RESPONSES - USE FOR CONTEXT AND CONTINUITY\n"
+                    context_text += "="*80 + "\n"
+                    
+                    for idx, ctx in enumerate(context_history, 1):
+                        context_text += f"\n--- Previous AI Node {idx} ({ctx['node_id']}) ---\n{ctx['response']}\n"
+                    
+                    context_text += "\n" + "="*80 + "\n"
+                    context_text += "YOUR CURRENT TASK\n"
+                    context_text += "="*80 + "\n\n"
+                    
+                    if audio_specs_found:
+                        enriched_prompt = context_text + prompt + "\n\n[CRITICAL INSTRUCTIONS:\n- If the previous AI specified VOICE/AUDIO characteristics, you MUST use the EXACT SAME specifications for perfect audio continuity\n- Copy voice gender, age, tone, speaking pace, background audio EXACTLY as specified\n- This ensures the same voice and sounds throughout all videos\n- For script continuation, complete the incomplete sentence naturally\n- Maintain visual and narrative continuity as well]"
                     else:
-                        result = {"error": "Unsupported HTTP method"}
+                        enriched_prompt = context_text + prompt + "\n\n[Remember: Use the previous AI responses above as context to maintain continuity and coherence in your response.]"
+                else:
+                    enriched_prompt = prompt
+                
+                logging.info(f"[GEMINI] Node {node_id} executing with {len(context_history)} previous AI context(s)")
+                
+                # Use execution-specific session to maintain conversation history within workflow
+                chat = LlmChat(
+                    api_key=os.environ.get('EMERGENT_LLM_KEY'),
+                    session_id=f"{workflow_id}_{execution_id}",  # Unique per workflow execution
+                    system_message="You are a helpful AI assistant in an automation workflow. When provided with previous AI responses, use them as context to maintain continuity, consistency, and logical flow in your responses."
+                ).with_model('gemini', model)
+                
+                user_message = UserMessage(text=enriched_prompt)
+                with span_timer('provider'):
+                    response = await chat.send_message(user_message)
+                result = {"response": response, "model": model, "original_prompt": prompt}
+            
+            elif node_type == 'http':
+                # Execute HTTP request
+                url = node_data.get('url', '')
+                method = node_data.get('method', 'GET').upper()
+                
+                with span_timer('provider'):
+                    async with aiohttp.ClientSession() as session:
+                        if method == 'GET':
+                            async with session.get(url) as resp:
+                                result = {"status": resp.status, "data": await resp.text()}
+                        elif method == 'POST':
+                            body = node_data.get('body', {})
+                            async with session.post(url, json=body) as resp:
+                                result = {"status": resp.status, "data": await resp.text()}
+                        else:
+                            result = {"error": "Unsupported HTTP method"}
             
             elif node_type == 'database':
                 # Execute database read
@@ -5209,20 +8943,17 @@ async def execute_workflow(workflow_id: str, user_id: str = Depends(get_current_
                     result = {"status": "error", "error": "No prompt provided for video generation"}
                 else:
                     try:
-                        video_gen = OpenAIVideoGeneration(api_key=os.environ.get('EMERGENT_LLM_KEY'))
-                        video_bytes = video_gen.text_to_video(
-                            prompt=prompt,
-                            model="sora-2",
-                            size=size,
-                            duration=duration,
-                            max_wait_time=600
-                        )
-                        
-                        if video_bytes:
-                            video_base64 = base64.b64encode(video_bytes).decode('utf-8')
-                            result = {"status": "success", "video_base64": video_base64, "duration": duration, "size": size, "prompt": prompt}
-                        else:
-                            result = {"status": "failed", "error": "Video generation returned no data"}
+                        with span_timer('provider'):
+                            download_path = await generate_sora_video(prompt, size, duration, log_tag='VIDEOGEN')
+                        try:
+                            if download_path.stat().st_size:
+                                video_artifact = await create_artifact('video', 'video/mp4', path=download_path)
+                                result = {"status": "success", "video_artifact": video_artifact, "duration": duration, "size": size, "prompt": prompt}
+                            else:
+                                result = {"status": "failed", "error": "Video generation returned no data"}
+                        finally:
+                            if download_path.exists():
+                                download_path.unlink()
                     except Exception as e:
                         result = {"status": "error", "error": f"Video generation failed: {str(e)}"}
             
@@ -5246,8 +8977,8 @@ async def execute_workflow(workflow_id: str, user_id: str = Depends(get_current_
                 for res_node_id, res_data in results.items():
                     if isinstance(res_data, dict):
                         res_keys = list(res_data.keys())
-                        has_image = 'image_base64' in res_data
-                        has_video = 'video_base64' in res_data
+                        has_image = 'image_artifact' in res_data
+                        has_video = 'video_artifact' in res_data
                         logging.info(f"[IMAGETOVIDEO] results['{res_node_id}']: keys={res_keys}, has_image={has_image}, has_video={has_video}")
                 
                 # Get prompt from node config OR from previous node's response
@@ -5272,26 +9003,27 @@ async def execute_workflow(workflow_id: str, user_id: str = Depends(get_current_
                 
                 # Get image from uploaded config, previous node, or search all screenshot nodes
                 image_base64 = node_data.get('uploadedImage')  # Check for uploaded image first
+                image_artifact = None
                 
                 # Remove data URL prefix if present
                 if image_base64 and 'base64,' in image_base64:
                     image_base64 = image_base64.split('base64,')[1]
                 
                 # If no uploaded image, try to get from input
-                if not image_base64 and isinstance(input_data, dict):
-                    image_base64 = input_data.get('image_base64')
-                    if image_base64:
+                if not image_base64:
+                    image_artifact = result_artifact(input_data, 'image')
+                    if image_artifact:
                         logging.info(f"[IMAGETOVIDEO] Found image in input_data")
                 
                 # If still no image, search all previous screenshot nodes
-                if not image_base64:
+                if not image_base64 and not image_artifact:
                     logging.info(f"[IMAGETOVIDEO] Searching for image in {len(results)} previous nodes")
                     for node_id_search, result in results.items():
-                        if isinstance(result, dict) and result.get('image_base64'):
-                            image_base64 = result.get('image_base64')
+                        image_artifact = result_artifact(result, 'image')
+                        if image_artifact:
                             logging.info(f"[IMAGETOVIDEO] Found image from node: {node_id_search}")
                             break
-                    if not image_base64:
+                    if not image_artifact:
                         logging.error(f"[IMAGETOVIDEO] No image found in any previous node. Results keys: {list(results.keys())}")
                 
                 duration = node_data.get('duration', 4)
@@ -5299,137 +9031,41 @@ async def execute_workflow(workflow_id: str, user_id: str = Depends(get_current_
                 
                 if not prompt:
                     result = {"status": "error", "error": "No prompt provided for image-to-video generation"}
-                elif not image_base64:
+                elif not image_base64 and not image_artifact:
                     result = {"status": "error", "error": "No image data found from previous node. Connect a Screenshot node before Image-To-Video node."}
                 else:
                     try:
                         logging.info(f"[IMAGETOVIDEO] Starting image-to-video generation with prompt: {prompt[:100]}")
                         logging.info(f"[IMAGETOVIDEO] Parameters: duration={duration}, size={size}")
                         
-                        # Call OpenAI Sora 2 API directly with correct input_reference parameter
-                        import requests
-                        import time
-                        from emergentintegrations.llm.utils import get_integration_proxy_url, get_app_identifier
-                        
-                        api_key = os.environ.get('EMERGENT_LLM_KEY')
-                        proxy_url = get_integration_proxy_url()
-                        base_url = proxy_url + "/llm/openai/v1"
-                        
-                        headers = {
-                            "Authorization": f"Bearer {api_key}",
-                            "Content-Type": "application/json"
-                        }
-                        
-                        app_url = get_app_identifier()
-                        if app_url:
-                            headers['X-App-ID'] = app_url
-                        
-                        # Decode the base64 image data
-                        image_bytes = base64.b64decode(image_base64)
-                        
-                        # Prepare multipart form data (Sora 2 expects file upload, not JSON)
-                        files = {
-                            'input_reference': ('image.png', image_bytes, 'image/png')
-                        }
-                        
-                        data = {
-                            "model": "sora-2",
-                            "prompt": prompt,
-                            "size": size,
-                            "seconds": str(duration)
-                        }
-                        
-                        logging.info(f"[IMAGETOVIDEO] Sending multipart request to {base_url}/videos")
-                        logging.info(f"[IMAGETOVIDEO] Data fields: {data.keys()}")
+                        # Uploaded images arrive as base64, generated ones as artifacts
+                        if image_base64:
+                            image_bytes = base64.b64decode(image_base64)
+                        else:
+                            image_bytes = await read_artifact(image_artifact)
                         logging.info(f"[IMAGETOVIDEO] Image size: {len(image_bytes)} bytes")
                         
-                        # Update headers for multipart/form-data (remove Content-Type, requests will set it)
-                        upload_headers = {k: v for k, v in headers.items() if k.lower() != 'content-type'}
-                        
-                        # Initiate video generation with multipart form data
-                        response = requests.post(f"{base_url}/videos", headers=upload_headers, data=data, files=files, timeout=30)
-                        
-                        if response.status_code != 200:
-                            logging.error(f"[IMAGETOVIDEO] API error {response.status_code}: {response.text}")
-                        
-                        response.raise_for_status()
-                        
-                        data = response.json()
-                        operation_id = data.get("id") or data.get("operation_id")
-                        
-                        if not operation_id:
-                            logging.error(f"[IMAGETOVIDEO] No operation ID in response: {data}")
-                            result = {"status": "error", "error": "No operation ID returned from API"}
-                        else:
-                            logging.info(f"[IMAGETOVIDEO] Video generation initiated with ID: {operation_id}")
+                        with span_timer('provider'):
+                            download_path = await generate_sora_video(prompt, size, duration, image_bytes=image_bytes, log_tag='IMAGETOVIDEO')
+                        try:
+                            video_size = download_path.stat().st_size
+                            logging.info(f"[IMAGETOVIDEO] Downloaded {video_size} bytes")
                             
-                            # Wait for completion
-                            operation_url = f"{base_url}/videos/{operation_id}"
-                            start_time = time.time()
-                            max_wait_time = 600  # 10 minutes
-                            poll_interval = 10
-                            
-                            video_uri = None
-                            while time.time() - start_time < max_wait_time:
-                                time.sleep(poll_interval)
-                                
-                                status_response = requests.get(operation_url, headers=headers, timeout=30)
-                                status_response.raise_for_status()
-                                status_data = status_response.json()
-                                
-                                status = status_data.get("status", "").lower()
-                                
-                                if status in ["completed", "complete", "succeeded", "success"]:
-                                    logging.info(f"[IMAGETOVIDEO] Video generation completed!")
-                                    
-                                    # Get video URL or construct it
-                                    video_uri = (status_data.get("video_url") or status_data.get("url") or
-                                               status_data.get("download_url") or 
-                                               f"{base_url}/videos/{operation_id}/content")
-                                    
-                                    logging.info(f"[IMAGETOVIDEO] Video URI: {video_uri}")
-                                    break
-                                    
-                                elif status in ["failed", "error"]:
-                                    error_msg = status_data.get("error", "Unknown error")
-                                    logging.error(f"[IMAGETOVIDEO] Generation failed: {error_msg}")
-                                    result = {"status": "error", "error": f"Video generation failed: {error_msg}"}
-                                    break
-                                    
-                                else:
-                                    progress = status_data.get("progress", 0)
-                                    elapsed = int(time.time() - start_time)
-                                    logging.info(f"[IMAGETOVIDEO] Still processing... ({elapsed}s elapsed, status: {status}, progress: {progress}%)")
-                            
-                            # Download the video if URI was obtained
-                            if video_uri:
-                                logging.info(f"[IMAGETOVIDEO] Downloading video from: {video_uri}")
-                                
-                                download_response = requests.get(video_uri, headers=headers, stream=True, timeout=120)
-                                download_response.raise_for_status()
-                                
-                                video_bytes = b""
-                                for chunk in download_response.iter_content(chunk_size=8192):
-                                    if chunk:
-                                        video_bytes += chunk
-                                
-                                logging.info(f"[IMAGETOVIDEO] Downloaded {len(video_bytes)} bytes")
-                                
-                                if len(video_bytes) > 1000:
-                                    video_base64_encoded = base64.b64encode(video_bytes).decode('utf-8')
-                                    result = {
-                                        "status": "success",
-                                        "video_base64": video_base64_encoded,
-                                        "duration": duration,
-                                        "size": size,
-                                        "prompt": prompt
-                                    }
-                                    logging.info(f"[IMAGETOVIDEO] Success! Video encoded to base64")
-                                else:
-                                    result = {"status": "error", "error": f"Video data too small: {len(video_bytes)} bytes"}
+                            if video_size > 1000:
+                                video_artifact = await create_artifact('video', 'video/mp4', path=download_path)
+                                result = {
+                                    "status": "success",
+                                    "video_artifact": video_artifact,
+                                    "duration": duration,
+                                    "size": size,
+                                    "prompt": prompt
+                                }
+                                logging.info(f"[IMAGETOVIDEO] Success! Video stored as artifact {video_artifact['artifact']}")
                             else:
-                                if 'result' not in locals():
-                                    result = {"status": "error", "error": "Timeout waiting for video generation"}
+                                result = {"status": "error", "error": f"Video data too small: {video_size} bytes"}
+                        finally:
+                            if download_path.exists():
+                                download_path.unlink()
                                     
                     except Exception as e:
                         import traceback
@@ -5444,15 +9080,16 @@ async def execute_workflow(workflow_id: str, user_id: str = Depends(get_current_
                 
                 try:
                     image_gen = OpenAIImageGeneration(api_key=os.environ.get('EMERGENT_LLM_KEY'))
-                    images = await image_gen.generate_images(
-                        prompt=prompt,
-                        model="gpt-image-1",
-                        number_of_images=1
-                    )
+                    with span_timer('provider'):
+                        images = await image_gen.generate_images(
+                            prompt=prompt,
+                            model="gpt-image-1",
+                            number_of_images=1
+                        )
                     
                     if images and len(images) > 0:
-                        image_base64 = base64.b64encode(images[0]).decode('utf-8')
-                        result = {"status": "success", "image_base64": image_base64, "size": size, "prompt": prompt}
+                        image_artifact = await create_artifact('image', 'image/png', data=images[0])
+                        result = {"status": "success", "image_artifact": image_artifact, "size": size, "prompt": prompt}
                     else:
                         result = {"status": "failed", "error": "Image generation failed"}
                 except Exception as e:
@@ -5462,67 +9099,29 @@ async def execute_workflow(workflow_id: str, user_id: str = Depends(get_current_
                 # Execute Screenshot Extraction from Video
                 try:
                     # Get video from previous node's result
-                    video_base64 = None
-                    if isinstance(input_data, dict):
-                        video_base64 = input_data.get('video_base64')
+                    video_artifact = result_artifact(input_data, 'video')
                     
-                    if not video_base64:
+                    image_format = node_data.get('format', 'png')
+                    if not video_artifact:
                         result = {"status": "error", "error": "No video data found from previous node. Connect a Video Gen node before Screenshot node."}
+                    elif image_format not in FRAME_FORMATS:
+                        result = {"status": "error", "error": f"Unsupported frame format: {image_format}"}
                     else:
-                        import cv2
-                        import numpy as np
-                        from io import BytesIO
-                        
-                        # Decode video from base64
-                        video_bytes = base64.b64decode(video_base64)
-                        
-                        # Save temporarily to process with opencv
-                        temp_video_path = f"/tmp/temp_video_{str(uuid.uuid4())}.mp4"
-                        with open(temp_video_path, 'wb') as f:
-                            f.write(video_bytes)
-                        
-                        # Open video with opencv
-                        cap = cv2.VideoCapture(temp_video_path)
-                        
-                        # Get total frames
-                        total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-                        
-                        if total_frames > 0:
-                            # Set to last frame
-                            cap.set(cv2.CAP_PROP_POS_FRAMES, total_frames - 1)
-                            
-                            # Read last frame
-                            ret, frame = cap.read()
-                            
-                            if ret:
-                                # Convert BGR to RGB
-                                frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                                
-                                # Encode frame as PNG
-                                from PIL import Image
-                                img = Image.fromarray(frame_rgb)
-                                img_byte_arr = BytesIO()
-                                img.save(img_byte_arr, format='PNG')
-                                img_byte_arr = img_byte_arr.getvalue()
-                                
-                                # Convert to base64
-                                screenshot_base64 = base64.b64encode(img_byte_arr).decode('utf-8')
-                                
-                                result = {
-                                    "status": "success",
-                                    "image_base64": screenshot_base64,
-                                    "size": f"{frame.shape[1]}x{frame.shape[0]}",
-                                    "prompt": "Last frame screenshot from video"
-                                }
-                            else:
-                                result = {"status": "error", "error": "Failed to read last frame from video"}
-                        else:
-                            result = {"status": "error", "error": "Video has no frames"}
+                        timestamps = frame_timestamps(node_data, video_artifact.get('duration'))
+                        images = await asyncio.gather(*(
+                            extract_video_frame(video_artifact, at, image_format) for at in timestamps
+                        ))
+                        frames = [{"at": at, "image_artifact": image} for at, image in zip(timestamps, images)]
+                        image_artifact = images[-1]
                         
-                        # Cleanup
-                        cap.release()
-                        if os.path.exists(temp_video_path):
-                            os.remove(temp_video_path)
+                        result = {
+                            "status": "success",
+                            "image_artifact": image_artifact,
+                            "size": f"{image_artifact.get('width')}x{image_artifact.get('height')}",
+                            "prompt": "Last frame screenshot from video" if timestamps == [None] else f"{len(frames)} frames from video"
+                        }
+                        if len(frames) > 1:
+                            result["frames"] = frames
                         
                 except Exception as e:
                     result = {"status": "error", "error": f"Screenshot extraction failed: {str(e)}"}
@@ -5538,114 +9137,47 @@ async def execute_workflow(workflow_id: str, user_id: str = Depends(get_current_
                     video_list = []
                     video_sources = []
                     
-                    # Collect video_base64 from all previous nodes' results
+                    # Collect video artifacts from all previous nodes' results
                     for node_id_search, node_result in results.items():
-                        if isinstance(node_result, dict) and node_result.get('video_base64'):
-                            video_data = node_result['video_base64']
-                            video_list.append(video_data)
+                        video_artifact = result_artifact(node_result, 'video')
+                        if video_artifact:
+                            video_list.append(video_artifact)
                             video_sources.append(node_id_search)
-                            logging.info(f"[STITCH] Found video from node: {node_id_search} ({len(video_data)} chars)")
+                            logging.info(f"[STITCH] Found video from node: {node_id_search} ({video_artifact['size_bytes']} bytes)")
                     
                     logging.info(f"[STITCH] Total videos found: {len(video_list)}")
                     logging.info(f"[STITCH] Video sources: {video_sources}")
                     
                     if len(video_list) < 2:
                         result = {"status": "error", "error": f"Need at least 2 videos to stitch. Found {len(video_list)} videos from nodes: {video_sources}"}
+                    elif node_id in fused_chains:
+                        # The last node of the chain renders the stitch in the same ffmpeg run
+                        logging.info(f"[STITCH] Fused into {fused_chains[node_id][-1]}; not rendering on its own")
+                        result = {
+                            "status": "success",
+                            "fused_into": fused_chains[node_id][-1],
+                            "video_inputs": video_list,
+                            "videos_stitched": len(video_list),
+                            "prompt": f"Stitched {len(video_list)} videos together"
+                        }
                     else:
-                        import subprocess
-                        import tempfile
-                        
-                        # Save all videos to temporary files
-                        temp_files = []
-                        temp_dir = tempfile.mkdtemp()
-                        
-                        for idx, video_base64 in enumerate(video_list):
-                            video_bytes = base64.b64decode(video_base64)
-                            temp_path = f"{temp_dir}/video_{idx}.mp4"
-                            with open(temp_path, 'wb') as f:
-                                f.write(video_bytes)
-                            temp_files.append(temp_path)
-                        
-                        # Output file
-                        output_path = f"{temp_dir}/stitched_output.mp4"
-                        
-                        # Build ffmpeg command with seamless audio crossfading
-                        # For 2+ videos, we'll use complex filter to:
-                        # 1. Normalize audio for each clip
-                        # 2. Add 0.5 second crossfade between audio tracks
-                        # 3. Concatenate videos
-                        
+                        # ffmpeg reads the artifact files directly
+                        temp_files = [artifact_path(video_artifact) for video_artifact in video_list]
                         logging.info(f"[STITCH] Stitching {len(temp_files)} videos with audio crossfading")
                         
-                        if len(temp_files) == 2:
-                            # For 2 videos, use direct acrossfade
-                            cmd = [
-                                'ffmpeg',
-                                '-i', temp_files[0],
-                                '-i', temp_files[1],
-                                '-filter_complex',
-                                # Video: concatenate
-                                '[0:v][1:v]concat=n=2:v=1:a=0[vout];'
-                                # Audio: normalize each, then crossfade
-                                '[0:a]loudnorm=I=-16:LRA=11:TP=-1.5[a0];'
-                                '[1:a]loudnorm=I=-16:LRA=11:TP=-1.5[a1];'
-                                '[a0][a1]acrossfade=d=0.5:c1=tri:c2=tri[aout]',
-                                '-map', '[vout]',
-                                '-map', '[aout]',
-                                '-c:v', 'libx264', '-preset', 'medium', '-crf', '23',
-                                '-c:a', 'aac', '-b:a', '192k', '-ar', '48000',
-                                '-pix_fmt', 'yuv420p',
-                                '-y',
-                                output_path
-                            ]
-                        else:
-                            # For 3+ videos, use concat demuxer with audio normalization
-                            # Create concat file
-                            concat_file = f"{temp_dir}/concat.txt"
-                            with open(concat_file, 'w') as f:
-                                for temp_path in temp_files:
-                                    f.write(f"file '{temp_path}'\n")
+                        async with media_pool.scratch_dir() as temp_dir:
+                            output_path = f"{temp_dir}/stitched_output.mp4"
+                            stitch_mode = await stitch_videos(temp_files, output_path, temp_dir, on_progress=on_media_progress)
+                            logging.info(f"[STITCH] ffmpeg completed successfully ({stitch_mode})")
                             
-                            cmd = [
-                                'ffmpeg', '-f', 'concat', '-safe', '0',
-                                '-i', concat_file,
-                                '-c:v', 'libx264', '-preset', 'medium', '-crf', '23',
-                                # Advanced audio filter: normalize + smooth transitions
-                                '-af', 'loudnorm=I=-16:LRA=11:TP=-1.5,afade=t=in:st=0:d=0.3,afade=t=out:st={duration-0.3}:d=0.3',
-                                '-c:a', 'aac', '-b:a', '192k', '-ar', '48000',
-                                '-pix_fmt', 'yuv420p',
-                                '-y',
-                                output_path
-                            ]
-                        
-                        logging.info(f"[STITCH] Running ffmpeg with seamless audio")
-                        logging.info(f"[STITCH] Command: {' '.join(cmd)}")
-                        result_proc = subprocess.run(cmd, capture_output=True, text=True)
-                        
-                        if result_proc.returncode != 0:
-                            logging.error(f"[STITCH] ffmpeg failed with code {result_proc.returncode}")
-                            logging.error(f"[STITCH] ffmpeg stderr: {result_proc.stderr}")
-                            raise Exception(f"ffmpeg failed: {result_proc.stderr}")
-                        
-                        logging.info(f"[STITCH] ffmpeg completed successfully with normalized audio")
-                        
-                        # Read stitched video
-                        with open(output_path, 'rb') as f:
-                            stitched_video_bytes = f.read()
-                        
-                        logging.info(f"[STITCH] Stitched video size: {len(stitched_video_bytes)} bytes")
-                        
-                        # Encode to base64
-                        stitched_video_base64 = base64.b64encode(stitched_video_bytes).decode('utf-8')
-                        
-                        # Cleanup
-                        import shutil
-                        shutil.rmtree(temp_dir)
+                            stitched_artifact = await create_artifact('video', 'video/mp4', path=output_path)
+                            logging.info(f"[STITCH] Stitched video size: {stitched_artifact['size_bytes']} bytes")
                         
                         result = {
                             "status": "success",
-                            "video_base64": stitched_video_base64,
+                            "video_artifact": stitched_artifact,
                             "videos_stitched": len(video_list),
+                            "stitch_mode": stitch_mode,
                             "prompt": f"Stitched {len(video_list)} videos together"
                         }
                         logging.info(f"[STITCH] Successfully stitched {len(video_list)} videos")
@@ -5706,8 +9238,6 @@ async def execute_workflow(workflow_id: str, user_id: str = Depends(get_current_
                             result = {"status": "error", "error": "ElevenLabs API key not configured. Please add it in Integrations page."}
                         else:
                             # Call ElevenLabs API
-                            import requests
-                            
                             # Get voice ID (map common names to IDs or use directly)
                             voice_map = {
                                 'rachel': '21m00Tcm4TlvDq8ikWAM',
@@ -5761,24 +9291,30 @@ async def execute_workflow(workflow_id: str, user_id: str = Depends(get_current_
                             
                             logging.info(f"[TTS] Voice settings: stability={stability}, similarity={similarity_boost}, style={style}, boost={speaker_boost}, speed={speed}")
                             
-                            response = requests.post(url, json=payload, headers=headers, timeout=60)
+                            # aiohttp rather than requests, so a cancelled execution or node deadline aborts the call
+                            session = provider_operations.session()
+                            with span_timer('provider'):
+                                async with session.post(url, json=payload, headers=headers, timeout=aiohttp.ClientTimeout(total=60)) as response:
+                                    response_status = response.status
+                                    response_body = await response.read()
                             
-                            if response.status_code == 200:
-                                audio_bytes = response.content
-                                audio_base64 = base64.b64encode(audio_bytes).decode('utf-8')
+                            if response_status == 200:
+                                audio_bytes = response_body
+                                audio_artifact = await create_artifact('audio', 'audio/mpeg', data=audio_bytes)
                                 
                                 logging.info(f"[TTS] Generated {len(audio_bytes)} bytes of audio")
                                 
                                 result = {
                                     "status": "success",
-                                    "audio_base64": audio_base64,
+                                    "audio_artifact": audio_artifact,
                                     "text": text,
                                     "voice": voice,
                                     "format": "mp3"
                                 }
                             else:
-                                logging.error(f"[TTS] ElevenLabs API error: {response.status_code} - {response.text}")
-                                result = {"status": "error", "error": f"ElevenLabs API error: {response.text}"}
+                                response_text = response_body.decode('utf-8', errors='replace')
+                                logging.error(f"[TTS] ElevenLabs API error: {response_status} - {response_text}")
+                                result = {"status": "error", "error": f"ElevenLabs API error: {response_text}"}
                 
                 except Exception as e:
                     import traceback
@@ -5790,89 +9326,75 @@ async def execute_workflow(workflow_id: str, user_id: str = Depends(get_current_
                 # Execute Audio Overlay - combine video with voiceover
                 try:
                     logging.info(f"[AUDIO_OVERLAY] Node {node_id} executing")
+                    fused_stages = fused_media_stages(node_id, results)
                     
-                    # Find video from previous nodes
-                    video_base64 = None
-                    for prev_node_id, prev_result in results.items():
-                        if isinstance(prev_result, dict) and prev_result.get('video_base64'):
-                            video_base64 = prev_result['video_base64']
-                            logging.info(f"[AUDIO_OVERLAY] Found video from node: {prev_node_id}")
-                            break
+                    # Find video: the direct input first, then previous nodes
+                    video_artifact = result_artifact(input_data, 'video')
+                    if not video_artifact:
+                        for prev_node_id, prev_result in results.items():
+                            video_artifact = result_artifact(prev_result, 'video')
+                            if video_artifact:
+                                logging.info(f"[AUDIO_OVERLAY] Found video from node: {prev_node_id}")
+                                break
                     
                     # Find audio from previous TTS node
-                    audio_base64 = None
+                    audio_artifact = None
                     for prev_node_id, prev_result in results.items():
-                        if isinstance(prev_result, dict) and prev_result.get('audio_base64'):
-                            audio_base64 = prev_result['audio_base64']
+                        audio_artifact = result_artifact(prev_result, 'audio')
+                        if audio_artifact:
                             logging.info(f"[AUDIO_OVERLAY] Found audio from node: {prev_node_id}")
                             break
                     
-                    if not video_base64:
+                    if not video_artifact and fused_stages is None:
                         result = {"status": "error", "error": "No video found from previous nodes"}
-                    elif not audio_base64:
+                    elif not audio_artifact:
                         result = {"status": "error", "error": "No audio found from previous TTS node"}
-                    else:
-                        import tempfile
-                        import subprocess
-                        
-                        # Create temp directory
-                        temp_dir = tempfile.mkdtemp()
-                        
-                        # Save video
-                        video_bytes = base64.b64decode(video_base64)
-                        video_path = f"{temp_dir}/input_video.mp4"
-                        with open(video_path, 'wb') as f:
-                            f.write(video_bytes)
-                        
-                        # Save audio
-                        audio_bytes = base64.b64decode(audio_base64)
-                        audio_path = f"{temp_dir}/voiceover.mp3"
-                        with open(audio_path, 'wb') as f:
-                            f.write(audio_bytes)
-                        
-                        # Output path
-                        output_path = f"{temp_dir}/final_video.mp4"
-                        
-                        logging.info(f"[AUDIO_OVERLAY] Overlaying audio onto video with ffmpeg")
-                        
-                        # Use ffmpeg to overlay audio on video
-                        # Replace original audio with voiceover, or mix if desired
-                        cmd = [
-                            'ffmpeg',
-                            '-i', video_path,
-                            '-i', audio_path,
-                            '-c:v', 'copy',  # Copy video stream (no re-encode for speed)
-                            '-map', '0:v:0',  # Use video from first input
-                            '-map', '1:a:0',  # Use audio from second input (voiceover)
-                            '-c:a', 'aac',
-                            '-b:a', '192k',
-                            '-shortest',  # End when shortest stream ends
-                            '-y',
-                            output_path
-                        ]
-                        
-                        result_proc = subprocess.run(cmd, capture_output=True, text=True)
+                    elif fused_stages is not None and fused_chains[node_id][-1] != node_id:
+                        logging.info(f"[AUDIO_OVERLAY] Fused into {fused_chains[node_id][-1]}; not rendering on its own")
+                        result = {"status": "success", "fused_into": fused_chains[node_id][-1], "audio_input": audio_artifact}
+                    elif fused_stages is not None:
+                        async with media_pool.scratch_dir() as temp_dir:
+                            output_path = f"{temp_dir}/final_video.mp4"
+                            rendered = await render_media_chain(
+                                fused_stages + [{"type": "audiooverlay", "audio": audio_artifact}],
+                                output_path, temp_dir, on_progress=on_media_progress
+                            )
+                            final_artifact = await create_artifact('video', 'video/mp4', path=output_path)
                         
-                        if result_proc.returncode != 0:
-                            logging.error(f"[AUDIO_OVERLAY] ffmpeg failed: {result_proc.stderr}")
-                            raise Exception(f"ffmpeg failed: {result_proc.stderr}")
-                        
-                        # Read final video
-                        with open(output_path, 'rb') as f:
-                            final_video_bytes = f.read()
-                        
-                        logging.info(f"[AUDIO_OVERLAY] Created final video: {len(final_video_bytes)} bytes")
-                        
-                        # Encode to base64
-                        final_video_base64 = base64.b64encode(final_video_bytes).decode('utf-8')
+                        result = {
+                            "status": "success",
+                            "video_artifact": final_artifact,
+                            "fused_nodes": fused_chains[node_id],
+                            "stitch_mode": rendered['stitch_mode'],
+                            "prompt": "Video with voiceover overlay"
+                        }
+                        logging.info(f"[AUDIO_OVERLAY] Rendered fused chain {fused_chains[node_id]} in one pass")
+                    else:
+                        # Scratch directory for the output; inputs are read from their artifacts
+                        video_path = artifact_path(video_artifact)
+                        audio_path = artifact_path(audio_artifact)
                         
-                        # Cleanup
-                        import shutil
-                        shutil.rmtree(temp_dir)
+                        async with media_pool.scratch_dir() as temp_dir:
+                            # Output path
+                            output_path = f"{temp_dir}/final_video.mp4"
+                            
+                            logging.info(f"[AUDIO_OVERLAY] Overlaying audio onto video with ffmpeg")
+                            
+                            # Replace original audio with voiceover
+                            cmd = audio_overlay_command(video_path, audio_path, output_path)
+                            
+                            await media_pool.run(
+                                cmd, tag='AUDIO_OVERLAY',
+                                duration=video_artifact.get('duration'),
+                                on_progress=on_media_progress
+                            )
+                            
+                            final_artifact = await create_artifact('video', 'video/mp4', path=output_path)
+                            logging.info(f"[AUDIO_OVERLAY] Created final video: {final_artifact['size_bytes']} bytes")
                         
                         result = {
                             "status": "success",
-                            "video_base64": final_video_base64,
+                            "video_artifact": final_artifact,
                             "prompt": "Video with voiceover overlay"
                         }
                         logging.info(f"[AUDIO_OVERLAY] Successfully added voiceover to video")
@@ -5912,9 +9434,6 @@ async def execute_workflow(workflow_id: str, user_id: str = Depends(get_current_
                         if not elevenlabs_key:
                             result = {"status": "error", "error": "ElevenLabs API key not configured. Please add it in Integrations page."}
                         else:
-                            import requests
-                            import time
-                            
                             # Step 1: Create music generation task
                             generate_url = "https://api.elevenlabs.io/v1/music/generate"
                             headers = {
@@ -5927,102 +9446,85 @@ async def execute_workflow(workflow_id: str, user_id: str = Depends(get_current_
                                 "duration_seconds": int(duration_seconds)
                             }
                             
+                            def music_result(artifact: Dict[str, Any]) -> Dict[str, Any]:
+                                return {
+                                    "status": "success",
+                                    "audio_artifact": artifact,
+                                    "music_artifact": artifact,  # Alias for clarity
+                                    "prompt": prompt,
+                                    "duration": duration_seconds,
+                                    "format": "mp3"
+                                }
+                            
+                            session = provider_operations.session()
                             logging.info(f"[TEXT_TO_MUSIC] Submitting generation request...")
-                            gen_response = requests.post(generate_url, json=payload, headers=headers, timeout=30)
+                            with span_timer('provider'):
+                                async with session.post(generate_url, json=payload, headers=headers, timeout=aiohttp.ClientTimeout(total=30)) as gen_response:
+                                    gen_status = gen_response.status
+                                    content_type = gen_response.headers.get('Content-Type', '')
+                                    gen_body = await gen_response.read()
                             
-                            logging.info(f"[TEXT_TO_MUSIC] Response status: {gen_response.status_code}, Content-Type: {gen_response.headers.get('Content-Type', 'unknown')}, Length: {len(gen_response.content)}")
+                            logging.info(f"[TEXT_TO_MUSIC] Response status: {gen_status}, Content-Type: {content_type or 'unknown'}, Length: {len(gen_body)}")
                             
-                            if gen_response.status_code != 200:
-                                logging.error(f"[TEXT_TO_MUSIC] Generation request failed: {gen_response.status_code} - {gen_response.text}")
-                                result = {"status": "error", "error": f"Music generation request failed: {gen_response.text}"}
+                            if gen_status != 200:
+                                gen_text = gen_body.decode('utf-8', errors='replace')
+                                logging.error(f"[TEXT_TO_MUSIC] Generation request failed: {gen_status} - {gen_text}")
+                                result = {"status": "error", "error": f"Music generation request failed: {gen_text}"}
+                            elif 'audio' in content_type or 'mpeg' in content_type or len(gen_body) > 10000:
+                                # API returned audio directly (new behavior)
+                                logging.info(f"[TEXT_TO_MUSIC] Received audio directly: {len(gen_body)} bytes")
+                                music_artifact = await create_artifact('audio', 'audio/mpeg', data=gen_body)
+                                result = music_result(music_artifact)
                             else:
-                                # Check if ElevenLabs returned audio directly (new API behavior)
-                                content_type = gen_response.headers.get('Content-Type', '')
-                                content_length = len(gen_response.content)
+                                # Parse JSON for generation_id (old API behavior)
+                                try:
+                                    gen_data = json_lib.loads(gen_body)
+                                except ValueError as parse_error:
+                                    logging.error(f"[TEXT_TO_MUSIC] Failed to parse initial response: {str(parse_error)}")
+                                    gen_data = None
+                                    result = {"status": "error", "error": f"Invalid API response: {str(parse_error)}"}
                                 
-                                if 'audio' in content_type or 'mpeg' in content_type or content_length > 10000:
-                                    # API returned audio directly (new behavior)
-                                    logging.info(f"[TEXT_TO_MUSIC] Received audio directly: {content_length} bytes")
-                                    audio_bytes = gen_response.content
-                                    audio_base64 = base64.b64encode(audio_bytes).decode('utf-8')
+                                generation_id = (gen_data.get("generation_id") or gen_data.get("id")) if isinstance(gen_data, dict) else None
+                                if gen_data is not None and not generation_id:
+                                    result = {"status": "error", "error": "No generation ID in response"}
+                                elif generation_id:
+                                    logging.info(f"[TEXT_TO_MUSIC] Generation ID: {generation_id}, polling...")
+                                    retrieve_url = f"https://api.elevenlabs.io/v1/music/generate/{generation_id}"
                                     
-                                    result = {
-                                        "status": "success",
-                                        "audio_base64": audio_base64,
-                                        "music_base64": audio_base64,
-                                        "prompt": prompt,
-                                        "duration": duration_seconds,
-                                        "format": "mp3"
-                                    }
-                                else:
-                                    # Parse JSON for generation_id (old API behavior)
-                                    try:
-                                        gen_data = gen_response.json()
-                                        generation_id = gen_data.get("generation_id") or gen_data.get("id")
+                                    async def check_music() -> Optional[bytes]:
+                                        async with session.get(retrieve_url, headers=headers, timeout=aiohttp.ClientTimeout(total=30)) as retrieve_response:
+                                            if retrieve_response.status != 200:
+                                                logging.warning(f"[TEXT_TO_MUSIC] Retrieve failed: {retrieve_response.status}")
+                                                return None
+                                            retrieve_type = retrieve_response.headers.get('Content-Type', '')
+                                            body = await retrieve_response.read()
                                         
-                                        if not generation_id:
-                                            result = {"status": "error", "error": "No generation ID in response"}
-                                        else:
-                                            logging.info(f"[TEXT_TO_MUSIC] Generation ID: {generation_id}, polling...")
-                                            
-                                            # Poll for completion and retrieve the music
-                                            retrieve_url = f"https://api.elevenlabs.io/v1/music/generate/{generation_id}"
-                                            max_attempts = 60  # 5 minutes max wait (5s intervals)
-                                            attempt = 0
-                                            
-                                            while attempt < max_attempts:
-                                                time.sleep(5)  # Wait 5 seconds between polls
-                                                attempt += 1
-                                                
-                                                logging.info(f"[TEXT_TO_MUSIC] Polling attempt {attempt}/{max_attempts}...")
-                                                
-                                                retrieve_response = requests.get(retrieve_url, headers=headers, timeout=30)
-                                                
-                                                if retrieve_response.status_code == 200:
-                                                    # Check if response is audio (content-type or size)
-                                                    content_type = retrieve_response.headers.get('Content-Type', '')
-                                                    content_length = len(retrieve_response.content)
-                                                    
-                                                    logging.info(f"[TEXT_TO_MUSIC] Content-Type: {content_type}, Content-Length: {content_length}")
-                                                    
-                                                    # ElevenLabs returns binary MP3 directly when ready (typically >100KB)
-                                                    # Status updates are small JSON responses (<1KB)
-                                                    if 'audio' in content_type or 'mpeg' in content_type or content_length > 1000:
-                                                        # Got the audio file
-                                                        audio_bytes = retrieve_response.content
-                                                        audio_base64 = base64.b64encode(audio_bytes).decode('utf-8')
-                                                        
-                                                        logging.info(f"[TEXT_TO_MUSIC] Generated {len(audio_bytes)} bytes of music")
-                                                        
-                                                        result = {
-                                                            "status": "success",
-                                                            "audio_base64": audio_base64,
-                                                            "music_base64": audio_base64,  # Alias for clarity
-                                                            "prompt": prompt,
-                                                            "duration": duration_seconds,
-                                                            "format": "mp3"
-                                                        }
-                                                        break
-                                                    else:
-                                                        # Small response - try to parse as status JSON
-                                                        try:
-                                                            status_data = retrieve_response.json()
-                                                            current_status = status_data.get("status", "unknown")
-                                                            logging.info(f"[TEXT_TO_MUSIC] Current status: {current_status}")
-                                                            
-                                                            if current_status == "failed":
-                                                                result = {"status": "error", "error": "Music generation failed on server"}
-                                                                break
-                                                        except Exception as json_error:
-                                                            logging.warning(f"[TEXT_TO_MUSIC] Could not parse status JSON: {str(json_error)}")
-                                                else:
-                                                    logging.warning(f"[TEXT_TO_MUSIC] Retrieve failed: {retrieve_response.status_code}")
-                                            
-                                            if attempt >= max_attempts and 'result' not in locals():
-                                                result = {"status": "error", "error": "Music generation timed out after 5 minutes"}
-                                    except Exception as parse_error:
-                                        logging.error(f"[TEXT_TO_MUSIC] Failed to parse initial response: {str(parse_error)}")
-                                        result = {"status": "error", "error": f"Invalid API response: {str(parse_error)}"}
+                                        # ElevenLabs returns binary MP3 directly when ready (typically >100KB)
+                                        # Status updates are small JSON responses (<1KB)
+                                        if 'audio' in retrieve_type or 'mpeg' in retrieve_type or len(body) > 1000:
+                                            return body
+                                        try:
+                                            current_status = json_lib.loads(body).get("status", "unknown")
+                                        except (ValueError, AttributeError) as json_error:
+                                            logging.warning(f"[TEXT_TO_MUSIC] Could not parse status JSON: {str(json_error)}")
+                                            return None
+                                        logging.info(f"[TEXT_TO_MUSIC] Current status: {current_status}")
+                                        if current_status == "failed":
+                                            raise RuntimeError("Music generation failed on server")
+                                        return None
+                                    
+                                    try:
+                                        with span_timer('provider'):
+                                            audio_bytes = await provider_operations.wait(
+                                                f"Music generation {generation_id}", check_music, first_interval=5, timeout=300
+                                            )
+                                        music_artifact = await create_artifact('audio', 'audio/mpeg', data=audio_bytes)
+                                        logging.info(f"[TEXT_TO_MUSIC] Generated {len(audio_bytes)} bytes of music")
+                                        result = music_result(music_artifact)
+                                    except TimeoutError:
+                                        result = {"status": "error", "error": "Music generation timed out after 5 minutes"}
+                                    except RuntimeError as generation_error:
+                                        result = {"status": "error", "error": str(generation_error)}
                 
                 except Exception as e:
                     import traceback
@@ -6035,9 +9537,10 @@ async def execute_workflow(workflow_id: str, user_id: str = Depends(get_current_
                 # Execute Audio Stitch - combines audio tracks with stitched video
                 try:
                     logging.info(f"[AUDIO_STITCH] Node {node_id} executing")
+                    fused_stages = fused_media_stages(node_id, results)
                     
                     # Step 1: Find the stitched video from previous stitch node
-                    stitched_video_base64 = None
+                    stitched_video = None
                     for prev_node_id in execution_order:
                         if prev_node_id == node_id:
                             break
@@ -6046,18 +9549,18 @@ async def execute_workflow(workflow_id: str, user_id: str = Depends(get_current_
                             # Check if it's from a stitch node
                             prev_node = next((n for n in workflow['nodes'] if n['id'] == prev_node_id), None)
                             if prev_node and prev_node.get('type') == 'stitch':
-                                stitched_video_base64 = prev_result.get('video_base64')
-                                if stitched_video_base64:
+                                stitched_video = result_artifact(prev_result, 'video')
+                                if stitched_video:
                                     logging.info(f"[AUDIO_STITCH] Found stitched video from node {prev_node_id}")
                                     break
                     
-                    if not stitched_video_base64:
+                    if not stitched_video and fused_stages is None:
                         result = {"status": "error", "error": "No stitched video found from previous stitch node"}
                         logging.error("[AUDIO_STITCH] No stitched video found")
                     else:
                         # Step 2: Find audio tracks from TTS and Music nodes
-                        tts_audio_base64 = None
-                        music_audio_base64 = None
+                        tts_audio = None
+                        music_audio = None
                         
                         for prev_node_id in execution_order:
                             if prev_node_id == node_id:
@@ -6068,66 +9571,58 @@ async def execute_workflow(workflow_id: str, user_id: str = Depends(get_current_
                                 if prev_node:
                                     node_type_check = prev_node.get('type')
                                     # Check for TTS audio
-                                    if node_type_check == 'texttospeech' and not tts_audio_base64:
-                                        tts_audio_base64 = prev_result.get('audio_base64')
-                                        if tts_audio_base64:
+                                    if node_type_check == 'texttospeech' and not tts_audio:
+                                        tts_audio = result_artifact(prev_result, 'audio')
+                                        if tts_audio:
                                             logging.info(f"[AUDIO_STITCH] Found TTS audio from node {prev_node_id}")
                                     # Check for Music audio
-                                    elif node_type_check == 'texttomusic' and not music_audio_base64:
-                                        music_audio_base64 = prev_result.get('music_base64') or prev_result.get('audio_base64')
-                                        if music_audio_base64:
+                                    elif node_type_check == 'texttomusic' and not music_audio:
+                                        music_audio = result_artifact(prev_result, 'music') or result_artifact(prev_result, 'audio')
+                                        if music_audio:
                                             logging.info(f"[AUDIO_STITCH] Found Music audio from node {prev_node_id}")
                         
-                        if not tts_audio_base64 and not music_audio_base64:
+                        if not tts_audio and not music_audio:
                             result = {"status": "error", "error": "No audio tracks found from TTS or Music nodes"}
                             logging.error("[AUDIO_STITCH] No audio tracks found")
-                        else:
-                            import tempfile
-                            import subprocess
-                            import shutil
-                            
-                            temp_dir = tempfile.mkdtemp()
-                            logging.info(f"[AUDIO_STITCH] Using temp directory: {temp_dir}")
+                        elif fused_stages is not None:
+                            async with media_pool.scratch_dir() as temp_dir:
+                                output_path = f"{temp_dir}/final_video.mp4"
+                                rendered = await render_media_chain(
+                                    fused_stages + [{"type": "audiostitch", "tts": tts_audio, "music": music_audio}],
+                                    output_path, temp_dir, on_progress=on_media_progress
+                                )
+                                final_artifact = await create_artifact('video', 'video/mp4', path=output_path)
                             
-                            try:
-                                # Save video
-                                video_path = f"{temp_dir}/input_video.mp4"
-                                video_bytes = base64.b64decode(stitched_video_base64)
-                                with open(video_path, 'wb') as f:
-                                    f.write(video_bytes)
+                            result = {
+                                "status": "success",
+                                "video_artifact": final_artifact,
+                                "audio_type": "mixed" if (tts_audio and music_audio) else ("tts" if tts_audio else "music"),
+                                "duration": rendered['duration'],
+                                "fused_nodes": fused_chains[node_id],
+                                "stitch_mode": rendered['stitch_mode']
+                            }
+                            logging.info(f"[AUDIO_STITCH] Rendered fused chain {fused_chains[node_id]} in one pass")
+                        else:
+                            async with media_pool.scratch_dir() as temp_dir:
+                                logging.info(f"[AUDIO_STITCH] Using scratch directory: {temp_dir}")
                                 
-                                # Get video duration
-                                probe_cmd = [
-                                    'ffprobe', '-v', 'error', 
-                                    '-show_entries', 'format=duration',
-                                    '-of', 'default=noprint_wrappers=1:nokey=1',
-                                    video_path
-                                ]
-                                probe_result = subprocess.run(probe_cmd, capture_output=True, text=True)
-                                video_duration = float(probe_result.stdout.strip())
+                                video_path = artifact_path(stitched_video)
+                                
+                                # Video duration comes from the artifact metadata, probed once when it was created
+                                video_duration = stitched_video.get('duration') or await probe_media_duration(video_path)
+                                if video_duration is None:
+                                    raise Exception("Could not determine stitched video duration")
                                 logging.info(f"[AUDIO_STITCH] Video duration: {video_duration}s")
                                 
                                 # Prepare audio track(s)
                                 audio_inputs = []
                                 filter_complex_parts = []
                                 
-                                if tts_audio_base64 and music_audio_base64:
+                                if tts_audio and music_audio:
                                     # Both audio tracks - mix them intelligently
                                     logging.info("[AUDIO_STITCH] Mixing TTS and Music audio")
-                                    
-                                    # Save TTS audio
-                                    tts_path = f"{temp_dir}/tts_audio.mp3"
-                                    tts_bytes = base64.b64decode(tts_audio_base64)
-                                    with open(tts_path, 'wb') as f:
-                                        f.write(tts_bytes)
-                                    audio_inputs.append(tts_path)
-                                    
-                                    # Save Music audio
-                                    music_path = f"{temp_dir}/music_audio.mp3"
-                                    music_bytes = base64.b64decode(music_audio_base64)
-                                    with open(music_path, 'wb') as f:
-                                        f.write(music_bytes)
-                                    audio_inputs.append(music_path)
+                                    audio_inputs.append(artifact_path(tts_audio))
+                                    audio_inputs.append(artifact_path(music_audio))
                                     
                                     # Mix: TTS at 100% volume, Music at 30% (background)
                                     # Trim both to video length
@@ -6138,14 +9633,10 @@ async def execute_workflow(workflow_id: str, user_id: str = Depends(get_current_
                                     )
                                     audio_map = "[aout]"
                                     
-                                elif tts_audio_base64:
+                                elif tts_audio:
                                     # Only TTS audio
                                     logging.info("[AUDIO_STITCH] Using TTS audio only")
-                                    tts_path = f"{temp_dir}/tts_audio.mp3"
-                                    tts_bytes = base64.b64decode(tts_audio_base64)
-                                    with open(tts_path, 'wb') as f:
-                                        f.write(tts_bytes)
-                                    audio_inputs.append(tts_path)
+                                    audio_inputs.append(artifact_path(tts_audio))
                                     
                                     # Trim to video length
                                     filter_complex = f"[1:a]atrim=0:{video_duration}[aout]"
@@ -6154,11 +9645,7 @@ async def execute_workflow(workflow_id: str, user_id: str = Depends(get_current_
                                 else:
                                     # Only Music audio
                                     logging.info("[AUDIO_STITCH] Using Music audio only")
-                                    music_path = f"{temp_dir}/music_audio.mp3"
-                                    music_bytes = base64.b64decode(music_audio_base64)
-                                    with open(music_path, 'wb') as f:
-                                        f.write(music_bytes)
-                                    audio_inputs.append(music_path)
+                                    audio_inputs.append(artifact_path(music_audio))
                                     
                                     # Trim to video length
                                     filter_complex = f"[1:a]atrim=0:{video_duration}[aout]"
@@ -6167,7 +9654,7 @@ async def execute_workflow(workflow_id: str, user_id: str = Depends(get_current_
                                 # Build FFmpeg command
                                 output_path = f"{temp_dir}/final_video.mp4"
                                 
-                                cmd = ['ffmpeg', '-i', video_path]
+                                cmd = ['-i', video_path]
                                 for audio_input in audio_inputs:
                                     cmd.extend(['-i', audio_input])
                                 
@@ -6184,31 +9671,17 @@ async def execute_workflow(workflow_id: str, user_id: str = Depends(get_current_
                                 ])
                                 
                                 logging.info(f"[AUDIO_STITCH] Running FFmpeg command")
-                                ffmpeg_result = subprocess.run(cmd, capture_output=True, text=True)
-                                
-                                if ffmpeg_result.returncode != 0:
-                                    logging.error(f"[AUDIO_STITCH] FFmpeg failed: {ffmpeg_result.stderr}")
-                                    raise Exception(f"FFmpeg failed: {ffmpeg_result.stderr}")
-                                
-                                # Read final video
-                                with open(output_path, 'rb') as f:
-                                    final_video_bytes = f.read()
-                                
-                                logging.info(f"[AUDIO_STITCH] Created final video with audio: {len(final_video_bytes)} bytes")
+                                await media_pool.run(cmd, tag='AUDIO_STITCH', duration=video_duration, on_progress=on_media_progress)
                                 
-                                # Encode to base64
-                                final_video_base64 = base64.b64encode(final_video_bytes).decode('utf-8')
+                                final_artifact = await create_artifact('video', 'video/mp4', path=output_path)
+                                logging.info(f"[AUDIO_STITCH] Created final video with audio: {final_artifact['size_bytes']} bytes")
                                 
                                 result = {
                                     "status": "success",
-                                    "video_base64": final_video_base64,
-                                    "audio_type": "mixed" if (tts_audio_base64 and music_audio_base64) else ("tts" if tts_audio_base64 else "music"),
+                                    "video_artifact": final_artifact,
+                                    "audio_type": "mixed" if (tts_audio and music_audio) else ("tts" if tts_audio else "music"),
                                     "duration": video_duration
                                 }
-                                
-                            finally:
-                                # Cleanup
-                                shutil.rmtree(temp_dir)
                 
                 except Exception as e:
                     import traceback
@@ -6298,22 +9771,15 @@ async def execute_workflow(workflow_id: str, user_id: str = Depends(get_current_
                 }
             
             elif node_type == 'loop':
-                # Execute loop logic
+                # Collect the items; the loop body (if any) runs per item once this node returns
                 loop_type = node_data.get('loopType', 'forEach')
                 
-                if loop_type == 'forEach':
-                    array_data = input_data.get('data', []) if isinstance(input_data, dict) else []
-                    result = {
-                        "loop_type": "forEach",
-                        "iterations": len(array_data),
-                        "items": array_data
-                    }
-                elif loop_type == 'count':
-                    iterations = int(node_data.get('iterations', 1))
+                if loop_type in ('forEach', 'count'):
+                    items = loop_items(node_data, input_data)
                     result = {
-                        "loop_type": "count",
-                        "iterations": iterations,
-                        "current": 0
+                        "loop_type": loop_type,
+                        "iterations": len(items),
+                        "items": items
                     }
                 else:
                     result = {
@@ -6333,7 +9799,6 @@ async def execute_workflow(workflow_id: str, user_id: str = Depends(get_current_
                 elif unit == 'hours':
                     seconds = duration * 3600
                 
-                import asyncio
                 await asyncio.sleep(min(seconds, 10))  # Cap at 10 seconds for demo
                 
                 result = {
@@ -6347,80 +9812,388 @@ async def execute_workflow(workflow_id: str, user_id: str = Depends(get_current_
             else:
                 result = {"error": f"Unknown node type: {node_type}"}
             
-            results[node_id] = result
             execution_log.append(f"Completed {node_type} node: {node_id}")
-            
-            # Update progress
-            nonlocal completed_nodes
-            completed_nodes += 1
-            progress = int((completed_nodes / total_nodes) * 100)
-            
-            await db.workflow_executions.update_one(
-                {"id": execution_id},
-                {"$set": {
-                    "progress": progress,
-                    "current_node": node_id,
-                    "execution_log": execution_log,
-                    "results": results
-                }}
-            )
-            
-            # Execute next nodes
-            next_nodes = edges_dict.get(node_id, [])
-            for next_node_id in next_nodes:
-                await execute_node(next_node_id, result)
-            
             return result
             
         except Exception as e:
             error_result = {"error": str(e), "node_type": node_type}
-            results[node_id] = error_result
+            (failed_nodes if failures is None else failures).add(node_id)
             error_msg = f"Error in {node_type} node: {str(e)}"
             execution_log.append(error_msg)
             logging.error(f"Workflow execution error - Node: {node_id}, Type: {node_type}, Error: {str(e)}")
             return error_result
     
+    def taken_children(node_id: str, result: Any, level: Dict[str, Any] = plan) -> List[str]:
+        labels = level.get('edge_labels', {}).get(node_id, {})
+        return [
+            child for child in level['children'][node_id]
+            if branch_edge_taken(nodes_dict[node_id]['type'], result, labels.get(child))
+        ]
+    
+    def merge_inputs(parents: List[str], level_results: Dict[str, Any]) -> Any:
+        if len(parents) == 1:
+            return level_results[parents[0]]
+        if not parents:
+            return None
+        # Join node: merged view of all inputs, plus each input by node id
+        input_data = {}
+        for parent in parents:
+            if isinstance(level_results[parent], dict):
+                input_data.update(level_results[parent])
+        input_data['inputs'] = {parent: level_results[parent] for parent in parents}
+        return input_data
+    
+    async def run_cached(node_id: str, input_data: Any, upstream: Dict[str, Any], failures: set) -> Tuple[Any, bool]:
+        """Run a node, or reuse its cached result; returns (result, cache_hit)"""
+        node = nodes_dict[node_id]
+        cache_policy = node_cache_policy(node)
+        cache_key = node_cache_key(node, input_data, upstream) if cache_policy != 'never' else None
+        result = None
+        if cache_key in run_cache:
+            result = run_cache[cache_key]
+        elif cache_key and cache_policy == 'global':
+            result = await node_cache_get(user_id, cache_key)
+        if result is not None:
+            execution_log.append(f"Cache hit for {node['type']} node: {node_id}")
+            return result, True
+        
+        timeout = node_timeout(node)
+        try:
+            async with node_slots:
+                result = await asyncio.wait_for(execute_node(node_id, input_data, upstream, failures), timeout=timeout)
+        except asyncio.TimeoutError:
+            # wait_for cancelled the node, aborting whatever provider call or ffmpeg job it was in
+            failures.add(node_id)
+            execution_log.append(f"Stopped {node['type']} node {node_id}: deadline of {int(timeout)}s exceeded")
+            result = {"status": "error", "error": f"Node exceeded its deadline of {int(timeout)} seconds", "node_type": node['type']}
+        if cache_key and node_id not in failures and is_successful_result(result):
+            run_cache[cache_key] = result
+            if cache_policy == 'global':
+                await node_cache_put(user_id, node['type'], cache_key, result)
+        return result, False
+    
+    async def run_loop(loop_id: str, level: Dict[str, Any], loop_result: Dict[str, Any], upstream: Dict[str, Any], top_level: bool) -> Dict[str, Any]:
+        """Run a loop node's body once per item, at most `concurrency` items at a time.
+        
+        Items fail independently: the loop collects every item's outcome in item order and
+        reports 'partial' when only some items failed. Only the body's outputs and a short
+        summary per item are kept, so a large forEach stays well within Mongo's document limit.
+        Body nodes share the execution's WORKFLOW_MAX_PARALLEL_NODES slots.
+        """
+        body = level['loop_bodies'][loop_id]
+        items = loop_result.get('items') or []
+        concurrency = int(nodes_dict[loop_id]['data'].get('concurrency') or LOOP_DEFAULT_CONCURRENCY)
+        concurrency = min(max(1, concurrency), LOOP_MAX_CONCURRENCY)
+        semaphore = asyncio.Semaphore(concurrency)
+        sinks = [node_id for node_id in body['order'] if not body['children'][node_id]]
+        counts = {"done": 0, "failed": 0}
+        execution_log.append(f"Loop {loop_id}: running body for {len(items)} items, {concurrency} at a time")
+        
+        async def run_item(index: int, item: Any) -> Dict[str, Any]:
+            item_results: Dict[str, Any] = {}
+            item_taken: Dict[str, List[str]] = {}
+            item_skipped = set()
+            failures = set()
+            errors = []
+            entry_input = loop_item_input(item, index)
+            outer = {**upstream, loop_id: loop_result}
+            
+            async def run_body_node(node_id: str) -> Optional[List[str]]:
+                parents = [parent for parent in body['parents'][node_id] if node_id in item_taken.get(parent, [])]
+                input_data = merge_inputs(parents, item_results) if parents else entry_input
+                view = {
+                    **outer,
+                    **{ancestor: item_results[ancestor] for ancestor in plan_ancestors(body, node_id) if ancestor not in item_skipped}
+                }
+                result, _ = await run_cached(node_id, input_data, view, failures)
+                if node_id in body['loop_bodies'] and node_id not in failures:
+                    result = await run_loop(node_id, body, result, view, top_level=False)
+                item_results[node_id] = result
+                if node_id in failures:
+                    return None
+                item_taken[node_id] = taken_children(node_id, result, body)
+                return item_taken[node_id]
+            
+            async def skip_body_node(node_id: str):
+                item_results[node_id] = {"status": "skipped"}
+                item_skipped.add(node_id)
+            
+            async with semaphore:
+                try:
+                    # Items run side by side; the nodes of one item run one after another
+                    await run_workflow_dag(body, run_body_node, skip_node=skip_body_node, max_parallel=1)
+                except Exception as e:
+                    errors.append(str(e))
+            
+            errors.extend(
+                str(result.get('error') or result.get('status'))
+                for result in item_results.values()
+                if isinstance(result, dict) and (result.get('error') or result.get('status') in ('error', 'failed'))
+            )
+            failed = bool(failures or errors)
+            outputs = {sink: item_results[sink] for sink in sinks if sink in item_results}
+            record = {
+                "index": index,
+                "status": "failed" if failed else "success",
+                "output": outputs.get(sinks[0]) if len(sinks) == 1 else outputs
+            }
+            if failed:
+                record["error"] = errors[0] if errors else "Loop body did not complete"
+            
+            counts["done"] += 1
+            counts["failed"] += failed
+            execution_log.append(f"Loop {loop_id}: item {index + 1}/{len(items)} {'failed' if failed else 'completed'}")
+            execution_events.publish(
+                execution_id, 'loop_item_finished',
+                node_id=loop_id,
+                index=index,
+                status=record["status"],
+                done=counts["done"],
+                failed=counts["failed"],
+                total=len(items)
+            )
+            if top_level:
+                await db.workflow_executions.update_one(
+                    {"id": execution_id},
+                    {"$set": {f"loop_progress.{loop_id}": {**counts, "total": len(items)}}}
+                )
+            return record
+        
+        records = await asyncio.gather(*(run_item(index, item) for index, item in enumerate(items)))
+        failed_count = sum(1 for record in records if record["status"] == "failed")
+        return {
+            **loop_result,
+            "status": "success" if not failed_count else "error" if failed_count == len(records) else "partial",
+            "succeeded": len(records) - failed_count,
+            "failed": failed_count,
+            "outputs": [record.pop("output") for record in records],
+            # Per-item summaries; the items themselves are in `items` and their outputs in `outputs`
+            "item_results": records
+        }
+    
+    skipped_nodes = {
+        node_id for node_id, result in seed_results.items()
+        if isinstance(result, dict) and result.get('status') == 'skipped'
+    }
+    resolved_at: Dict[str, datetime] = {}  # When each node finished or was skipped; a node is queued once all its parents are
+    started_nodes = set()
+
+    taken_edges = {
+        node_id: [] if node_id in skipped_nodes else taken_children(node_id, result)
+        for node_id, result in seed_results.items()
+    }
+    
+    async def skip_node(node_id: str):
+        nonlocal completed_nodes
+        node = nodes_dict[node_id]
+        results[node_id] = {"status": "skipped"}
+        skipped_nodes.add(node_id)
+        resolved_at[node_id] = datetime.now(timezone.utc)
+        completed_nodes += 1
+        progress = int((completed_nodes / total_nodes) * 100)
+        execution_log.append(f"Skipped {node['type']} node: {node_id} (branch not taken)")
+        
+        async with persist_lock:
+            new_log_lines = take_new_log_lines()
+            await db.workflow_executions.update_one(
+                {"id": execution_id},
+                {
+                    "$set": {"progress": progress, f"results.{node_id}": results[node_id]},
+                    "$push": {"execution_log": {"$each": new_log_lines}},
+                    "$addToSet": {"skipped_nodes": node_id}
+                }
+            )
+        
+        execution_events.publish(execution_id, 'log', lines=new_log_lines)
+        execution_events.publish(execution_id, 'node_skipped', node_id=node_id, node_type=node['type'])
+        execution_events.publish(execution_id, 'progress', progress=progress, current_node=node_id)
+    
+    async def run_node(node_id: str) -> Optional[List[str]]:
+        nonlocal completed_nodes
+        
+        # Only parents whose edge into this node was taken feed it
+        parents = [parent for parent in plan['parents'][node_id] if node_id in taken_edges.get(parent, [])]
+        input_data = merge_inputs(parents, results) if parents else (inputs or None)
+        
+        upstream = {
+            ancestor: results[ancestor]
+            for ancestor in plan_ancestors(plan, node_id)
+            if ancestor not in skipped_nodes
+        }
+        node = nodes_dict[node_id]
+        execution_events.publish(execution_id, 'node_started', node_id=node_id, node_type=node['type'])
+        
+        span = new_node_span(
+            node['type'], plan['parents'][node_id],
+            queued_at=max((resolved_at[parent] for parent in plan['parents'][node_id] if parent in resolved_at), default=started_at)
+        )
+        span_token = current_node_span.set(span)
+        started_nodes.add(node_id)
+        try:
+            result, cache_hit = await run_cached(node_id, input_data, upstream, failed_nodes)
+            if node_id in plan['loop_bodies'] and node_id not in failed_nodes:
+                result = await run_loop(node_id, plan, result, upstream, top_level=True)
+        finally:
+            current_node_span.reset(span_token)
+        results[node_id] = result
+        resolved_at[node_id] = datetime.now(timezone.utc)
+        
+        # Loop bodies only keep their outputs, so only top-level chains need their members back
+        if fused_chains.get(node_id, [None])[-1] == node_id and (node_id in failed_nodes or not is_successful_result(result)):
+            await render_fused_members(node_id)
+        
+        # Update progress
+        completed_nodes += 1
+        progress = int((completed_nodes / total_nodes) * 100)
+        
+        # Persist only this node's result and the new log lines; heavy media goes to the blob store
+        stored_result, blob_refs = await store_node_result(result)
+        span.update(
+            ended_at=resolved_at[node_id].isoformat(),
+            cache_hit=cache_hit,
+            input_bytes=payload_bytes(input_data),
+            output_bytes=payload_bytes(stored_result)
+        )
+        async with persist_lock:
+            new_log_lines = take_new_log_lines()
+            update = {
+                "$set": {
+                    "progress": progress,
+                    "current_node": node_id,
+                    f"results.{node_id}": stored_result,
+                    f"node_spans.{node_id}": span
+                },
+                "$push": {"execution_log": {"$each": new_log_lines}}
+            }
+            add_to_set = {}
+            if blob_refs:
+                add_to_set["blob_refs"] = {"$each": blob_refs}
+            if node_id in failed_nodes:
+                add_to_set["failed_nodes"] = node_id
+            if add_to_set:
+                update["$addToSet"] = add_to_set
+            await db.workflow_executions.update_one({"id": execution_id}, update)
+        
+        execution_events.publish(execution_id, 'log', lines=new_log_lines)
+        execution_events.publish(
+            execution_id, 'node_finished',
+            node_id=node_id,
+            node_type=node['type'],
+            failed=node_id in failed_nodes,
+            cached=cache_hit,
+            result=stored_result
+        )
+        execution_events.publish(execution_id, 'progress', progress=progress, current_node=node_id)
+        
+        # A node that raised does not feed its downstream nodes
+        if node_id in failed_nodes:
+            return None
+        taken_edges[node_id] = taken_children(node_id, result)
+        return taken_edges[node_id]
+    
+    stop_reason = None  # 'deadline' or 'cancel' once the watchdog stopped the run
+    
+    async def watch_execution(dag_task: asyncio.Task):
+        """Stop the run at its deadline, or once a cancel is requested through another process"""
+        nonlocal stop_reason
+        while not dag_task.done():
+            wait = EXECUTION_CANCEL_POLL_INTERVAL
+            if deadline_at:
+                remaining = (deadline_at - datetime.now(timezone.utc)).total_seconds()
+                if remaining <= 0:
+                    stop_reason = 'deadline'
+                    dag_task.cancel()
+                    return
+                wait = min(wait, remaining)
+            await asyncio.sleep(wait)
+            if await db.workflow_executions.count_documents({"id": execution_id, "cancel_requested_at": {"$ne": None}}, limit=1):
+                stop_reason = 'cancel'
+                dag_task.cancel()
+                return
+    
+    async def record_stopped_nodes():
+        """Mark the nodes that were still running as cancelled; finished nodes keep their results"""
+        stopped = [node_id for node_id in started_nodes if node_id not in results]
+        if not stopped:
+            return
+        execution_log.append(f"Stopped running nodes: {', '.join(stopped)}")
+        failed_nodes.update(stopped)
+        await db.workflow_executions.update_one(
+            {"id": execution_id},
+            {
+                "$set": {f"results.{node_id}": {"status": "cancelled"} for node_id in stopped},
+                # Resuming must run these nodes again
+                "$addToSet": {"failed_nodes": {"$each": stopped}}
+            }
+        )
+        for node_id in stopped:
+            execution_events.publish(execution_id, 'node_cancelled', node_id=node_id, node_type=nodes_dict[node_id]['type'])
+    
     # Start execution
+    dag_task = asyncio.create_task(run_workflow_dag(plan, run_node, skip_node=skip_node, completed=dict(taken_edges)))
+    watchdog = asyncio.create_task(watch_execution(dag_task))
     try:
-        await execute_node(start_nodes[0]['id'])
+        try:
+            await dag_task
+        finally:
+            watchdog.cancel()
         
-        # Mark as completed
         completed_at = datetime.now(timezone.utc)
-        duration = int((completed_at - execution.started_at).total_seconds() * 1000)
+        duration = int((completed_at - started_at).total_seconds() * 1000)
+        
+        if failed_nodes:
+            # The failed nodes' descendants never ran, so the run did not complete
+            error_message = f"{len(failed_nodes)} node(s) failed: {', '.join(sorted(failed_nodes))}"
+            execution_log.append(error_message)
+            logging.warning(f"Workflow execution failed - Workflow ID: {workflow_id}, Execution ID: {execution_id}, {error_message}")
+            await transition_execution(
+                execution_id, 'failed',
+                error=error_message,
+                completed_at=completed_at.isoformat(),
+                duration=duration,
+                log_lines=take_new_log_lines()
+            )
+            return
         
-        await db.workflow_executions.update_one(
-            {"id": execution.id},
-            {"$set": {
-                "status": "completed",
-                "progress": 100,
-                "completed_at": completed_at.isoformat(),
-                "duration": duration,
-                "execution_log": execution_log,
-                "results": results
-            }}
+        # Mark as completed
+        await transition_execution(
+            execution_id, 'completed',
+            progress=100,
+            completed_at=completed_at.isoformat(),
+            duration=duration,
+            log_lines=take_new_log_lines()
         )
+    except asyncio.CancelledError:
+        # Let running nodes unwind first (ffmpeg killed, provider polls dropped, temp files removed)
+        if not dag_task.done():
+            await asyncio.wait([dag_task])
+        await record_stopped_nodes()
         
-        return {
-            "execution_id": execution.id,
-            "workflow_id": workflow_id,
-            "status": "completed",
-            "execution_log": execution_log,
-            "results": results
+        completed_at = datetime.now(timezone.utc)
+        fields = {
+            "completed_at": completed_at.isoformat(),
+            "duration": int((completed_at - started_at).total_seconds() * 1000)
         }
+        if stop_reason == 'deadline':
+            fields['error'] = f"Execution exceeded its deadline of {int(deadline_seconds)} seconds"
+            execution_log.append(fields['error'])
+        else:
+            execution_log.append("Execution cancelled")
+        logging.warning(f"Workflow execution cancelled ({stop_reason or 'task cancelled'}) - Workflow ID: {workflow_id}, Execution ID: {execution_id}")
+        await transition_execution(execution_id, 'cancelled', log_lines=take_new_log_lines(), **fields)
+        if stop_reason is None:
+            # This task itself was cancelled (cancel endpoint or shutdown)
+            raise
     except Exception as e:
         # Mark as failed
         error_message = str(e)
         logging.error(f"Workflow execution failed - Workflow ID: {workflow_id}, Error: {error_message}")
-        await db.workflow_executions.update_one(
-            {"id": execution.id},
-            {"$set": {
-                "status": "failed",
-                "error": error_message,
-                "completed_at": datetime.now(timezone.utc).isoformat(),
-                "execution_log": execution_log
-            }}
+        await transition_execution(
+            execution_id, 'failed',
+            error=error_message,
+            completed_at=datetime.now(timezone.utc).isoformat(),
+            log_lines=take_new_log_lines()
         )
-        raise
 
 app.include_router(api_router)
 
@@ -6438,6 +10211,42 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+@app.on_event("startup")
+async def create_indexes():
+    try:
+        await db.uploaded_files.create_index([("user_id", 1), ("content_hash", 1)])
+        await db.file_analysis_cache.create_index("cache_key", unique=True)
+        await db.ai_learnings.create_index([("user_id", 1), ("status", 1)])
+        await db.workflow_executions.create_index("id")
+        await db.workflow_executions.create_index("blob_refs")
+        await db.workflow_executions.create_index([("status", 1), ("lease_expires_at", 1)])
+        await db.workflow_executions.create_index("owner")
+        await db.workflow_artifacts.create_index("hash", unique=True)
+        await db.workflow_artifacts.create_index([("refcount", 1), ("touched_at", 1)])
+        await db.node_result_cache.create_index([("user_id", 1), ("cache_key", 1)], unique=True)
+        await db.node_result_cache.create_index([("user_id", 1), ("last_hit_at", 1)])
+        await db.video_frames.create_index([("video", 1), ("key", 1)], unique=True)
+        await db.workflow_batches.create_index("id", unique=True)
+        await db.stream_tokens.create_index("token_hash", unique=True)
+        await db.stream_tokens.create_index("expires_at", expireAfterSeconds=0)
+        await db.workflow_batches.create_index([("user_id", 1), ("created_at", -1)])
+    except Exception as e:
+        logging.error(f"Index creation error: {str(e)}")
+
+@app.on_event("startup")
+async def recover_interrupted_executions():
+    # Executions run as in-process background tasks; only the ones whose owning
+    # process stopped renewing its lease were actually cut off
+    global _lease_task, _artifact_sweep_task
+    _lease_task = asyncio.create_task(maintain_worker_leases())
+    _artifact_sweep_task = asyncio.create_task(sweep_orphaned_artifacts_forever())
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
-    client.close()
\ No newline at end of file
+    for task in (_lease_task, _artifact_sweep_task):
+        if task is not None:
+            task.cancel()
+    client.close()
+    await provider_operations.close()
+    if _profile_pool is not None:
+        _profile_pool.shutdown(wait=False, cancel_futures=True)
\ No newline at end of file
@@ -22,6 +22,15 @@ import { Play, Save, Plus, Trash2, Workflow, Zap, Database, Globe, MessageSquare
 
 const BACKEND_URL = process.env.REACT_APP_BACKEND_URL || 'http://localhost:8001';
 
+// Node types whose outgoing edges can carry branch labels ('body' edges of a loop lead into its per-item body)
+const BRANCHING_NODE_TYPES = ['condition', 'switch', 'loop'];
+
+// Node types whose results can be reused through the node result cache
+const CACHEABLE_NODE_TYPES = [
+  'gemini', 'videogen', 'imagetovideo', 'imagegen', 'screenshot', 'stitch',
+  'texttospeech', 'audiooverlay', 'texttomusic', 'audiostitch',
+];
+
 // Helper component for nodes with handles
 const NodeWrapper = ({ children, color, hasInput = false, hasOutput = true, nodeType = 'default' }) => {
   const [showMenu, setShowMenu] = React.useState(false);
@@ -250,6 +259,10 @@ const ImageGenNode = ({ data }) => {
 };
 
 const ScreenshotNode = ({ data }) => {
+  const description = {
+    count: `Extract ${data.frameCount || 1} evenly spaced frames`,
+    timestamps: `Extract frames at ${data.timestamps || '...'}s`,
+  }[data.frameMode] || 'Extract last frame from video';
   return (
     <NodeWrapper color="#a855f7" hasInput={true} nodeType="screenshot">
       <div className="px-4 py-3 rounded-lg border-2 border-purple-500 bg-purple-500/10 backdrop-blur-sm min-w-[200px]">
@@ -258,7 +271,7 @@ const ScreenshotNode = ({ data }) => {
           <div className="font-semibold text-white">Screenshot</div>
         </div>
         <div className="text-xs text-gray-400 mt-1">
-          Extract last frame from video
+          {description}
         </div>
       </div>
     </NodeWrapper>
@@ -403,7 +416,7 @@ const LoopNode = ({ data }) => {
           <div className="font-semibold text-white">Loop</div>
         </div>
         <div className="text-xs text-gray-400 mt-1">
-          {data.loopType || 'Click to configure'}
+          {data.loopType ? `${data.loopType}${data.concurrency ? ` · ${data.concurrency} at a time` : ''}` : 'Click to configure'}
         </div>
       </div>
     </NodeWrapper>
@@ -541,18 +554,43 @@ export default function AutomationStudioPage() {
 
   const onConnect = useCallback(
     (params) =>
-      setEdges((eds) =>
-        addEdge(
+      setEdges((eds) => {
+        // Condition outputs are labelled so only the taken branch runs: first 'true', then 'false'
+        const sourceNode = nodes.find((node) => node.id === params.source);
+        let label;
+        if (sourceNode?.type === 'condition') {
+          label = eds.some((edge) => edge.source === params.source && edge.label === 'true') ? 'false' : 'true';
+        }
+        // A loop's first edge leads into its body; later edges run once the loop is done
+        if (sourceNode?.type === 'loop' && !eds.some((edge) => edge.source === params.source)) {
+          label = 'body';
+        }
+        return addEdge(
           {
             ...params,
+            ...(label && { label }),
             type: 'smoothstep',
             animated: true,
             markerEnd: { type: MarkerType.ArrowClosed },
           },
           eds
-        )
-      ),
-    [setEdges]
+        );
+      }),
+    [setEdges, nodes]
+  );
+
+  // Edit the branch label (true/false, a switch case or a loop's 'body') of an edge leaving a branching node
+  const onEdgeDoubleClick = useCallback(
+    (event, edge) => {
+      const sourceNode = nodes.find((node) => node.id === edge.source);
+      if (!BRANCHING_NODE_TYPES.includes(sourceNode?.type)) return;
+      const label = window.prompt('Branch label (true/false for conditions, a case value or "default" for switches, "body" for the per-item body of a loop). Leave empty to always follow this edge.', edge.label || '');
+      if (label === null) return;
+      setEdges((eds) =>
+        eds.map((e) => (e.id === edge.id ? { ...e, label: label.trim() || undefined } : e))
+      );
+    },
+    [setEdges, nodes]
   );
 
   const addNode = (type) => {
@@ -573,21 +611,28 @@ export default function AutomationStudioPage() {
         edges,
       };
 
+      let response;
       if (currentWorkflow?.id) {
-        await axios.put(`/workflows/${currentWorkflow.id}`, workflow);
+        response = await axios.put(`/workflows/${currentWorkflow.id}`, workflow);
         toast.success('Workflow updated successfully');
       } else {
-        const response = await axios.post('/workflows', workflow);
+        response = await axios.post('/workflows', workflow);
         setCurrentWorkflow(response.data);
         toast.success('Workflow saved successfully');
       }
+      showValidationWarnings(response.data);
       loadWorkflows();
     } catch (error) {
-      toast.error('Failed to save workflow');
+      toast.error(error.response?.data?.detail || 'Failed to save workflow');
       console.error(error);
     }
   };
 
+  // The server compiles workflows on save; problems that do not block running come back as warnings
+  const showValidationWarnings = (savedWorkflow) => {
+    (savedWorkflow?.validation_warnings || []).forEach((warning) => toast.warning(warning));
+  };
+
   const loadWorkflows = async () => {
     try {
       const response = await axios.get('/workflows');
@@ -623,67 +668,136 @@ export default function AutomationStudioPage() {
         });
         workflowToExecute = saveResponse.data;
         setCurrentWorkflow(workflowToExecute);
+        showValidationWarnings(workflowToExecute);
         await loadWorkflows();
       } catch (error) {
-        toast.error('Failed to save workflow');
+        toast.error(error.response?.data?.detail || 'Failed to save workflow');
         return;
       }
     } else {
       // Update existing workflow
       try {
-        await axios.put(`/workflows/${workflowToExecute.id}`, {
+        const updateResponse = await axios.put(`/workflows/${workflowToExecute.id}`, {
           name: workflowToExecute.name,
           nodes,
           edges,
         });
+        showValidationWarnings(updateResponse.data);
       } catch (error) {
-        toast.error('Failed to update workflow');
+        toast.error(error.response?.data?.detail || 'Failed to update workflow');
         return;
       }
     }
 
     setExecuting(true);
+    setExecutionId(null);
     setExecutionProgress(0);
     
     try {
       const response = await axios.post(`/workflows/${workflowToExecute.id}/execute`);
       setExecutionId(response.data.execution_id);
-      
-      // Poll for progress
-      const pollInterval = setInterval(async () => {
+      watchExecution(response.data.execution_id);
+    } catch (error) {
+      toast.error('Workflow execution failed');
+      console.error(error);
+      setExecuting(false);
+    }
+  };
+
+  const cancelExecution = async () => {
+    if (!executionId) return;
+    try {
+      await axios.post(`/workflows/executions/${executionId}/cancel`);
+      toast.info('Cancelling workflow execution...');
+    } catch (error) {
+      toast.error(error.response?.data?.detail || 'Failed to cancel execution');
+    }
+  };
+
+  // Follow execution progress over the server event stream, falling back to light polling
+  const watchExecution = (id) => {
+    let eventSource = null;
+    let pollInterval = null;
+    let finished = false;
+
+    const stopWatching = () => {
+      finished = true;
+      if (eventSource) eventSource.close();
+      if (pollInterval) clearInterval(pollInterval);
+      clearTimeout(timeout);
+    };
+
+    const handleStatus = (execution) => {
+      if (execution.progress !== undefined) {
+        setExecutionProgress(execution.progress || 0);
+      }
+      if (!['completed', 'failed', 'cancelled'].includes(execution.status)) {
+        return;
+      }
+      stopWatching();
+      setExecuting(false);
+
+      if (execution.status === 'completed') {
+        toast.success('Workflow executed successfully!');
+      } else if (execution.status === 'cancelled') {
+        toast.info('Workflow execution cancelled');
+      } else {
+        toast.error('Workflow execution failed');
+      }
+    };
+
+    const startPolling = () => {
+      if (pollInterval || finished) return;
+      pollInterval = setInterval(async () => {
         try {
-          const statusResponse = await axios.get(`/workflows/executions/${response.data.execution_id}`);
-          const execution = statusResponse.data;
-          
-          setExecutionProgress(execution.progress || 0);
-          
-          if (execution.status === 'completed' || execution.status === 'failed') {
-            clearInterval(pollInterval);
-            setExecuting(false);
-            
-            if (execution.status === 'completed') {
-              toast.success('Workflow executed successfully!');
-            } else {
-              toast.error('Workflow execution failed');
-            }
-          }
+          const statusResponse = await axios.get(`/workflows/executions/${id}`, {
+            params: { include_results: false },
+          });
+          handleStatus(statusResponse.data);
         } catch (err) {
-          clearInterval(pollInterval);
+          stopWatching();
           setExecuting(false);
         }
       }, 1000);
-      
-      // Timeout after 5 minutes
-      setTimeout(() => {
-        clearInterval(pollInterval);
-        setExecuting(false);
-      }, 300000);
-      
-    } catch (error) {
-      toast.error('Workflow execution failed');
-      console.error(error);
+    };
+
+    // Timeout after 5 minutes
+    const timeout = setTimeout(() => {
+      stopWatching();
       setExecuting(false);
+    }, 300000);
+
+    if (!window.EventSource) {
+      startPolling();
+      return;
     }
+
+    // EventSource cannot send the auth header, so the stream is opened with a single-use token
+    const openEventStream = async () => {
+      let streamToken;
+      try {
+        const tokenResponse = await axios.post(`/workflows/executions/${id}/stream-token`);
+        streamToken = tokenResponse.data.stream_token;
+      } catch (err) {
+        startPolling();
+        return;
+      }
+      if (finished) return;
+
+      eventSource = new EventSource(
+        `${axios.defaults.baseURL}/workflows/executions/${id}/events?stream_token=${encodeURIComponent(streamToken)}`
+      );
+      eventSource.addEventListener('snapshot', (event) => handleStatus(JSON.parse(event.data)));
+      eventSource.addEventListener('status', (event) => handleStatus(JSON.parse(event.data)));
+      eventSource.addEventListener('progress', (event) => {
+        setExecutionProgress(JSON.parse(event.data).progress || 0);
+      });
+      eventSource.onerror = () => {
+        eventSource.close();
+        startPolling();
+      };
+    };
+    openEventStream();
   };
 
   const deleteWorkflow = async (workflowId) => {
@@ -1045,6 +1159,16 @@ export default function AutomationStudioPage() {
               <span className="text-sm text-white">Executing workflow...</span>
               <span className="text-xs text-gray-400">{executionProgress}% complete</span>
             </div>
+            <Button
+              onClick={cancelExecution}
+              disabled={!executionId}
+              variant="outline"
+              size="sm"
+              className="border-gray-600 text-gray-300 hover:bg-gray-800"
+            >
+              <X className="w-4 h-4 mr-1" />
+              Cancel
+            </Button>
           </div>
           <div className="max-w-7xl mx-auto mt-2">
             <div className="h-1 bg-gray-800 rounded-full overflow-hidden">
@@ -1305,6 +1429,7 @@ export default function AutomationStudioPage() {
             onNodesChange={onNodesChange}
             onEdgesChange={onEdgesChange}
             onConnect={onConnect}
+            onEdgeDoubleClick={onEdgeDoubleClick}
             onNodeClick={onNodeClick}
             onNodeContextMenu={onNodeContextMenu}
             onPaneClick={() => {
@@ -2383,6 +2508,9 @@ export default function AutomationStudioPage() {
                       placeholder="Value to compare against"
                       className="bg-[#0f1218] border-gray-700 text-white mt-2"
                     />
+                    <p className="text-xs text-gray-500 mt-1">
+                      The first edge you connect is the true branch and the second the false branch; double-click an edge to change it
+                    </p>
                   </div>
                 </>
               )}
@@ -2409,7 +2537,7 @@ export default function AutomationStudioPage() {
                       rows={4}
                     />
                     <p className="text-xs text-gray-500 mt-1">
-                      Each case will create a connection point
+                      Double-click an outgoing edge to label it with a case value (or "default")
                     </p>
                   </div>
                 </>
@@ -2468,6 +2596,84 @@ export default function AutomationStudioPage() {
                       />
                     </div>
                   )}
+                  {nodeConfig.loopType !== 'while' && (
+                    <div>
+                      <Label className="text-white">Items at a Time</Label>
+                      <Input
+                        type="number"
+                        min="1"
+                        value={nodeConfig.concurrency || '4'}
+                        onChange={(e) => setNodeConfig({ ...nodeConfig, concurrency: e.target.value })}
+                        placeholder="4"
+                        className="bg-[#0f1218] border-gray-700 text-white mt-2"
+                      />
+                      <p className="text-xs text-gray-500 mt-1">
+                        The first edge you connect from the loop is its body and runs once per item; double-click an edge to label it "body"
+                      </p>
+                    </div>
+                  )}
+                </>
+              )}
+
+              {/* Screenshot Node Config */}
+              {selectedNode.type === 'screenshot' && (
+                <>
+                  <div>
+                    <Label className="text-white">Frames</Label>
+                    <Select
+                      value={nodeConfig.frameMode || 'last'}
+                      onValueChange={(value) => setNodeConfig({ ...nodeConfig, frameMode: value })}
+                    >
+                      <SelectTrigger className="bg-[#0f1218] border-gray-700 text-white mt-2">
+                        <SelectValue />
+                      </SelectTrigger>
+                      <SelectContent className="bg-[#1a1d2e] border-gray-700">
+                        <SelectItem value="last">Last frame</SelectItem>
+                        <SelectItem value="count">Evenly spaced frames</SelectItem>
+                        <SelectItem value="timestamps">At timestamps</SelectItem>
+                      </SelectContent>
+                    </Select>
+                  </div>
+                  {nodeConfig.frameMode === 'count' && (
+                    <div>
+                      <Label className="text-white">Number of Frames</Label>
+                      <Input
+                        type="number"
+                        min="1"
+                        max="16"
+                        value={nodeConfig.frameCount || '4'}
+                        onChange={(e) => setNodeConfig({ ...nodeConfig, frameCount: e.target.value })}
+                        className="bg-[#0f1218] border-gray-700 text-white mt-2"
+                      />
+                    </div>
+                  )}
+                  {nodeConfig.frameMode === 'timestamps' && (
+                    <div>
+                      <Label className="text-white">Timestamps (seconds)</Label>
+                      <Input
+                        value={nodeConfig.timestamps || ''}
+                        onChange={(e) => setNodeConfig({ ...nodeConfig, timestamps: e.target.value })}
+                        placeholder="e.g., 0.5, 2, 3.75"
+                        className="bg-[#0f1218] border-gray-700 text-white mt-2"
+                      />
+                    </div>
+                  )}
+                  <div>
+                    <Label className="text-white">Image Format</Label>
+                    <Select
+                      value={nodeConfig.format || 'png'}
+                      onValueChange={(value) => setNodeConfig({ ...nodeConfig, format: value })}
+                    >
+                      <SelectTrigger className="bg-[#0f1218] border-gray-700 text-white mt-2">
+                        <SelectValue />
+                      </SelectTrigger>
+                      <SelectContent className="bg-[#1a1d2e] border-gray-700">
+                        <SelectItem value="png">PNG (lossless)</SelectItem>
+                        <SelectItem value="webp">WebP (compact)</SelectItem>
+                        <SelectItem value="jpeg">JPEG (compact)</SelectItem>
+                      </SelectContent>
+                    </Select>
+                  </div>
                 </>
               )}
 
@@ -2502,6 +2708,29 @@ export default function AutomationStudioPage() {
                   </div>
                 </>
               )}
+
+              {/* Result cache policy for expensive nodes */}
+              {CACHEABLE_NODE_TYPES.includes(selectedNode.type) && (
+                <div>
+                  <Label className="text-white">Result Cache</Label>
+                  <Select
+                    value={nodeConfig.cachePolicy || 'never'}
+                    onValueChange={(value) => setNodeConfig({ ...nodeConfig, cachePolicy: value })}
+                  >
+                    <SelectTrigger className="bg-[#0f1218] border-gray-700 text-white mt-2">
+                      <SelectValue />
+                    </SelectTrigger>
+                    <SelectContent className="bg-[#1a1d2e] border-gray-700">
+                      <SelectItem value="never">Never (always run)</SelectItem>
+                      <SelectItem value="run">Within a run</SelectItem>
+                      <SelectItem value="global">Across runs</SelectItem>
+                    </SelectContent>
+                  </Select>
+                  <p className="text-xs text-gray-400 mt-1">
+                    Reuse this node's output when its settings and inputs are unchanged.
+                  </p>
+                </div>
+              )}
             </div>
 
             <div className="flex justify-end gap-3 mt-6">
@@ -1,7 +1,7 @@
 import React, { useState, useEffect } from 'react';
 import axios from 'axios';
 import { Button } from '@/components/ui/button';
-import { ListChecks, Play, CheckCircle, XCircle, Clock, Eye, ChevronDown, ChevronUp, Image as ImageIcon, Video as VideoIcon, Maximize2, Download, X } from 'lucide-react';
+import { ListChecks, Play, CheckCircle, XCircle, Clock, Eye, ChevronDown, ChevronUp, Image as ImageIcon, Video as VideoIcon, Maximize2, Download, X, RotateCcw } from 'lucide-react';
 
 export default function CompletionsPage() {
   const [executions, setExecutions] = useState([]);
@@ -71,6 +71,25 @@ export default function CompletionsPage() {
     }
   };
 
+  // Re-run a failed or cancelled execution, reusing the results of every node that already succeeded
+  const resumeExecution = async (executionId) => {
+    try {
+      await axios.post(`/workflows/executions/${executionId}/resume`, {});
+      await loadExecutions();
+    } catch (error) {
+      console.error('Failed to resume execution:', error);
+    }
+  };
+
+  // Node errors are caught per node, so a run can end 'completed' with some nodes failed
+  const canResume = (execution) => {
+    if (['failed', 'cancelled'].includes(execution.status)) return true;
+    if (execution.failed_nodes?.length) return true;
+    return Object.values(execution.results || {}).some(
+      (result) => result && ['error', 'partial'].includes(result.status)
+    );
+  };
+
   const getStatusIcon = (status) => {
     switch (status) {
       case 'completed':
@@ -166,6 +185,18 @@ export default function CompletionsPage() {
                         </div>
                       )}
 
+                      {canResume(execution) && (
+                        <Button
+                          variant="outline"
+                          size="sm"
+                          className="border-gray-700"
+                          onClick={() => resumeExecution(execution.id)}
+                        >
+                          <RotateCcw className="w-4 h-4 mr-1" />
+                          Resume
+                        </Button>
+                      )}
+
                       <Button
                         variant="ghost"
                         size="sm"
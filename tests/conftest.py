@@ -0,0 +1,10 @@
+import os
+import sys
+from pathlib import Path
+
+# server.py reads its Mongo settings at import time; the client only connects on first use,
+# so the pure functions under test never need a running database
+os.environ.setdefault('MONGO_URL', 'mongodb://localhost:27017')
+os.environ.setdefault('DB_NAME', 'automation_studio_test')
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'backend'))
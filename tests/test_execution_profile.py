@@ -0,0 +1,65 @@
+from datetime import datetime, timedelta, timezone
+
+from server import execution_profile
+
+T0 = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+
+def span(node_type, queued, started, ended, parents=(), provider_ms=0, media_ms=0):
+    return {
+        "node_type": node_type,
+        "queued_at": (T0 + timedelta(seconds=queued)).isoformat(),
+        "started_at": (T0 + timedelta(seconds=started)).isoformat(),
+        "ended_at": (T0 + timedelta(seconds=ended)).isoformat() if ended is not None else None,
+        "parents": list(parents),
+        "provider_ms": provider_ms,
+        "media_ms": media_ms,
+        "media_queue_ms": 0,
+        "retries": 0,
+    }
+
+
+def execution(spans):
+    return {"id": "exec", "status": "completed", "duration": 20000, "node_spans": spans}
+
+
+def test_critical_path_follows_the_parent_that_finished_last():
+    profile = execution_profile(execution({
+        "start": span("start", 0, 0, 1),
+        "fast": span("gemini", 1, 1, 3, parents=["start"]),
+        "slow": span("videogen", 1, 2, 12, parents=["start"], provider_ms=9000),
+        "stitch": span("stitch", 12, 13, 15, parents=["fast", "slow"], media_ms=1500),
+    }))
+
+    assert [node["node_id"] for node in profile["critical_path"]] == ["start", "slow", "stitch"]
+    # queue + run time of each node on the path
+    assert profile["critical_path_ms"] == 1000 + (1000 + 10000) + (1000 + 2000)
+
+
+def test_node_breakdown():
+    profile = execution_profile(execution({
+        "start": span("start", 0, 0, 1),
+        "slow": span("videogen", 1, 2, 12, parents=["start"], provider_ms=9000),
+    }))
+
+    slow = next(node for node in profile["nodes"] if node["node_id"] == "slow")
+    assert slow["queue_ms"] == 1000
+    assert slow["duration_ms"] == 10000
+    assert slow["other_ms"] == 1000
+    assert profile["by_type"]["videogen"] == {"nodes": 1, "duration_ms": 10000, "provider_ms": 9000, "media_ms": 0}
+
+
+def test_unfinished_nodes_are_left_out():
+    profile = execution_profile(execution({
+        "start": span("start", 0, 0, 1),
+        "running": span("videogen", 1, 2, None, parents=["start"]),
+    }))
+
+    assert [node["node_id"] for node in profile["nodes"]] == ["start"]
+    assert [node["node_id"] for node in profile["critical_path"]] == ["start"]
+
+
+def test_execution_without_spans():
+    profile = execution_profile(execution({}))
+    assert profile["critical_path"] == [] and profile["critical_path_ms"] == 0
+    assert profile["nodes"] == []
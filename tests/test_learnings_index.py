@@ -0,0 +1,82 @@
+from server import LearningsIndex, tokenize_for_search
+
+
+def learning(learning_id, insight, category="general", confidence=1.0):
+    return {"id": learning_id, "category": category, "insight": insight, "confidence_score": confidence}
+
+
+def build_index(*learnings):
+    index = LearningsIndex()
+    for item in learnings:
+        index.add(item)
+    return index
+
+
+def test_tokenizer_drops_stopwords_and_folds_plurals():
+    assert tokenize_for_search("The user prefers short videos and $5 prices") == [
+        "user", "prefer", "short", "video", "$5", "price"
+    ]
+    assert tokenize_for_search("class glass") == ["class", "glass"]
+    assert tokenize_for_search(None) == []
+
+
+def test_search_ranks_the_most_relevant_learning_first():
+    index = build_index(
+        learning("1", "User likes upbeat music in product videos"),
+        learning("2", "User writes emails in a formal tone"),
+        learning("3", "Keep videos under 30 seconds", category="video_preferences"),
+    )
+
+    results = index.search("make a short video with music", k=2)
+    assert [item["id"] for item in results] == ["1", "3"]
+
+
+def test_category_words_are_searchable():
+    index = build_index(learning("1", "Prefers dark colors", category="design_style"))
+    assert [item["id"] for item in index.search("what design should I use")] == ["1"]
+
+
+def test_search_without_matches_is_empty_and_top_falls_back_to_confidence():
+    index = build_index(
+        learning("low", "Likes cats", confidence=0.2),
+        learning("high", "Works in finance", confidence=0.9),
+        learning("mid", "Lives in Berlin", confidence=0.5),
+    )
+
+    assert index.search("quantum chromodynamics") == []
+    assert [item["id"] for item in index.top(2)] == ["high", "mid"]
+
+
+def test_confidence_breaks_ties():
+    index = build_index(
+        learning("unsure", "Prefers vertical video", confidence=0.1),
+        learning("sure", "Prefers vertical video", confidence=1.0),
+    )
+    assert [item["id"] for item in index.search("vertical video")] == ["sure", "unsure"]
+
+
+def test_remove_and_update_keep_the_index_consistent():
+    index = build_index(
+        learning("1", "Likes podcasts"),
+        learning("2", "Likes jazz"),
+    )
+
+    index.remove("1")
+    assert len(index) == 1
+    assert index.search("podcast") == []
+    assert "podcast" not in index.postings
+
+    index.add(learning("2", "Likes classical music"))
+    assert len(index) == 1
+    assert index.search("jazz") == []
+    assert [item["id"] for item in index.search("classical")] == ["2"]
+    assert index.total_length == sum(index.doc_lengths.values())
+
+    index.remove("missing")
+    assert len(index) == 1
+
+
+def test_empty_index():
+    index = LearningsIndex()
+    assert index.search("anything") == []
+    assert index.top() == []
@@ -0,0 +1,118 @@
+import asyncio
+
+import server
+from server import plan_media_chains, render_media_chain
+
+
+def make_plan(edges, nodes):
+    children = {node_id: [] for node_id in nodes}
+    parents = {node_id: [] for node_id in nodes}
+    for source, target in edges:
+        children[source].append(target)
+        parents[target].append(source)
+    return {"order": list(nodes), "children": children, "parents": parents, "loop_bodies": {}}
+
+
+def make_nodes(**types):
+    return {node_id: {"id": node_id, "type": node_type, "data": {}} for node_id, node_type in types.items()}
+
+
+def probe(duration, audio=True):
+    return {
+        "duration": duration,
+        "video": {"codec_name": "h264", "width": 1280, "height": 720, "pix_fmt": "yuv420p", "r_frame_rate": "30/1"},
+        "audio": {"codec_name": "aac"} if audio else None,
+    }
+
+
+# ---- plan_media_chains ----
+
+def test_stitch_overlay_audiostitch_is_one_chain():
+    nodes = make_nodes(start="start", stitch="stitch", overlay="audiooverlay", mix="audiostitch")
+    plan = make_plan([("start", "stitch"), ("stitch", "overlay"), ("overlay", "mix")], nodes)
+
+    chains = plan_media_chains(plan, nodes)
+    assert chains["stitch"] == ["stitch", "overlay", "mix"]
+    assert chains["overlay"] is chains["stitch"] and chains["mix"] is chains["stitch"]
+    assert "start" not in chains
+
+
+def test_branching_output_ends_the_chain():
+    nodes = make_nodes(stitch="stitch", overlay="audiooverlay", mix="audiostitch", shot="screenshot")
+    plan = make_plan([("stitch", "overlay"), ("overlay", "mix"), ("overlay", "shot")], nodes)
+
+    assert plan_media_chains(plan, nodes)["stitch"] == ["stitch", "overlay"]
+    assert "mix" not in plan_media_chains(plan, nodes)
+
+
+def test_lone_stitch_is_not_fused():
+    nodes = make_nodes(stitch="stitch", shot="screenshot")
+    plan = make_plan([("stitch", "shot")], nodes)
+    assert plan_media_chains(plan, nodes) == {}
+
+
+def test_cached_node_keeps_its_own_output():
+    nodes = make_nodes(stitch="stitch", overlay="audiooverlay", mix="audiostitch")
+    nodes["overlay"]["data"]["cachePolicy"] = "run"
+    plan = make_plan([("stitch", "overlay"), ("overlay", "mix")], nodes)
+    assert plan_media_chains(plan, nodes) == {}
+
+
+def test_chains_inside_loop_bodies_are_found():
+    nodes = make_nodes(loop="loop", stitch="stitch", mix="audiostitch")
+    body = make_plan([("stitch", "mix")], {"stitch": None, "mix": None})
+    plan = make_plan([], {"loop": None})
+    plan["loop_bodies"] = {"loop": body}
+    assert plan_media_chains(plan, nodes) == {"stitch": ["stitch", "mix"], "mix": ["stitch", "mix"]}
+
+
+# ---- render_media_chain ----
+
+def render(monkeypatch, tmp_path, stages, durations):
+    commands = []
+
+    async def fake_probe(path):
+        return probe(durations[path])
+
+    async def fake_run(args, **kwargs):
+        commands.append(args)
+
+    monkeypatch.setattr(server, "probe_media_streams", fake_probe)
+    monkeypatch.setattr(server.media_pool, "run", fake_run)
+    result = asyncio.run(render_media_chain(stages, str(tmp_path / "out.mp4"), tmp_path))
+    assert len(commands) == 1
+    return result, commands[0]
+
+
+def test_overlay_tail_is_cut_to_the_voiceover(monkeypatch, tmp_path):
+    stages = [
+        {"type": "stitch", "videos": ["a.mp4", "b.mp4"]},
+        {"type": "audiooverlay", "audio": {"artifact": "f" * 64, "kind": "audio", "duration": 3.0}},
+    ]
+    result, cmd = render(monkeypatch, tmp_path, stages, {"a.mp4": 4.0, "b.mp4": 4.0})
+
+    assert result == {"duration": 3.0, "stitch_mode": "stream_copy"}
+    assert cmd[cmd.index("-t") + 1] == "3.0"
+    assert "-shortest" in cmd and "-ar" not in cmd
+    assert cmd[cmd.index("-map", cmd.index("-map") + 1) + 1] == "3:a:0"
+
+
+def test_audiostitch_tail_ignores_the_overlay(monkeypatch, tmp_path):
+    stages = [
+        {"type": "stitch", "videos": ["a.mp4", "b.mp4"]},
+        {"type": "audiooverlay", "audio": {"artifact": "f" * 64, "kind": "audio", "duration": 3.0}},
+        {
+            "type": "audiostitch",
+            "tts": {"artifact": "1" * 64, "kind": "audio"},
+            "music": {"artifact": "2" * 64, "kind": "audio"},
+        },
+    ]
+    result, cmd = render(monkeypatch, tmp_path, stages, {"a.mp4": 4.0, "b.mp4": 4.0})
+
+    assert result["duration"] == 8.0
+    assert "-t" not in cmd
+    assert server.artifact_path(stages[1]["audio"]) not in cmd
+    graph = cmd[cmd.index("-filter_complex") + 1]
+    assert "[3:a]atrim=0:8.0,volume=1.0[tts]" in graph
+    assert "[4:a]atrim=0:8.0,volume=0.3[music]" in graph
+    assert "amix=inputs=2" in graph
@@ -0,0 +1,39 @@
+from server import stitch_audio_filters
+
+
+def probe(duration, audio=True):
+    return {
+        "duration": duration,
+        "video": {"codec_name": "h264", "width": 1280, "height": 720, "pix_fmt": "yuv420p", "r_frame_rate": "30/1"},
+        "audio": {"codec_name": "aac"} if audio else None,
+    }
+
+
+def test_audio_is_trimmed_to_each_clip_and_concatenated():
+    filters, label = stitch_audio_filters([probe(4.0), probe(6.0), probe(5.0)], first_input=1)
+
+    assert label == "[aout]"
+    assert filters[-1] == "[a0][a1][a2]concat=n=3:v=0:a=1[aout]"
+    assert not any("acrossfade" in chain for chain in filters)
+    assert filters[0].startswith("[1:a]") and filters[2].startswith("[3:a]")
+    for chain, duration in zip(filters, (4.0, 6.0, 5.0)):
+        assert f"apad,atrim=0:{duration}" in chain
+
+
+def test_fades_only_at_the_joins():
+    first, middle, last, _ = stitch_audio_filters([probe(4.0), probe(4.0), probe(4.0)], first_input=0)[0]
+
+    assert "afade=t=in" not in first and "afade=t=out:st=3.75:d=0.25" in first
+    assert "afade=t=in:st=0:d=0.25" in middle and "afade=t=out" in middle
+    assert "afade=t=in" in last and "afade=t=out" not in last
+
+
+def test_clip_without_audio_contributes_silence():
+    filters, _ = stitch_audio_filters([probe(4.0), probe(3.0, audio=False)], first_input=0)
+    assert filters[1].startswith("anullsrc=r=48000:cl=stereo:d=3.0,")
+
+
+def test_single_clip_needs_no_concat():
+    filters, label = stitch_audio_filters([probe(4.0)], first_input=0)
+    assert label == "[a0]" and len(filters) == 1
+    assert "afade" not in filters[0]
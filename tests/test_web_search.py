@@ -0,0 +1,135 @@
+import asyncio
+import logging
+
+import pytest
+
+import server
+from server import LocalSearchProvider, SearchProvider, SearchResultCache, normalize_search_query, web_search_many
+
+CORPUS = [
+    {"title": "Marketing on a budget", "url": "https://a.example", "snippet": "Cheap marketing tactics for small shops"},
+    {"title": "Pricing guide", "url": "https://b.example", "snippet": "How to price handmade products"},
+    {"title": "Budget marketing checklist", "url": "https://c.example", "snippet": "Marketing steps that cost nothing"},
+]
+
+
+class FakeClock:
+    """Stands in for the time module inside server so cache expiry can be stepped"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+class GatedProvider(LocalSearchProvider):
+    """Local provider whose searches wait until the test opens the gate"""
+
+    def __init__(self, corpus=None):
+        super().__init__(corpus)
+        self.gate = asyncio.Event()
+
+    async def search(self, query, max_results=server.SEARCH_RESULTS_PER_QUERY):
+        await self.gate.wait()
+        return await super().search(query, max_results)
+
+
+def test_provider_interface_is_abstract():
+    with pytest.raises(TypeError):
+        SearchProvider()
+
+
+def test_local_provider_ranks_by_token_overlap():
+    provider = LocalSearchProvider(CORPUS)
+    results = asyncio.run(provider.search("budget marketing", max_results=2))
+    assert [item["url"] for item in results] == ["https://a.example", "https://c.example"]
+    assert asyncio.run(provider.search("quantum physics")) == []
+
+
+def test_query_normalization_ignores_case_order_and_stopwords():
+    assert normalize_search_query("The Marketing of budgets!") == normalize_search_query("budget marketing")
+
+
+def test_cached_results_expire_after_the_ttl(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(server, "time", clock)
+    cache = SearchResultCache(ttl_seconds=60)
+    provider = LocalSearchProvider(CORPUS)
+
+    async def scenario():
+        await cache.fetch(provider, "budget marketing")
+        clock.now += 59
+        await cache.fetch(provider, "marketing BUDGET")
+        clock.now += 2
+        await cache.fetch(provider, "budget marketing")
+
+    asyncio.run(scenario())
+    assert provider.calls == 2
+    assert (cache.hits, cache.misses) == (1, 2)
+
+
+def test_oldest_entries_are_evicted_beyond_max_entries():
+    cache = SearchResultCache(max_entries=2)
+    for key in ("a", "b", "c"):
+        cache.put(key, [{"title": key}])
+    assert cache.get("a") is None
+    assert cache.get("c") == [{"title": "c"}]
+
+
+def test_concurrent_fetches_of_one_query_share_a_single_search():
+    cache = SearchResultCache()
+    provider = GatedProvider(CORPUS)
+
+    async def scenario():
+        callers = [asyncio.create_task(cache.fetch(provider, query)) for query in ("budget marketing", "Marketing budget")]
+        await asyncio.sleep(0)
+        provider.gate.set()
+        return await asyncio.gather(*callers)
+
+    first, second = asyncio.run(scenario())
+    assert provider.calls == 1
+    assert first == second and first
+    assert not cache.in_flight
+
+
+def test_empty_results_are_not_cached():
+    cache = SearchResultCache()
+    provider = LocalSearchProvider()
+
+    async def scenario():
+        await cache.fetch(provider, "budget marketing")
+        await cache.fetch(provider, "budget marketing")
+
+    asyncio.run(scenario())
+    assert provider.calls == 2
+    assert not cache.entries
+
+
+def test_searches_missing_the_deadline_are_dropped(monkeypatch):
+    class SlowForPricing(LocalSearchProvider):
+        """Pricing searches never come back"""
+
+        async def search(self, query, max_results=server.SEARCH_RESULTS_PER_QUERY):
+            if "pricing" in query:
+                await asyncio.Event().wait()
+            return await super().search(query, max_results)
+
+    monkeypatch.setattr(server, "_search_provider", SlowForPricing(CORPUS))
+    monkeypatch.setattr(server, "search_cache", SearchResultCache())
+
+    results = asyncio.run(web_search_many(["budget marketing", "pricing guide"], deadline=0.05))
+    assert list(results) == ["budget marketing"]
+    assert results["budget marketing"][0]["url"] == "https://a.example"
+
+
+def test_missing_api_key_falls_back_to_local_with_a_warning(monkeypatch, caplog):
+    monkeypatch.setattr(server, "_search_provider", None)
+    monkeypatch.setattr(server, "SEARCH_PROVIDER", "")
+    monkeypatch.delenv("SERPER_API_KEY", raising=False)
+    monkeypatch.delenv("TAVILY_API_KEY", raising=False)
+
+    with caplog.at_level(logging.WARNING):
+        provider = server.get_search_provider()
+    assert isinstance(provider, LocalSearchProvider)
+    assert any("without web results" in record.getMessage() for record in caplog.records)
@@ -0,0 +1,135 @@
+import pytest
+from fastapi import HTTPException
+
+from server import (
+    WORKFLOW_PLAN_VERSION,
+    WorkflowValidationError,
+    compile_workflow,
+    compiled_workflow_fields,
+    workflow_source_hash,
+)
+
+
+def make_workflow(nodes, edges):
+    return {
+        "id": "wf",
+        "nodes": [{"id": node_id, "type": node_type, "data": data} for node_id, node_type, data in nodes],
+        "edges": [
+            {"id": f"e{index}", "source": source, "target": target, **({"label": label} if label else {})}
+            for index, (source, target, label) in enumerate(edges)
+        ],
+    }
+
+
+def video_workflow(**overrides):
+    nodes = {
+        "start": ("start", {}),
+        "v1": ("videogen", {"duration": 4}),
+        "v2": ("videogen", {"duration": 4}),
+        "stitch": ("stitch", {}),
+    }
+    nodes.update(overrides)
+    return make_workflow(
+        [(node_id, node_type, data) for node_id, (node_type, data) in nodes.items()],
+        [("start", "v1", None), ("start", "v2", None), ("v1", "stitch", None), ("v2", "stitch", None)],
+    )
+
+
+def test_valid_workflow_compiles_to_a_versioned_plan():
+    workflow = video_workflow()
+    compiled = compile_workflow(workflow)
+
+    plan = compiled["execution_plan"]
+    assert plan["version"] == WORKFLOW_PLAN_VERSION
+    assert plan["source"] == workflow_source_hash(workflow)
+    order = plan["plan"]["order"]
+    assert order[0] == "start" and order[-1] == "stitch"
+    assert set(order) == {"start", "v1", "v2", "stitch"}
+    assert compiled["validation_warnings"] == []
+
+
+def test_source_hash_ignores_node_positions():
+    workflow = video_workflow()
+    moved = video_workflow()
+    for node in moved["nodes"]:
+        node["position"] = {"x": 100, "y": 200}
+    assert workflow_source_hash(workflow) == workflow_source_hash(moved)
+
+    edited = video_workflow(v1=("videogen", {"duration": 8}))
+    assert workflow_source_hash(edited) != workflow_source_hash(workflow)
+
+
+def test_missing_start_node_is_an_error():
+    workflow = make_workflow([("a", "gemini", {})], [])
+    with pytest.raises(WorkflowValidationError) as error:
+        compile_workflow(workflow)
+    assert any("start node" in message for message in error.value.errors)
+
+
+def test_cycle_is_an_error():
+    workflow = make_workflow(
+        [("start", "start", {}), ("a", "gemini", {}), ("b", "gemini", {})],
+        [("start", "a", None), ("a", "b", None), ("b", "a", None)],
+    )
+    with pytest.raises(WorkflowValidationError):
+        compile_workflow(workflow)
+
+
+def test_every_config_and_input_error_is_reported():
+    workflow = make_workflow(
+        [
+            ("start", "start", {}),
+            ("fetch", "http", {"url": "", "method": "DELETE"}),
+            ("wait", "delay", {"duration": "soon", "unit": "days"}),
+            ("stitch", "stitch", {}),
+        ],
+        [("start", "fetch", None), ("fetch", "wait", None), ("wait", "stitch", None)],
+    )
+    with pytest.raises(WorkflowValidationError) as error:
+        compile_workflow(workflow)
+
+    errors = error.value.errors
+    assert any("fetch" in message and "URL is required" in message for message in errors)
+    assert any("fetch" in message and "DELETE" in message for message in errors)
+    assert any("wait" in message and "duration must be" in message for message in errors)
+    assert any("wait" in message and "unknown unit days" in message for message in errors)
+    assert any("stitch" in message and "at least 2 video nodes" in message for message in errors)
+
+
+def test_node_timeout_must_be_positive():
+    workflow = video_workflow(v1=("videogen", {"duration": 4, "timeoutSeconds": 0}))
+    with pytest.raises(WorkflowValidationError) as error:
+        compile_workflow(workflow)
+    assert any("timeoutSeconds must be at least" in message for message in error.value.errors)
+
+
+def test_unknown_node_type_is_an_error():
+    workflow = make_workflow([("start", "start", {}), ("x", "teleport", {})], [("start", "x", None)])
+    with pytest.raises(WorkflowValidationError) as error:
+        compile_workflow(workflow)
+    assert error.value.errors == ["Node x: unknown node type teleport"]
+
+
+def test_design_only_and_unconnected_nodes_are_warnings():
+    workflow = make_workflow(
+        [("start", "start", {}), ("agent", "elevenlabsconversational", {}), ("stray", "gemini", {})],
+        [("start", "agent", None)],
+    )
+    warnings = compile_workflow(workflow)["validation_warnings"]
+    assert any("agent" in warning and "cannot run" in warning for warning in warnings)
+    assert any("never run: stray" in warning for warning in warnings)
+
+
+def test_edges_to_missing_nodes_are_ignored_with_a_warning():
+    workflow = video_workflow()
+    workflow["edges"].append({"id": "dangling", "source": "stitch", "target": "gone"})
+    warnings = compile_workflow(workflow)["validation_warnings"]
+    assert any("dangling" in warning and "gone" in warning for warning in warnings)
+
+
+def test_api_wrapper_turns_errors_into_a_400():
+    workflow = make_workflow([("a", "gemini", {})], [])
+    with pytest.raises(HTTPException) as error:
+        compiled_workflow_fields(workflow)
+    assert error.value.status_code == 400
+    assert error.value.detail.startswith("Workflow is invalid:")
@@ -0,0 +1,113 @@
+import pytest
+
+from server import collect_result_blob_refs, is_successful_result, resume_seed_results
+
+
+@pytest.mark.parametrize("status", ["error", "failed", "skipped", "partial", "cancelled"])
+def test_unsuccessful_statuses_are_not_reused(status):
+    assert not is_successful_result({"status": status})
+
+
+@pytest.mark.parametrize("result", [{"status": "success"}, {"output": "text"}])
+def test_other_results_are_reused(result):
+    assert is_successful_result(result)
+
+
+@pytest.mark.parametrize("result", [None, "text", ["a"]])
+def test_non_dict_results_are_not_reused(result):
+    assert not is_successful_result(result)
+
+
+# start -> a -> b -> c
+#       -> d
+PLAN = {
+    "order": ["start", "a", "d", "b", "c"],
+    "children": {"start": ["a", "d"], "a": ["b"], "b": ["c"], "c": [], "d": []},
+    "parents": {"start": [], "a": ["start"], "b": ["a"], "c": ["b"], "d": ["start"]},
+    "loop_bodies": {},
+}
+FINGERPRINTS = {node_id: f"fp-{node_id}" for node_id in PLAN["order"]}
+
+
+def previous_execution(results, failed_nodes=()):
+    return {
+        "results": results,
+        "failed_nodes": list(failed_nodes),
+        "node_fingerprints": dict(FINGERPRINTS),
+    }
+
+
+def ok(node_id):
+    return {"status": "success", "output": node_id}
+
+
+def test_errored_node_and_its_descendants_are_rerun():
+    previous = previous_execution({
+        "start": ok("start"), "a": ok("a"), "d": ok("d"),
+        "b": {"status": "error", "error": "Provider unavailable"},
+    })
+    seed_results, rerun = resume_seed_results(PLAN, previous, FINGERPRINTS)
+
+    assert rerun == {"b", "c"}
+    assert set(seed_results) == {"start", "a", "d"}
+    assert seed_results["a"] == ok("a")
+
+
+def test_cancelled_node_and_its_descendants_are_rerun():
+    previous = previous_execution({
+        "start": ok("start"), "a": ok("a"), "d": ok("d"),
+        "b": {"status": "cancelled", "error": "Execution cancelled"},
+    })
+    seed_results, rerun = resume_seed_results(PLAN, previous, FINGERPRINTS)
+
+    assert rerun == {"b", "c"}
+    assert set(seed_results) == {"start", "a", "d"}
+    assert seed_results["a"] == ok("a")
+
+
+def test_failed_nodes_are_rerun_even_with_a_stored_result():
+    previous = previous_execution(
+        {node_id: ok(node_id) for node_id in PLAN["order"]},
+        failed_nodes=["a"],
+    )
+    _, rerun = resume_seed_results(PLAN, previous, FINGERPRINTS)
+    assert rerun == {"a", "b", "c"}
+
+
+def test_edited_node_is_rerun():
+    previous = previous_execution({node_id: ok(node_id) for node_id in PLAN["order"]})
+    _, rerun = resume_seed_results(PLAN, previous, {**FINGERPRINTS, "d": "fp-d-edited"})
+    assert rerun == {"d"}
+
+
+def test_skipped_nodes_stay_skipped():
+    previous = previous_execution({
+        "start": ok("start"), "a": ok("a"), "b": ok("b"), "c": ok("c"),
+        "d": {"status": "skipped"},
+    })
+    seed_results, rerun = resume_seed_results(PLAN, previous, FINGERPRINTS)
+    assert rerun == set()
+    assert seed_results["d"] == {"status": "skipped"}
+
+
+def test_from_node_reruns_it_and_everything_downstream():
+    previous = previous_execution({node_id: ok(node_id) for node_id in PLAN["order"]})
+    seed_results, rerun = resume_seed_results(PLAN, previous, FINGERPRINTS, from_node_id="a")
+    assert rerun == {"a", "b", "c"}
+    assert set(seed_results) == {"start", "d"}
+
+
+def test_nodes_that_never_ran_are_rerun():
+    previous = previous_execution({"start": ok("start"), "a": ok("a")})
+    _, rerun = resume_seed_results(PLAN, previous, FINGERPRINTS)
+    assert rerun == {"b", "c", "d"}
+
+
+def test_blob_refs_are_collected_from_nested_results():
+    result = {
+        "image_ref": {"blob": "h1", "mime": "image/png"},
+        "items": [{"audio_ref": {"blob": "h2"}}, {"text": "no media"}],
+        "video_artifact": {"artifact": "h3", "kind": "video"},
+        "metadata": {"blob": "h4"},
+    }
+    assert collect_result_blob_refs(result, set()) == {"h1", "h2"}